@@ -0,0 +1,330 @@
+import re, ssl, time, asyncio
+from contextlib import asynccontextmanager, nullcontext
+import aiosmtplib
+from metrics import MAIL_BYTES, phase
+
+_literal = re.compile(rb"\{(\d+)\}\r\n$")
+_untagged = re.compile(rb"\* (?:(?P<num>\d+) )?(?P<type>[A-Za-z-]+)(?: (?P<rest>.*))?$", re.S)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class IMAPError(Exception):
+    pass
+
+
+def _quote(s):
+    return '"' + s.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+class AsyncIMAP:
+    """Minimal asyncio IMAP4rev1 client for the ASGI app.
+
+    Only what the API needs (LOGIN, SELECT, UID SEARCH/FETCH/STORE, NOOP,
+    LOGOUT), and results come back shaped like imaplib's `(typ, data)`, so
+    imap_fetch's parsers work unchanged. One command at a time per session.
+    """
+
+    def __init__(self, host, port=993, use_ssl=True, ssl_context=None, timeout=30.0):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        self.timeout = timeout
+        self.capabilities = ()
+        self._reader = self._writer = None
+        self._tag = 0
+        self._lock = asyncio.Lock()
+
+    async def connect(self):
+        with phase("imap", "connect"):
+            # SEARCH results for a large mailbox arrive as one long line
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port, limit=16 * 1024 * 1024), self.timeout)
+        if self.use_ssl:
+            with phase("imap", "tls"):
+                await asyncio.wait_for(
+                    self._writer.start_tls(self.ssl_context, server_hostname=self.host), self.timeout)
+        greeting = await self._readline()
+        if not greeting.startswith((b"* OK", b"* PREAUTH")):
+            raise IMAPError(f"unexpected greeting: {greeting[:100]!r}")
+        typ, data = await self._command("CAPABILITY")
+        self.capabilities = tuple((data.get("CAPABILITY") or [b""])[0].decode().upper().split())
+        return self
+
+    async def _readline(self):
+        line = await asyncio.wait_for(self._reader.readline(), self.timeout)
+        if not line:
+            raise ConnectionError("IMAP connection closed")
+        return line
+
+    async def _response(self):
+        # one response line, with any {n} literals pulled in the way imaplib returns them
+        line = await self._readline()
+        parts = []
+        while True:
+            m = _literal.search(line)
+            if not m:
+                break
+            literal = await asyncio.wait_for(self._reader.readexactly(int(m.group(1))), self.timeout)
+            parts.append((line[:-2], literal))
+            line = await self._readline()
+        if parts:
+            return parts + [line.rstrip(b"\r\n")]
+        return line.rstrip(b"\r\n")
+
+    async def _command(self, name, *args):
+        async with self._lock:
+            self._tag += 1
+            tag = f"A{self._tag:04d}".encode()
+            line = b" ".join([tag, name.encode()] + [a if isinstance(a, bytes) else str(a).encode() for a in args])
+            self._writer.write(line + b"\r\n")
+            await self._writer.drain()
+
+            untagged = {}
+            while True:
+                resp = await self._response()
+                first = resp[0][0] if isinstance(resp, list) else resp
+                if first.startswith(tag + b" "):
+                    typ = first[len(tag) + 1:].split(b" ", 1)[0].decode().upper()
+                    return typ, untagged
+                m = _untagged.match(first)
+                if not m:
+                    continue  # continuation request or noise
+                kind = m.group("type").upper().decode()
+                # imaplib drops "* " and the response name: "* 3 FETCH (...)" -> "3 (...)"
+                head = b" ".join(filter(None, (m.group("num"), m.group("rest"))))
+                if isinstance(resp, list):
+                    resp[0] = (head, resp[0][1])
+                    untagged.setdefault(kind, []).extend(resp)
+                else:
+                    untagged.setdefault(kind, []).append(head)
+
+    async def login(self, user, password):
+        with phase("imap", "auth"):
+            typ, data = await self._command("LOGIN", _quote(user), _quote(password))
+        if typ != "OK":
+            raise IMAPError("IMAP login failed")
+        return typ, data
+
+    async def select(self, mailbox="INBOX"):
+        typ, data = await self._command("SELECT", _quote(mailbox))
+        return typ, data.get("EXISTS") or [b"0"]
+
+    async def uid(self, command, *args):
+        command = command.upper()
+        with phase("imap", "search") if command == "SEARCH" else nullcontext():
+            typ, data = await self._command("UID", command, *args)
+        key = "FETCH" if command in ("FETCH", "STORE") else command
+        out = data.get(key)
+        if command == "SEARCH" and not out:
+            out = [b""]
+        return typ, out or [None]
+
+    async def noop(self):
+        typ, _ = await self._command("NOOP")
+        return typ
+
+    async def logout(self):
+        try:
+            await asyncio.wait_for(self._command("LOGOUT"), 5)
+        except Exception:
+            pass
+        self.close()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class _AsyncPool:
+    """LIFO pool of logged-in sessions for one event loop; subclasses say how to open, probe and close one."""
+
+    broken = (ConnectionError, OSError, asyncio.TimeoutError)
+
+    def __init__(self, size=10, idle_timeout=60.0, health_check_after=10.0, acquire_timeout=30.0):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.acquire_timeout = acquire_timeout
+        self._slots = asyncio.Semaphore(size)
+        self._idle = []  # [(session, last_used)], most recently used last
+        self._in_use = 0
+
+    async def _prune(self, now):
+        expired = [s for s, used in self._idle if now - used > self.idle_timeout]
+        self._idle = [(s, used) for s, used in self._idle if now - used <= self.idle_timeout]
+        for s in expired:
+            await self._close(s)
+
+    async def _checkout(self):
+        now = time.monotonic()
+        await self._prune(now)
+        while self._idle:
+            s, used = self._idle.pop()
+            if now - used <= self.health_check_after or await self._alive(s):
+                return s
+            await self._close(s)
+        return await self._connect()
+
+    @asynccontextmanager
+    async def session(self):
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            raise PoolTimeout(f"no {self.protocol} session available after {self.acquire_timeout}s") from None
+        self._in_use += 1
+        s = None
+        try:
+            s = await self._checkout()
+            yield s
+        except self.broken + (asyncio.CancelledError,):
+            # the session is unusable (or mid-command); drop it instead of returning it to the pool
+            if s is not None:
+                self._discard(s)
+            s = None
+            raise
+        finally:
+            if s is not None:
+                self._idle.append((s, time.monotonic()))
+            self._in_use -= 1
+            self._slots.release()
+
+    def _discard(self, s):
+        s.close()
+
+    def stats(self):
+        return {"size": self.size, "in_use": self._in_use, "idle": len(self._idle)}
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for s, _ in idle:
+            await self._close(s)
+
+
+class AsyncIMAPPool(_AsyncPool):
+    """Logged-in AsyncIMAP sessions; callers SELECT what they need on each checkout.
+
+    With a `limiter` (a mailboxes.HostLimiter) every open session, idle ones
+    included, holds one of the host's slots until it is closed.
+    """
+
+    protocol = "IMAP"
+    broken = _AsyncPool.broken + (IMAPError,)
+
+    def __init__(self, host, port=993, user=None, password=None, use_ssl=True, timeout=30.0, limiter=None, **kw):
+        super().__init__(**kw)
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self.limiter = limiter
+
+    async def _connect(self):
+        if self.limiter:
+            # the limiter is shared with the sync threads, so wait for it off the event loop
+            try:
+                await asyncio.to_thread(self.limiter.acquire, self.host, self.acquire_timeout)
+            except Exception as e:
+                raise PoolTimeout(str(e)) from None
+        M = AsyncIMAP(self.host, self.port, use_ssl=self.use_ssl, timeout=self.timeout)
+        try:
+            await M.connect()
+            await M.login(self.user, self.password)
+        except BaseException:
+            self._discard(M)
+            raise
+        return M
+
+    async def _alive(self, M):
+        try:
+            return await M.noop() == "OK"
+        except self.broken:
+            return False
+
+    def _discard(self, M):
+        M.close()
+        if self.limiter:
+            self.limiter.release(self.host)
+
+    async def _close(self, M):
+        await M.logout()
+        if self.limiter:
+            self.limiter.release(self.host)
+
+
+class CountingSMTP(aiosmtplib.SMTP):
+    # send_message() serializes once and hands the bytes to sendmail(), so this counts both paths
+    async def sendmail(self, sender, recipients, message, *args, **kw):
+        result = await super().sendmail(sender, recipients, message, *args, **kw)
+        MAIL_BYTES.inc(len(message), protocol="smtp", direction="out")
+        return result
+
+
+class AsyncSMTPPool(_AsyncPool):
+    """aiosmtplib counterpart of smtp_pool.SMTPPool: reused sessions, no thread per send."""
+
+    protocol = "SMTP"
+    broken = _AsyncPool.broken + (aiosmtplib.SMTPServerDisconnected,)
+
+    def __init__(self, host, port, user=None, password=None, starttls=True, timeout=30.0, **kw):
+        super().__init__(**kw)
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self._ctx = ssl.create_default_context()
+
+    async def _connect(self):
+        s = CountingSMTP(hostname=self.host, port=self.port, timeout=self.timeout, start_tls=False)
+        with phase("smtp", "connect"):
+            await s.connect()
+        try:
+            if self.starttls:
+                with phase("smtp", "tls"):
+                    await s.starttls(tls_context=self._ctx)
+            if self.user and self.password:
+                with phase("smtp", "auth"):
+                    await s.login(self.user, self.password)
+        except BaseException:
+            s.close()
+            raise
+        return s
+
+    async def _alive(self, s):
+        try:
+            return (await s.noop()).code == 250
+        except (aiosmtplib.SMTPException, *self.broken):
+            return False
+
+    async def _close(self, s):
+        try:
+            await s.quit()
+        except (aiosmtplib.SMTPException, *self.broken):
+            s.close()
+
+    async def _run(self, fn, retries):
+        # reconnect and retry if the server dropped a pooled session under us
+        for attempt in range(retries + 1):
+            try:
+                async with self.session() as s:
+                    with phase("smtp", "send"):
+                        return await fn(s)
+            except (aiosmtplib.SMTPServerDisconnected, ConnectionError):
+                if attempt == retries:
+                    raise
+
+    async def send_message(self, msg, retries=1):
+        """Send `msg` on a pooled session."""
+        return await self._run(lambda s: s.send_message(msg), retries)
+
+    async def sendmail(self, from_addr, to_addrs, raw, retries=1):
+        """Send an already-serialized message on a pooled session."""
+        return await self._run(lambda s: s.sendmail(from_addr, to_addrs, raw), retries)
@@ -1,10 +1,26 @@
-import os, ssl, smtplib, imaplib, email
+import os, json, time, queue, threading
 from email.message import EmailMessage
-from email.header import decode_header
 from email.utils import make_msgid, formatdate
-from flask import Flask, request, jsonify
+from string import Template
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
+from smtp_pool import SMTPPool
+from imap_fetch import fetch_summaries, fetch_full, store_flags
+from mail_store import MailStore, StaleCursor
+from mailboxes import (DEFAULT_STORE, Mailbox, MailboxRegistry, HostLimiter, SyncScheduler, UnknownMailbox,
+                       imap_connect as mailbox_connect)
+from imap_idle import EventBroker, IdleListener
+from outbox import Outbox, OutboxSender
+from dashboard import DashboardStore, inbox_item, parse_version
+from quotes import QuoteExtractor, message_key
+from metrics import REGISTRY, CONTENT_TYPE, HTTP_REQUESTS, SlowRequestProfiler, phase, bedrock_listener, search_listener
+from search.agent import BedrockAgent, add_listener as add_bedrock_listener
+from search.search import add_listener as add_search_listener
+from search.catalog import UNITS, load_catalog
+from search.ranking import rank_offers
 
 load_dotenv()
 app = Flask(__name__)
@@ -16,17 +32,89 @@ IMAP_HOST = os.getenv("IMAP_HOST")
 IMAP_PORT = int(os.getenv("IMAP_PORT", "993"))
 EMAIL_USER = os.getenv("EMAIL_USER")
 EMAIL_PASS = os.getenv("EMAIL_PASS")
+IMAP_SNIPPET_BYTES = int(os.getenv("IMAP_SNIPPET_BYTES", "2048"))
+MAIL_STORE_PATH = os.getenv("MAIL_STORE_PATH", "mail_store.db")
+MAIL_SYNC_INTERVAL = float(os.getenv("MAIL_SYNC_INTERVAL", "30"))
+# per-store mailboxes beyond the EMAIL_USER one; see mailboxes.MailboxRegistry for the format
+MAILBOXES_FILE = os.getenv("MAILBOXES_FILE", "mailboxes.json")
+MAIL_SYNC_WORKERS = int(os.getenv("MAIL_SYNC_WORKERS", "4"))
+# >1 shards the mailboxes across that many sync child processes
+MAIL_SYNC_PROCESSES = int(os.getenv("MAIL_SYNC_PROCESSES", "0"))
+# concurrent sessions per IMAP server, across sync workers (and their child processes) and live requests.
+# The cap is per server process: with N gunicorn workers a host can see up to N times this.
+IMAP_HOST_CONNECTIONS = int(os.getenv("IMAP_HOST_CONNECTIONS", "4"))
+IMAP_IDLE = os.getenv("IMAP_IDLE", "true").lower() == "true"
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", "outbox.db")
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+DASHBOARD_PATH = os.getenv("DASHBOARD_PATH", "dashboard.db")
+DASHBOARD_INBOX_LIMIT = int(os.getenv("DASHBOARD_INBOX_LIMIT", "50"))
+QUOTES_PATH = os.getenv("QUOTES_PATH", "quotes.db")
+BEDROCK_MODEL_ID = os.getenv("BEDROCK_MODEL_ID", "anthropic.claude-3-sonnet-20240229-v1:0")
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "4"))
+SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT", "60"))
+SMTP_BATCH_WORKERS = int(os.getenv("SMTP_BATCH_WORKERS", str(SMTP_POOL_SIZE)))
+# seconds; unset leaves the sampling profiler off
+PROFILE_SLOW_REQUESTS = float(os.getenv("PROFILE_SLOW_REQUESTS", "0"))
+# make_msgid() resolves the FQDN on every call unless given a domain
+MSGID_DOMAIN = EMAIL_USER.rpartition("@")[2] if EMAIL_USER else None
 
+smtp_pool = SMTPPool(SMTP_HOST, SMTP_PORT, EMAIL_USER, EMAIL_PASS,
+                     size=SMTP_POOL_SIZE, idle_timeout=SMTP_IDLE_TIMEOUT)
+# bounded fan-out for /email/send/batch; the pool caps live SMTP sessions anyway
+batch_executor = ThreadPoolExecutor(max_workers=SMTP_BATCH_WORKERS, thread_name_prefix="smtp-batch")
+# /email/send only enqueues; outbox_sender delivers in the background
+outbox = Outbox(OUTBOX_PATH)
+outbox_sender = OutboxSender(outbox, smtp_pool, workers=SMTP_POOL_SIZE, max_attempts=OUTBOX_MAX_ATTEMPTS)
 
-def _dec(h):
-    if not h: return ""
-    parts = decode_header(h)
-    out = []
-    for text, enc in parts:
-        out.append(text.decode(enc or "utf-8", "replace") if isinstance(text, bytes) else text)
-    return "".join(out)
+MESSAGE_FIELDS = ("uid", "from", "subject", "date", "snippet", "message_id", "in_reply_to")
 
-def smtp_send(to, subject, text=None, html=None, in_reply_to=None):
+
+default_mailbox = Mailbox(DEFAULT_STORE, IMAP_HOST, EMAIL_USER, EMAIL_PASS, port=IMAP_PORT)
+mailboxes = MailboxRegistry.load(MAILBOXES_FILE, default=default_mailbox if IMAP_HOST else None)
+imap_limiter = HostLimiter(IMAP_HOST_CONNECTIONS)
+
+def imap_connect():
+    return mailbox_connect(default_mailbox)
+
+# /email/messages is served from this local copy; only mail_syncer talks to IMAP
+mail_store = MailStore(MAIL_STORE_PATH, connect=partial(mailbox_connect, default_mailbox),
+                       snippet_bytes=IMAP_SNIPPET_BYTES)
+# the other stores share the same file, keyed by store id
+mail_stores = {DEFAULT_STORE: mail_store}
+for mb in mailboxes:
+    if mb.store != DEFAULT_STORE:
+        mail_stores[mb.store] = MailStore(MAIL_STORE_PATH, connect=partial(mailbox_connect, mb), mailbox=mb.folder,
+                                          snippet_bytes=IMAP_SNIPPET_BYTES, account=mb.store)
+mail_events = EventBroker()
+
+def store_for(store):
+    try:
+        return mail_stores[store]
+    except KeyError:
+        raise UnknownMailbox(store) from None
+
+def _publish_new(store, items):
+    mail_events.publish({"type": "messages", "store": store,
+                         "messages": [{k: it[k] for k in MESSAGE_FIELDS} for it in items]})
+
+# one worker pool for every registered mailbox, bounded per IMAP host
+mail_syncer = SyncScheduler({mb.store: mail_stores[mb.store] for mb in mailboxes},
+                            {mb.store: mb.host for mb in mailboxes}, imap_limiter, workers=MAIL_SYNC_WORKERS,
+                            interval=MAIL_SYNC_INTERVAL, on_new=_publish_new, processes=MAIL_SYNC_PROCESSES)
+# IDLE only tells us *that* the inbox changed; the syncer then fetches just the new UIDs
+idle_listener = IdleListener(imap_connect, on_change=mail_syncer.kick, limiter=imap_limiter, host=IMAP_HOST)
+
+dashboard_store = DashboardStore(DASHBOARD_PATH)
+# regex first; only ambiguous replies reach Bedrock
+quote_extractor = QuoteExtractor(QUOTES_PATH, agent_factory=lambda: BedrockAgent(model_id=BEDROCK_MODEL_ID))
+
+
+def _with_token(subject, thread_token):
+    if thread_token and f"[RFQ:{thread_token}]" not in subject:
+        subject = f'{subject} [RFQ:{thread_token}]'
+    return subject
+
+def build_message(to, subject, text=None, html=None, in_reply_to=None, message_id=None):
     if isinstance(to, str):
         to = [to]
 
@@ -36,7 +124,7 @@ def smtp_send(to, subject, text=None, html=None, in_reply_to=None):
     msg["Subject"] = subject
     msg["Date"] = formatdate(localtime=True)
     # add a Message-ID so replies can reference it
-    msg["Message-ID"] = make_msgid()  # e.g., <random.123@yourhost>
+    msg["Message-ID"] = message_id or make_msgid(domain=MSGID_DOMAIN)  # e.g., <random.123@yourhost>
     if in_reply_to:
         msg["In-Reply-To"] = in_reply_to
         msg["References"]  = in_reply_to
@@ -46,19 +134,32 @@ def smtp_send(to, subject, text=None, html=None, in_reply_to=None):
         msg.add_alternative(html, subtype="html")
     else:
         msg.set_content(text or "")
+    return msg
 
-    ctx = ssl.create_default_context()
-    with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as s:
-        s.ehlo()
-        s.starttls(context=ctx)
-        s.login(EMAIL_USER, EMAIL_PASS)
-        s.send_message(msg)
+def smtp_send(to, subject, text=None, html=None, in_reply_to=None):
+    msg = build_message(to, subject, text=text, html=html, in_reply_to=in_reply_to)
+    smtp_pool.send_message(msg)
+    mail_store.record_sent(msg)
     return msg["Message-ID"]
 
-def imap_search(unseen=False, thread_token=None, limit=10, mark_seen=False):
-    M = imaplib.IMAP4_SSL(IMAP_HOST, IMAP_PORT)
-    M.login(EMAIL_USER, EMAIL_PASS)
-    M.select("INBOX")
+def enqueue(msg):
+    # indexed when queued, so the thread view shows it right away; its job carries the delivery status
+    job, created = outbox.enqueue(msg)
+    if created:
+        mail_store.record_sent(msg)
+    return job, created
+
+def imap_search(unseen=False, thread_token=None, limit=10, mark_seen=False, fetch="headers", store=DEFAULT_STORE):
+    mb = default_mailbox if store == DEFAULT_STORE else mailboxes.get(store)
+    with imap_limiter.slot(mb.host):
+        M = imap_connect() if store == DEFAULT_STORE else mailbox_connect(mb)
+        try:
+            return _imap_search(M, mb.folder, unseen, thread_token, limit, mark_seen, fetch)
+        finally:
+            M.logout()
+
+def _imap_search(M, folder, unseen, thread_token, limit, mark_seen, fetch):
+    M.select(folder)
 
     # build search criteria
     criteria = []
@@ -69,54 +170,23 @@ def imap_search(unseen=False, thread_token=None, limit=10, mark_seen=False):
     if not criteria:
         criteria = ["ALL"]
 
-    typ, data = M.uid("search", None, *criteria)
+    with phase("imap", "search"):
+        typ, data = M.uid("search", None, *criteria)
     if typ != "OK":
-        M.logout()
         return []
 
     uids = data[0].split()
     uids = list(reversed(uids))[:limit]  # newest first
 
-    items = []
-    for uid in uids:
-        typ, msgdata = M.uid("fetch", uid, "(RFC822)")
-        if typ != "OK" or not msgdata or not msgdata[0]:
-            continue
-        raw = msgdata[0][1]
-        msg = email.message_from_bytes(raw)
-
-        subj = _dec(msg.get("Subject"))
-        from_ = _dec(msg.get("From"))
-        date_ = msg.get("Date") or ""
-        msgid = msg.get("Message-Id") or ""
-        irt   = msg.get("In-Reply-To") or ""
-
-        # extract a small text/plain snippet
-        snippet = ""
-        if msg.is_multipart():
-            for part in msg.walk():
-                if part.get_content_type() == "text/plain" and "attachment" not in str(part.get("Content-Disposition") or "").lower():
-                    payload = part.get_payload(decode=True) or b""
-                    snippet = " ".join(payload.decode(part.get_content_charset() or "utf-8", "replace").split())[:200]
-                    break
-        else:
-            payload = msg.get_payload(decode=True) or b""
-            snippet = " ".join(payload.decode(msg.get_content_charset() or "utf-8", "replace").split())[:200]
-
-        items.append({
-            "uid": uid.decode(),
-            "from": from_,
-            "subject": subj,
-            "date": date_,
-            "snippet": snippet,
-            "message_id": msgid,
-            "in_reply_to": irt
-        })
-
-        if mark_seen:
-            M.uid("store", uid, "+FLAGS", r"(\Seen)")
-
-    M.logout()
+    if fetch == "full":
+        # legacy mode; RFC822 fetches also set \Seen implicitly on most servers
+        items = fetch_full(M, uids)
+    else:
+        items = [{k: it[k] for k in MESSAGE_FIELDS}
+                 for it in fetch_summaries(M, uids, snippet_bytes=IMAP_SNIPPET_BYTES)]
+
+    if mark_seen:
+        store_flags(M, [it["uid"] for it in items])
     return items
 
 
@@ -129,29 +199,415 @@ def api_send():
     html = data.get("html")
     in_reply_to = data.get("in_reply_to")
     thread_token = data.get("thread_token")
+    # a client-chosen Message-ID makes retries of this request idempotent
+    message_id = data.get("message_id")
 
     if not to:
         return jsonify(error="'to' is required"), 400
-    if thread_token and f"[RFQ:{thread_token}]" not in subject:
-        subject = f'{subject} [RFQ:{thread_token}]'
+    subject = _with_token(subject, thread_token)
 
     try:
-        message_id = smtp_send(to=to, subject=subject, text=text, html=html, in_reply_to=in_reply_to)
-        return jsonify(status="sent", message_id=message_id, subject=subject)
+        msg = build_message(to, subject, text=text, html=html, in_reply_to=in_reply_to, message_id=message_id)
+        job, created = enqueue(msg)
+        if created:
+            outbox_sender.kick()
+        return jsonify(status=job["status"], job_id=job["job_id"], message_id=job["message_id"],
+                       subject=job["subject"]), 202
     except Exception as e:
         return jsonify(error=str(e)), 500
 
+@app.get("/email/jobs/<job_id>")
+def api_job(job_id):
+    job = outbox.get(job_id)
+    if not job:
+        return jsonify(error="unknown job"), 404
+    return jsonify(job)
+
+def _render(template, subs):
+    # $name / ${name} placeholders; unknown names are left as-is
+    if not template or not subs:
+        return template
+    return Template(template).safe_substitute(subs)
+
+def _batch_error(data):
+    # shape checks up front, so one malformed recipient can't fail the whole batch with a 500
+    if not isinstance(data, dict):
+        return "expected a JSON object"
+    recipients = data.get("recipients")
+    if not recipients:
+        return "'recipients' is required"
+    if not isinstance(recipients, list) or any(not isinstance(r, dict) for r in recipients):
+        return "'recipients' must be a list of objects"
+    if any(not r.get("to") for r in recipients):
+        return "every recipient needs a 'to'"
+    if any(not isinstance(r.get("substitutions") or {}, dict) for r in recipients):
+        return "'substitutions' must be an object"
+    if any(not isinstance(data.get(k) or "", str) for k in ("subject", "text", "html")):
+        return "'subject', 'text' and 'html' must be strings"
+    return None
+
+@app.post("/email/send/batch")
+def api_send_batch():
+    data = request.get_json(force=True)
+    error = _batch_error(data)
+    if error:
+        return jsonify(error=error), 400
+    recipients = data["recipients"]
+    subject = data.get("subject", "")
+    text = data.get("text") or ""
+    html = data.get("html")
+
+    def send_one(r):
+        result = {"to": r["to"], "thread_token": r.get("thread_token")}
+        try:
+            subs = r.get("substitutions") or {}
+            subj = _with_token(_render(subject, subs), r.get("thread_token"))
+            msg = build_message(r["to"], subj, text=_render(text, subs), html=_render(html, subs),
+                                in_reply_to=r.get("in_reply_to"))
+            result.update(subject=subj, message_id=msg["Message-ID"])
+            smtp_pool.send_message(msg)
+        except Exception as e:
+            result.update(status="error", error=str(e))
+            return result
+        mail_store.record_sent(msg)
+        result["status"] = "sent"
+        return result
+
+    results = list(batch_executor.map(send_one, recipients))
+    sent = sum(r["status"] == "sent" for r in results)
+    return jsonify(results=results, sent=sent, failed=len(results) - sent)
+
 @app.get("/email/messages")
 def api_messages():
     unseen = request.args.get("unseen", "false").lower() == "true"
     limit = int(request.args.get("limit", 10))
     thread_token = request.args.get("thread_token")
     mark_seen = request.args.get("mark_seen", "false").lower() == "true"
+    q = request.args.get("q")
+    cursor = request.args.get("cursor")
+    since_modseq = request.args.get("since_modseq")
+    live = request.args.get("live", "false").lower() == "true"
+    fetch = request.args.get("fetch", "headers")
+    store_id = request.args.get("store", DEFAULT_STORE)
+    try:
+        store = store_for(store_id)
+        if live:
+            # bypass the store and hit IMAP directly
+            items = imap_search(unseen=unseen, thread_token=thread_token, limit=limit, mark_seen=mark_seen, fetch=fetch,
+                                store=store_id)
+            return jsonify(messages=items)
+        if since_modseq is not None:
+            # delta mode for clients that already hold the listing
+            return jsonify(synced_at=store.synced_at(), **store.changes(int(since_modseq)))
+        items, next_cursor = store.query(unseen=unseen, thread_token=thread_token, limit=limit, q=q, cursor=cursor)
+        if mark_seen and items:
+            store.mark_seen([it["uid"] for it in items])
+            mail_syncer.kick(store_id)
+        return jsonify(messages=items, next_cursor=next_cursor, modseq=store.modseq(), synced_at=store.synced_at())
+    except UnknownMailbox:
+        return jsonify(error=f"unknown store {store_id!r}"), 404
+    except (StaleCursor, ValueError) as e:
+        return jsonify(error=str(e)), 400
+    except Exception as e:
+        return jsonify(error=str(e)), 500
+
+@app.get("/email/quotes")
+def api_quotes():
+    thread_token = request.args.get("thread_token")
+    try:
+        limit = int(request.args.get("limit", 20))
+        items, _ = mail_store.query(thread_token=thread_token, limit=limit)
+        bodies = mail_store.bodies(it["uid"] for it in items)
+        messages = [dict(it, body=bodies.get(it["uid"]) or it["snippet"]) for it in items]
+        quotes = quote_extractor.extract(messages)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(quotes=[{**{k: m[k] for k in MESSAGE_FIELDS}, "quote": quotes[message_key(m)]} for m in messages])
+
+@app.get("/email/threads/<token>")
+@app.get("/email/threads")
+def api_thread(token=None):
+    message_id = request.args.get("message_id")
+    store_id = request.args.get("store", DEFAULT_STORE)
+    if not token and not message_id:
+        return jsonify(error="a thread token or 'message_id' is required"), 400
+    try:
+        thread = store_for(store_id).thread(token=token, message_id=message_id)
+    except UnknownMailbox:
+        return jsonify(error=f"unknown store {store_id!r}"), 404
+    if thread is None:
+        return jsonify(error="unknown thread"), 404
+    for m in thread["messages"]:
+        if m["direction"] == "out":
+            # batch sends skip the outbox, so no job means it went out directly
+            job = outbox.get_by_message_id(m["message_id"])
+            m["status"], m["job_id"] = (job["status"], job["job_id"]) if job else ("sent", None)
+    return jsonify(**thread)
+
+@app.get("/email/events")
+def api_events():
+    q = mail_events.subscribe()
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = q.get(timeout=15)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            mail_events.unsubscribe(q)
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/agent/stream")
+def api_agent_stream():
+    data = request.get_json(force=True)
+    if not isinstance(data, dict):
+        return jsonify(error="expected a JSON object"), 400
+    prompt = data.get("prompt")
+    messages = data.get("messages")
+    if not prompt and not messages:
+        return jsonify(error="'prompt' or 'messages' is required"), 400
+    if messages and not isinstance(messages, list):
+        return jsonify(error="'messages' must be a list"), 400
+    try:
+        opts = dict(system_prompt=data.get("system_prompt"), max_tokens=int(data.get("max_tokens", 1000)),
+                    temperature=float(data.get("temperature", 0.7)))
+    except (ValueError, TypeError) as e:
+        return jsonify(error=str(e)), 400
     try:
-        items = imap_search(unseen=unseen, thread_token=thread_token, limit=limit, mark_seen=mark_seen)
-        return jsonify(messages=items)
+        agent = BedrockAgent(model_id=data.get("model_id") or BEDROCK_MODEL_ID)
     except Exception as e:
         return jsonify(error=str(e)), 500
 
+    def stream():
+        try:
+            s = agent.chat_stream(messages, **opts) if messages else agent.generate_stream(prompt, **opts)
+            for text in s:
+                yield _sse("delta", {"text": text})
+            yield _sse("done", {"usage": s.usage, "stop_reason": s.stop_reason, "model": s.model})
+        except Exception as e:
+            yield _sse("error", {"error": str(e)})
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def _dashboard_version():
+    # both halves only grow, so "<dashboard seq>.<mail modseq>" identifies what a client has seen
+    return f"{dashboard_store.seq()}.{mail_store.modseq()}"
+
+def _inbox(messages):
+    products = dashboard_store.product_for_token(m["thread_token"] for m in messages)
+    return [inbox_item(m, products.get(m["thread_token"])) for m in messages]
+
+@app.get("/api/dashboard")
+def api_dashboard():
+    version = _dashboard_version()
+    etag = f'"{version}"'
+    since = request.args.get("since")
+    if request.headers.get("If-None-Match") == etag or since == version:
+        return Response(status=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    full = True
+    if since:
+        try:
+            product_since, mail_since = parse_version(since)
+        except ValueError:
+            return jsonify(error="malformed 'since' version"), 400
+        product_now, mail_now = parse_version(version)
+        # a version from the future means a store was recreated; start the client over
+        full = product_since > product_now or mail_since > mail_now
+
+    if not full:
+        changes = mail_store.changes(mail_since)
+        # a delta we'd have to truncate would move the client's version past changes it never got
+        full = changes["reset"] or len(changes["messages"]) > DASHBOARD_INBOX_LIMIT
+    if full:
+        products, removed = dashboard_store.products(), []
+        messages, expunged = mail_store.query(limit=DASHBOARD_INBOX_LIMIT)[0], []
+    else:
+        products, removed = dashboard_store.products(product_since), dashboard_store.removed(product_since)
+        messages, expunged = changes["messages"], changes["expunged"]
+
+    resp = jsonify(version=version, full=full, products=products, removedProducts=removed,
+                   inbox=_inbox(messages), removedThreads=[f"message-{uid}" for uid in expunged])
+    resp.headers["ETag"] = etag
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+@app.post("/api/inventory")
+def api_inventory():
+    data = request.get_json(force=True)
+    products = data.get("products")
+    if not isinstance(products, list):
+        return jsonify(error="'products' must be a list"), 400
+    try:
+        dashboard_store.upsert(products, replace=bool(data.get("replace")))
+    except (KeyError, TypeError) as e:
+        return jsonify(error=f"invalid product or offer: missing {e}"), 400
+    return jsonify(version=_dashboard_version(), products=len(products))
+
+@app.post("/api/inventory/<product_id>/confirm")
+def api_confirm_offer(product_id):
+    data = request.get_json(force=True)
+    offer_id = data.get("offerId")
+    if not offer_id:
+        return jsonify(error="'offerId' is required"), 400
+    product = dashboard_store.confirm(product_id, offer_id)
+    if product is None:
+        return jsonify(error="unknown product or offer"), 404
+    return jsonify(product=product, version=_dashboard_version())
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+def supplier_catalog():
+    # the snapshot is memory-mapped, so every worker shares one copy of the pages
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = load_catalog()
+    return _catalog
+
+def _match_product(catalog, name):
+    products = catalog.columns["product"].categories
+    name = (name or "").strip().lower()
+    if name in products:
+        return name
+    words = set(name.replace("-", " ").split())
+    # "Jasmine Rice" -> rice, "Roma tomatoes" -> tomato
+    words |= {w[:-2] for w in words if w.endswith("es")} | {w[:-1] for w in words if w.endswith("s")}
+    return next((p for p in products if p in words), None)
+
+@app.post("/api/offers/rank")
+def api_rank_offers():
+    data = request.get_json(force=True)
+    if not isinstance(data, dict):
+        return jsonify(error="expected a JSON object"), 400
+    if not isinstance(data.get("filters") or {}, dict):
+        return jsonify(error="'filters' must be an object"), 400
+    catalog = supplier_catalog()
+    try:
+        filters = dict(data.get("filters") or {})
+        if data.get("product"):
+            product = _match_product(catalog, str(data["product"]))
+            if product is None:
+                return jsonify(offers=[], candidates=0, considered=0, product=None)
+            filters["product"] = product
+
+        # quantities in a mass/volume unit are converted to the catalog's unit; others skip MOQ checks
+        quantity = data.get("quantity")
+        unit = UNITS.get(str(data.get("unit") or "").lower())
+        if quantity is not None and data.get("unit"):
+            units = {r["unit"] for r in catalog.rows(catalog.query(**filters), ["unit"])} if unit else set()
+            quantity = float(quantity) * unit[1] if unit and units <= {unit[0]} else None
+        result = rank_offers(catalog, quantity=float(quantity) if quantity else None,
+                             weights=data.get("weights"), k=max(1, min(int(data.get("k", 10)), 100)),
+                             pareto=bool(data.get("pareto")), feasible_only=bool(data.get("feasible_only")),
+                             **filters)
+    except (KeyError, ValueError, TypeError) as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(product=filters.get("product"), **result)
+
+
+add_bedrock_listener(bedrock_listener)
+add_search_listener(search_listener)
+profiler = SlowRequestProfiler(threshold=PROFILE_SLOW_REQUESTS) if PROFILE_SLOW_REQUESTS > 0 else None
+
+SMTP_POOL = REGISTRY.gauge("smtp_pool_sessions", "SMTP pool sessions by state", ("state",))
+OUTBOX_JOBS = REGISTRY.gauge("outbox_jobs", "Outbox jobs by status", ("status",), aggregate="max")
+SSE_CLIENTS = REGISTRY.gauge("sse_clients", "Connected /email/events clients")
+MAIL_SYNC_AGE = REGISTRY.gauge("mail_store_sync_age_seconds", "Seconds since the last completed IMAP sync",
+                               aggregate="max")
+MAIL_SYNC = REGISTRY.gauge("mail_sync_mailboxes", "Scheduled mailboxes by state", ("state",), aggregate="max")
+IMAP_SESSIONS = REGISTRY.gauge("imap_host_sessions", "Open IMAP sessions per server host", ("host",))
+
+@REGISTRY.collector
+def _collect_state():
+    pool = smtp_pool.stats()
+    SMTP_POOL.set(pool["in_use"], state="in_use")
+    SMTP_POOL.set(pool["idle"], state="idle")
+    SMTP_POOL.set(pool["size"], state="size")
+    counts = outbox.counts()
+    for status in ("queued", "sending", "sent", "partial", "failed"):
+        OUTBOX_JOBS.set(counts.get(status, 0), status=status)
+    SSE_CLIENTS.set(len(mail_events))
+    synced_at = mail_store.synced_at()
+    if synced_at:
+        MAIL_SYNC_AGE.set(round(time.time() - synced_at, 3))
+    sync = mail_syncer.stats()
+    for state in ("stores", "running", "overdue", "failing"):
+        if state in sync:
+            MAIL_SYNC.set(sync[state], state=state)
+    for host, n in imap_limiter.stats().items():
+        IMAP_SESSIONS.set(n, host=host)
+
+@app.before_request
+def _start_timer():
+    g.started = time.perf_counter()
+    if profiler:
+        g.profile = profiler.start()
+
+@app.after_request
+def _record_request(resp):
+    started = g.pop("started", None)
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_REQUESTS.observe(elapsed, method=request.method, endpoint=endpoint, status=resp.status_code)
+        if profiler and "profile" in g:
+            profiler.stop(g.pop("profile"), elapsed, f"{request.method} {endpoint}")
+    return resp
+
+@app.get("/metrics")
+def api_metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@app.get("/debug/slow-requests")
+def api_slow_requests():
+    if not profiler:
+        return jsonify(error="profiling is off; set PROFILE_SLOW_REQUESTS"), 404
+    return jsonify(threshold=profiler.threshold, requests=list(profiler.recent))
+
+
+_background_lock = threading.Lock()
+_background_started = False
+
+def start_background(mail_sync=True):
+    # mail_sync=False: another process owns the IMAP sync and IDLE session
+    global _background_started
+    with _background_lock:
+        if _background_started:
+            return
+        _background_started = True
+    if SMTP_HOST:
+        outbox_sender.start()
+    if mail_sync and len(mailboxes):
+        mail_syncer.start()
+    # IDLE pins a session per mailbox, so only the primary one gets push; the rest are polled
+    if IMAP_HOST and mail_sync and IMAP_IDLE:
+        # the IDLE session keeps one of the host's slots; with only one left, syncs would never get it
+        if imap_limiter.limit > 1:
+            idle_listener.start()
+        else:
+            app.logger.warning("IMAP_HOST_CONNECTIONS leaves no slot for IDLE next to sync; relying on periodic sync")
+
+@app.before_request
+def _ensure_background():
+    if not _background_started:
+        start_background()
+
 if __name__ == "__main__":
     app.run(debug=True, port=5001)
@@ -0,0 +1,329 @@
+import os, glob, json, time, asyncio, logging
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from asgiref.wsgi import WsgiToAsgi
+import app as wsgi
+from aiomail import AsyncIMAPPool, AsyncSMTPPool
+from imap_fetch import compress_uids, fetch_summaries_async
+from mail_store import StaleCursor
+from mailboxes import DEFAULT_STORE, UnknownMailbox
+from metrics import REGISTRY, CONTENT_TYPE, HTTP_REQUESTS
+
+# Production entry point: gunicorn -c gunicorn_conf.py asgi:app  (or: uvicorn asgi:app)
+#
+# The mail endpoints that spend their time waiting on SMTP/IMAP run as
+# coroutines on pooled aiosmtplib/AsyncIMAP sessions, so a slow mail server
+# costs a suspended task rather than a thread. Everything else is the Flask
+# app from app.py, mounted through WsgiToAsgi.
+
+log = logging.getLogger(__name__)
+
+# pooled sessions hold IMAP_HOST_CONNECTIONS slots while open; leave the rest to the sync workers
+IMAP_POOL_SIZE = int(os.getenv("IMAP_POOL_SIZE", str(max(1, wsgi.IMAP_HOST_CONNECTIONS // 2))))
+IMAP_SSL = os.getenv("IMAP_SSL", "true").lower() == "true"
+# only one worker process runs the IMAP sync/IDLE threads; the others serve from the store
+BACKGROUND_LOCK = os.getenv("BACKGROUND_LOCK", os.path.join(os.path.dirname(os.path.abspath(wsgi.MAIL_STORE_PATH)),
+                                                            ".mail-sync.lock"))
+# set by gunicorn_conf.py when several workers share the port: each worker drops a metrics snapshot
+# here and /metrics serves the sum, whichever worker the scrape lands on
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+# how often a worker that doesn't run the sync looks for new mail in the shared store, for its SSE clients
+EVENTS_POLL_INTERVAL = float(os.getenv("EVENTS_POLL_INTERVAL", "2"))
+
+smtp_pool = AsyncSMTPPool(wsgi.SMTP_HOST, wsgi.SMTP_PORT, wsgi.EMAIL_USER, wsgi.EMAIL_PASS,
+                          size=wsgi.SMTP_POOL_SIZE, idle_timeout=wsgi.SMTP_IDLE_TIMEOUT)
+imap_pool = AsyncIMAPPool(wsgi.IMAP_HOST, wsgi.IMAP_PORT, wsgi.EMAIL_USER, wsgi.EMAIL_PASS,
+                          use_ssl=IMAP_SSL, size=IMAP_POOL_SIZE, limiter=wsgi.imap_limiter)
+
+ASYNC_POOL = REGISTRY.gauge("async_pool_sessions", "ASGI-mode SMTP/IMAP pool sessions by state",
+                            ("protocol", "state"))
+
+@REGISTRY.collector
+def _collect_pools():
+    for protocol, pool in (("smtp", smtp_pool), ("imap", imap_pool)):
+        for state, n in pool.stats().items():
+            ASYNC_POOL.set(n, protocol=protocol, state=state)
+
+
+def _error(message, status):
+    return JSONResponse({"error": message}, status_code=status)
+
+def timed(endpoint):
+    def wrap(fn):
+        async def handler(request):
+            start = time.perf_counter()
+            status = 500
+            try:
+                resp = await fn(request)
+                status = resp.status_code
+                return resp
+            finally:
+                HTTP_REQUESTS.observe(time.perf_counter() - start, method=request.method, endpoint=endpoint,
+                                      status=status)
+        return handler
+    return wrap
+
+async def _json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+@timed("/email/send")
+async def api_send(request):
+    data = await _json(request)
+    if not isinstance(data, dict):
+        return _error("invalid JSON body", 400)
+    to = data.get("to")
+    if not to:
+        return _error("'to' is required", 400)
+    subject = wsgi._with_token(data.get("subject", ""), data.get("thread_token"))
+    try:
+        msg = wsgi.build_message(to, subject, text=data.get("text") or "", html=data.get("html"),
+                                 in_reply_to=data.get("in_reply_to"), message_id=data.get("message_id"))
+        # the outbox and thread index are local SQLite writes; delivery happens on the sender threads
+        job, created = await run_in_threadpool(wsgi.enqueue, msg)
+        if created:
+            wsgi.outbox_sender.kick()
+        return JSONResponse({"status": job["status"], "job_id": job["job_id"], "message_id": job["message_id"],
+                             "subject": job["subject"]}, status_code=202)
+    except Exception as e:
+        return _error(str(e), 500)
+
+@timed("/email/send/batch")
+async def api_send_batch(request):
+    data = await _json(request)
+    error = wsgi._batch_error(data) if data is not None else "invalid JSON body"
+    if error:
+        return _error(error, 400)
+    recipients = data["recipients"]
+    subject, text, html = data.get("subject", ""), data.get("text") or "", data.get("html")
+
+    async def send_one(r):
+        result = {"to": r["to"], "thread_token": r.get("thread_token")}
+        try:
+            subs = r.get("substitutions") or {}
+            subj = wsgi._with_token(wsgi._render(subject, subs), r.get("thread_token"))
+            msg = wsgi.build_message(r["to"], subj, text=wsgi._render(text, subs), html=wsgi._render(html, subs),
+                                     in_reply_to=r.get("in_reply_to"))
+            result.update(subject=subj, message_id=msg["Message-ID"])
+            await smtp_pool.send_message(msg)
+        except Exception as e:
+            result.update(status="error", error=str(e))
+            return result
+        await run_in_threadpool(wsgi.mail_store.record_sent, msg)
+        result["status"] = "sent"
+        return result
+
+    # the pool caps live SMTP sessions; the rest wait as tasks, not threads
+    results = await asyncio.gather(*(send_one(r) for r in recipients))
+    sent = sum(r["status"] == "sent" for r in results)
+    return JSONResponse({"results": results, "sent": sent, "failed": len(results) - sent})
+
+async def imap_search(unseen=False, thread_token=None, limit=10, mark_seen=False):
+    criteria = []
+    if unseen:
+        criteria.append("UNSEEN")
+    if thread_token:
+        criteria += ["SUBJECT", f'"[RFQ:{thread_token}]"']
+    async with imap_pool.session() as M:
+        await M.select("INBOX")
+        typ, data = await M.uid("SEARCH", *(criteria or ["ALL"]))
+        if typ != "OK":
+            return []
+        uids = list(reversed(data[0].split()))[:limit]  # newest first
+        items = [{k: it[k] for k in wsgi.MESSAGE_FIELDS}
+                 for it in await fetch_summaries_async(M, uids, snippet_bytes=wsgi.IMAP_SNIPPET_BYTES)]
+        if mark_seen and items:
+            await M.uid("STORE", compress_uids(it["uid"] for it in items), "+FLAGS", r"(\Seen)")
+    return items
+
+@timed("/email/messages")
+async def api_messages(request):
+    args = request.query_params
+    flag = lambda name: args.get(name, "false").lower() == "true"
+    unseen, mark_seen, live = flag("unseen"), flag("mark_seen"), flag("live")
+    thread_token, since_modseq = args.get("thread_token"), args.get("since_modseq")
+    store_id = args.get("store", DEFAULT_STORE)
+    try:
+        limit = int(args.get("limit", 10))
+        store = wsgi.store_for(store_id)
+        if live:
+            if args.get("fetch", "headers") == "full" or store_id != DEFAULT_STORE:
+                # legacy RFC822 mode and the per-store mailboxes stay on the blocking client
+                items = await run_in_threadpool(wsgi.imap_search, unseen=unseen, thread_token=thread_token,
+                                                limit=limit, mark_seen=mark_seen, fetch=args.get("fetch", "headers"),
+                                                store=store_id)
+            else:
+                items = await imap_search(unseen=unseen, thread_token=thread_token, limit=limit,
+                                          mark_seen=mark_seen)
+            return JSONResponse({"messages": items})
+
+        if since_modseq is not None:
+            changes = await run_in_threadpool(store.changes, int(since_modseq))
+            return JSONResponse({"synced_at": store.synced_at(), **changes})
+        items, next_cursor = await run_in_threadpool(store.query, unseen=unseen, thread_token=thread_token,
+                                                     limit=limit, q=args.get("q"), cursor=args.get("cursor"))
+        if mark_seen and items:
+            await run_in_threadpool(store.mark_seen, [it["uid"] for it in items])
+            wsgi.mail_syncer.kick(store_id)
+        return JSONResponse({"messages": items, "next_cursor": next_cursor, "modseq": store.modseq(),
+                             "synced_at": store.synced_at()})
+    except UnknownMailbox:
+        return _error(f"unknown store {store_id!r}", 404)
+    except (StaleCursor, ValueError) as e:
+        return _error(str(e), 400)
+    except Exception as e:
+        return _error(str(e) or type(e).__name__, 500)
+
+async def api_events(request):
+    q = wsgi.mail_events.subscribe_async()
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(q.get(), 15)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            wsgi.mail_events.unsubscribe(q)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def api_metrics(request):
+    if not METRICS_DIR:
+        return Response(REGISTRY.render(), headers={"Content-Type": CONTENT_TYPE})
+    own = REGISTRY.snapshot()
+    others = await run_in_threadpool(_read_snapshots)
+    return Response(REGISTRY.render_merged([own] + others), headers={"Content-Type": CONTENT_TYPE})
+
+def _snapshot_path(pid=None):
+    return os.path.join(METRICS_DIR, f"{pid or os.getpid()}.json")
+
+def _write_snapshot():
+    tmp = _snapshot_path() + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(REGISTRY.snapshot(), f)
+    os.replace(tmp, _snapshot_path())
+
+def _read_snapshots():
+    # a worker that died without cleaning up stops refreshing its file; leave it out after a while
+    cutoff = time.time() - 3 * METRICS_FLUSH_INTERVAL
+    snaps = []
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+        if path == _snapshot_path():
+            continue
+        try:
+            if os.path.getmtime(path) < cutoff:
+                continue
+            with open(path) as f:
+                snaps.append(json.load(f))
+        except (OSError, ValueError):
+            pass  # removed or half-written by its owner
+    return snaps
+
+async def _flush_metrics():
+    while True:
+        try:
+            await run_in_threadpool(_write_snapshot)
+        except OSError:
+            log.exception("cannot write metrics snapshot to %s", METRICS_DIR)
+        await asyncio.sleep(METRICS_FLUSH_INTERVAL)
+
+
+def _poll_new(marks):
+    # marks: store id -> (change_seq, newest uid) last seen by this worker
+    for sid, store in wsgi.mail_stores.items():
+        seq = store.modseq()
+        if sid in marks and seq == marks[sid][0]:
+            continue
+        newest = store.query(limit=1)[0]
+        top = int(newest[0]["uid"]) if newest else 0
+        if sid in marks:
+            since, last_uid = marks[sid]
+            changes = store.changes(since)
+            # changes() also carries flag updates; only mail above the old high-water mark is new
+            new = [] if changes["reset"] else [m for m in changes["messages"] if int(m["uid"]) > last_uid]
+            if new:
+                wsgi._publish_new(sid, sorted(new, key=lambda m: int(m["uid"])))
+        marks[sid] = (seq, top)
+
+async def _follow_store():
+    # only the leader syncs, so its EventBroker is the only one fed directly; the other workers
+    # notice new mail through the shared store instead
+    marks = {}
+    while True:
+        await asyncio.sleep(EVENTS_POLL_INTERVAL)
+        if not len(wsgi.mail_events):
+            marks.clear()  # nobody listening; pick the marks up again when someone subscribes
+            continue
+        try:
+            await run_in_threadpool(_poll_new, marks)
+        except Exception:
+            log.exception("polling the mail store for events failed")
+
+
+def _claim_background(path):
+    # an flock held for the life of the process; the first worker to start wins
+    try:
+        import fcntl
+    except ImportError:
+        return True, None
+    f = open(path, "a")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return False, None
+    return True, f
+
+@asynccontextmanager
+async def lifespan(_):
+    leader, lock = _claim_background(BACKGROUND_LOCK)
+    log.info("worker %s %s the IMAP sync", os.getpid(), "runs" if leader else "skips")
+    wsgi.start_background(mail_sync=leader)
+    tasks = [] if leader else [asyncio.create_task(_follow_store())]
+    if METRICS_DIR:
+        tasks.append(asyncio.create_task(_flush_metrics()))
+    try:
+        yield
+    finally:
+        for t in tasks:
+            t.cancel()
+        if METRICS_DIR:
+            try:
+                os.remove(_snapshot_path())
+            except OSError:
+                pass
+        await smtp_pool.close()
+        await imap_pool.close()
+        if lock:
+            lock.close()
+
+
+app = Starlette(
+    routes=[
+        Route("/email/send", api_send, methods=["POST"]),
+        Route("/email/send/batch", api_send_batch, methods=["POST"]),
+        Route("/email/messages", api_messages, methods=["GET"]),
+        Route("/email/events", api_events, methods=["GET"]),
+        Route("/metrics", api_metrics, methods=["GET"]),
+        Mount("/", app=WsgiToAsgi(wsgi.app)),
+    ],
+    # same policy as flask_cors' CORS(app), so the async routes answer the dashboard too
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+    lifespan=lifespan,
+)
@@ -0,0 +1,423 @@
+import io, re, json, time, email, random, threading, socketserver
+from email.message import EmailMessage
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PRODUCTS = ("rice", "tomato", "olive oil", "flour", "sugar", "coffee beans", "chickpeas", "cashews")
+SUPPLIERS = ("Delta Agro", "Nile Harvest", "Mekong Foods", "Andes Trading", "Sahel Commodities", "Baltic Grain")
+REPLIES = (
+    "Thanks for the RFQ. Our price is ${price}/kg FOB {port}. MOQ {moq} kg, lead time {weeks} weeks.",
+    "We can offer {product} at ${price} per kg, delivered. Minimum order {moq} kg. Ships in {days} days.",
+    "Pricing: ${price}/kg up to 5 t, ${price_low}/kg above that. Lead time {weeks}-{weeks_hi} weeks.",
+    "Happy to help. Please see the attached spec sheet; we will follow up with a quotation shortly.",
+)
+
+
+def _start(server):
+    threading.Thread(target=server.serve_forever, daemon=True, name=type(server).__name__).start()
+    return server
+
+
+# --- SMTP -------------------------------------------------------------------
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        srv = self.server
+        w = lambda line: self.wfile.write(line.encode() + b"\r\n")
+        with srv.lock:
+            srv.connections += 1
+        w("220 bench smtp ready")
+        size, in_data = 0, False
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if in_data:
+                if line == b".\r\n":
+                    in_data = False
+                    with srv.lock:
+                        srv.messages += 1
+                        srv.bytes += size
+                    w("250 queued")
+                else:
+                    size += len(line)
+                continue
+            cmd = line[:4].upper()
+            if cmd in (b"EHLO", b"HELO"):
+                w("250-bench"); w("250-8BITMIME"); w("250 AUTH PLAIN LOGIN")
+            elif cmd == b"AUTH":
+                w("235 authenticated")
+            elif cmd == b"DATA":
+                size, in_data = 0, True
+                w("354 go ahead")
+            elif cmd == b"QUIT":
+                w("221 bye")
+                return
+            else:
+                w("250 ok")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Accepts and discards mail; counts connections, messages and bytes. No STARTTLS."""
+    allow_reuse_address = True
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, host="127.0.0.1", port=0):
+        super().__init__((host, port), _SMTPHandler)
+        self.lock = threading.Lock()
+        self.connections = self.messages = self.bytes = 0
+
+    def start(self):
+        return _start(self)
+
+
+# --- IMAP -------------------------------------------------------------------
+
+def _q(s):
+    return "NIL" if s is None else '"' + str(s).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def _bodystructure(part):
+    if part.is_multipart():
+        return f"({''.join(_bodystructure(p) for p in part.get_payload())} {_q(part.get_content_subtype().upper())})"
+    params = part.get_params()[1:] if part.get_params() else []
+    plist = "(" + " ".join(f"{_q(k.upper())} {_q(v)}" for k, v in params) + ")" if params else "NIL"
+    payload = part.get_payload()
+    size = len(payload.encode()) if isinstance(payload, str) else 0
+    enc = (part.get("Content-Transfer-Encoding") or "7bit").upper()
+    base = f"{_q(part.get_content_maintype().upper())} {_q(part.get_content_subtype().upper())} {plist} NIL NIL {_q(enc)} {size}"
+    if part.get_content_maintype() == "text":
+        base += f" {payload.count(chr(10))}"
+    disp = part.get("Content-Disposition")
+    disp = f"({_q(disp.split(';')[0].strip().upper())} NIL)" if disp else "NIL"
+    return f"({base} NIL {disp} NIL NIL)"
+
+def _section(msg, raw, section):
+    if section == "":
+        return raw
+    if section.upper().startswith("HEADER.FIELDS"):
+        fields = {f.upper() for f in re.findall(r"[\w-]+", section.split("(", 1)[1])}
+        return "".join(f"{k}: {v}\r\n" for k, v in msg.items() if k.upper() in fields).encode() + b"\r\n"
+    part = msg
+    for n in section.split("."):
+        if part.is_multipart():
+            part = part.get_payload()[int(n) - 1]
+        elif n != "1":
+            return b""
+    payload = part.get_payload()
+    return (payload if isinstance(payload, str) else "").replace("\r\n", "\n").replace("\n", "\r\n").encode()
+
+def _uidset(spec, maxuid):
+    out = set()
+    for part in spec.split(","):
+        lo, _, hi = part.partition(":")
+        lo = maxuid if lo == "*" else int(lo)
+        hi = lo if not hi else maxuid if hi == "*" else int(hi)
+        out.update(range(min(lo, hi), max(lo, hi) + 1))
+    return out
+
+
+class Mailbox:
+    """In-memory INBOX: messages are parsed once on append, BODYSTRUCTURE is precomputed."""
+
+    def __init__(self, uidvalidity=1):
+        self.uidvalidity = uidvalidity
+        self.msgs = []
+        self.by_uid = {}
+        self.uidnext = 1
+        self.modseq = 1
+        self.lock = threading.Lock()
+
+    def append(self, raw, flags=()):
+        msg = email.message_from_bytes(raw)
+        with self.lock:
+            self.modseq += 1
+            m = {"uid": self.uidnext, "raw": raw, "msg": msg, "flags": set(flags), "modseq": self.modseq,
+                 "subject": msg["Subject"] or "", "bodystructure": _bodystructure(msg)}
+            self.msgs.append(m)
+            self.by_uid[m["uid"]] = m
+            self.uidnext += 1
+
+
+class _IMAPHandler(socketserver.StreamRequestHandler):
+    def w(self, s):
+        self.wfile.write(s if isinstance(s, bytes) else s.encode())
+
+    def handle(self):
+        box = self.server.box
+        self.w("* OK bench imap ready\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if self.server.latency:
+                time.sleep(self.server.latency)
+            tag, _, rest = line.decode().rstrip("\r\n").partition(" ")
+            cmd, _, args = rest.partition(" ")
+            cmd = cmd.upper()
+            if cmd == "CAPABILITY":
+                self.w(f"* CAPABILITY IMAP4rev1 CONDSTORE\r\n{tag} OK done\r\n")
+            elif cmd == "LOGIN":
+                self.w(f"{tag} OK logged in\r\n")
+            elif cmd in ("SELECT", "EXAMINE"):
+                with box.lock:
+                    self.w(f"* {len(box.msgs)} EXISTS\r\n* 0 RECENT\r\n* OK [UIDVALIDITY {box.uidvalidity}] ok\r\n"
+                           f"* OK [UIDNEXT {box.uidnext}] ok\r\n* OK [HIGHESTMODSEQ {box.modseq}] ok\r\n")
+                self.w(f"{tag} OK [READ-WRITE] selected\r\n")
+            elif cmd == "NOOP":
+                self.w(f"{tag} OK noop\r\n")
+            elif cmd == "LOGOUT":
+                self.w(f"* BYE\r\n{tag} OK bye\r\n")
+                return
+            elif cmd == "UID":
+                sub, _, args = args.partition(" ")
+                handler = getattr(self, "uid_" + sub.lower(), None)
+                if handler:
+                    handler(tag, args)
+                else:
+                    self.w(f"{tag} BAD unsupported UID {sub}\r\n")
+            else:
+                self.w(f"{tag} BAD unsupported {cmd}\r\n")
+
+    def uid_search(self, tag, args):
+        box = self.server.box
+        toks = re.findall(r'"[^"]*"|\S+', args)
+        sets = {}
+        with box.lock:
+            found = []
+            for m in box.msgs:
+                ok, i = True, 0
+                while i < len(toks):
+                    t = toks[i].upper()
+                    if t == "UNSEEN":
+                        ok &= "\\Seen" not in m["flags"]
+                    elif t == "SUBJECT":
+                        i += 1
+                        ok &= toks[i].strip('"') in m["subject"]
+                    elif t == "UID":
+                        i += 1
+                        if toks[i] not in sets:
+                            sets[toks[i]] = _uidset(toks[i], box.uidnext - 1)
+                        ok &= m["uid"] in sets[toks[i]]
+                    i += 1
+                if ok:
+                    found.append(str(m["uid"]))
+        self.w(f"* SEARCH {' '.join(found)}\r\n{tag} OK search\r\n")
+
+    def uid_store(self, tag, args):
+        box = self.server.box
+        spec, op, flags = args.split(" ", 2)
+        flags = set(re.findall(r"\\?\w+", flags))
+        with box.lock:
+            for uid in _uidset(spec, box.uidnext - 1):
+                m = box.by_uid.get(uid)
+                if m:
+                    box.modseq += 1
+                    m["modseq"] = box.modseq
+                    m["flags"] = m["flags"] | flags if op.startswith("+") else m["flags"] - flags
+        self.w(f"{tag} OK store\r\n")
+
+    def uid_fetch(self, tag, args):
+        box = self.server.box
+        spec, _, items = args.partition(" ")
+        changedsince = re.search(r"\(CHANGEDSINCE (\d+)\)\s*$", items)
+        if changedsince:
+            items = items[:changedsince.start()]
+            changedsince = int(changedsince.group(1))
+        items = items.strip()
+        items = items[1:-1] if items.startswith("(") else items
+        wanted = re.findall(r"BODY(?:\.PEEK)?\[[^\]]*\](?:<\d+\.\d+>)?|\S+", items)
+        out = io.BytesIO()
+        with box.lock:
+            uids = _uidset(spec, max(box.uidnext - 1, 1))
+            for seq, m in enumerate(box.msgs, 1):
+                if m["uid"] not in uids:
+                    continue
+                if changedsince is not None and m["modseq"] <= changedsince:
+                    continue
+                parts = [f"UID {m['uid']}".encode()]
+                for it in wanted:
+                    u = it.upper()
+                    if u == "FLAGS":
+                        parts.append(f"FLAGS ({' '.join(sorted(m['flags']))})".encode())
+                    elif u == "BODYSTRUCTURE":
+                        parts.append(b"BODYSTRUCTURE " + m["bodystructure"].encode())
+                    elif u == "RFC822":
+                        parts.append(b"RFC822 {%d}\r\n" % len(m["raw"]) + m["raw"])
+                        m["flags"].add("\\Seen")
+                    elif u.startswith("BODY"):
+                        spec_m = re.match(r"BODY(?:\.PEEK)?\[([^\]]*)\](?:<(\d+)\.(\d+)>)?", it, re.I)
+                        data = _section(m["msg"], m["raw"], spec_m.group(1))
+                        key = f"BODY[{spec_m.group(1)}]"
+                        if spec_m.group(2):
+                            start, n = int(spec_m.group(2)), int(spec_m.group(3))
+                            data, key = data[start:start + n], key + f"<{start}>"
+                        parts.append(key.encode() + b" {%d}\r\n" % len(data) + data)
+                out.write(b"* %d FETCH (" % seq + b" ".join(parts) + b")\r\n")
+        data = out.getvalue()
+        self.server.bytes_sent += len(data)
+        self.w(data + f"{tag} OK fetch\r\n".encode())
+
+
+class IMAPServer(socketserver.ThreadingTCPServer):
+    """Plain-text IMAP server speaking the subset the app uses (SELECT, UID SEARCH/FETCH/STORE, CONDSTORE)."""
+    allow_reuse_address = True
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, box=None, host="127.0.0.1", port=0, latency=0.0):
+        super().__init__((host, port), _IMAPHandler)
+        self.box = box or Mailbox()
+        self.latency = latency  # seconds added to every command, to mimic a slow provider
+        self.bytes_sent = 0
+
+    def start(self):
+        return _start(self)
+
+
+def supplier_reply(token, product, rng, attachment_bytes=0, domain="bench.example"):
+    """One synthetic supplier reply to the RFQ thread `token`, optionally with a PDF attachment."""
+    price = round(rng.uniform(0.4, 6.0), 2)
+    weeks = rng.randint(1, 6)
+    text = rng.choice(REPLIES).format(
+        price=price, price_low=round(price * 0.9, 2), product=product, moq=rng.choice((250, 500, 1000, 5000)),
+        port=rng.choice(("Houston", "Rotterdam", "Alexandria", "Ho Chi Minh City")),
+        weeks=weeks, weeks_hi=weeks + 2, days=rng.randint(3, 30))
+    supplier = rng.choice(SUPPLIERS)
+    msg = EmailMessage()
+    msg["From"] = f"{supplier} <sales@{supplier.split()[0].lower()}.{domain}>"
+    msg["To"] = f"buyer@{domain}"
+    msg["Subject"] = f"Re: RFQ for {product} [RFQ:{token}]"
+    msg["Date"] = formatdate(localtime=True)
+    msg["Message-ID"] = f"<{token}.{rng.getrandbits(48):x}@{domain}>"
+    msg["In-Reply-To"] = msg["References"] = f"<rfq-{token}@{domain}>"
+    msg.set_content(f"Hello,\n\n{text}\n\nBest regards,\n{supplier}\n")
+    if attachment_bytes:
+        msg.add_attachment(rng.randbytes(attachment_bytes), maintype="application", subtype="pdf",
+                           filename=f"{product.replace(' ', '_')}_spec.pdf")
+    return msg.as_bytes()
+
+
+def seed_mailbox(box, threads=100, replies=2, attachment_bytes=128 * 1024, seed=0):
+    """Fill `box` with `threads` RFQ threads of `replies` replies each; returns the thread tokens."""
+    rng = random.Random(seed)
+    tokens = []
+    for i in range(threads):
+        token = f"bench{i:05d}"
+        product = PRODUCTS[i % len(PRODUCTS)]
+        for _ in range(replies):
+            box.append(supplier_reply(token, product, rng, attachment_bytes))
+        tokens.append(token)
+    return tokens
+
+
+# --- Bedrock ----------------------------------------------------------------
+
+class _Body:
+    def __init__(self, data):
+        self._data = data
+
+    def read(self):
+        return self._data
+
+
+class FakeBedrockClient:
+    """Stand-in for a bedrock-runtime client: fixed latency plus jitter, optional throttling.
+
+    Claude request bodies get a Messages API reply, anything else a Llama one.
+    Quote-extraction prompts (with "### id:" sections) get a JSON array back.
+    """
+
+    def __init__(self, latency=0.2, jitter=0.05, throttle_rate=0.0, max_in_flight=None, output_tokens=120, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.max_in_flight = max_in_flight
+        self.output_tokens = output_tokens
+        self.calls = self.throttled = 0
+        self._in_flight = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _throttle(self):
+        from botocore.exceptions import ClientError
+        self.throttled += 1
+        raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, "InvokeModel")
+
+    def invoke_model(self, modelId, body, **kwargs):
+        request = json.loads(body)
+        with self._lock:
+            self.calls += 1
+            over = self.max_in_flight is not None and self._in_flight >= self.max_in_flight
+            if over or self._rng.random() < self.throttle_rate:
+                self._throttle()
+            self._in_flight += 1
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+        try:
+            time.sleep(delay)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+        prompt = json.dumps(request.get("messages") or request.get("prompt"))
+        n = prompt.count("### id:")
+        if n:
+            text = json.dumps([{"id": i, "price_per_unit": 1.25, "currency": "USD", "price_unit": "kg",
+                                "moq": 1000, "lead_time_days": 21} for i in range(n)])
+        else:
+            text = "Thank you for your quote. " * max(1, self.output_tokens // 6)
+        input_tokens = len(prompt) // 4 + 1
+        if modelId.startswith("anthropic."):
+            reply = {"content": [{"type": "text", "text": text}], "stop_reason": "end_turn",
+                     "usage": {"input_tokens": input_tokens, "output_tokens": self.output_tokens}}
+        else:
+            reply = {"generation": text, "prompt_token_count": input_tokens,
+                     "generation_token_count": self.output_tokens, "stop_reason": "stop"}
+        return {"body": _Body(json.dumps(reply).encode())}
+
+
+# --- Serper -----------------------------------------------------------------
+
+class _SerperHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        srv = self.server
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        with srv.lock:
+            srv.requests += 1
+        time.sleep(srv.latency)
+        q, num = payload.get("q", ""), int(payload.get("num", 10))
+        body = json.dumps({
+            "searchParameters": {"q": q, "num": num, "type": "search", "engine": "google"},
+            "organic": [{"title": f"{q} supplier {i}", "link": f"https://supplier{i}.example/{abs(hash(q)) % 997}",
+                         "snippet": f"Wholesale {q}. Export quality, competitive prices.", "position": i + 1}
+                        for i in range(num)],
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class SerperStub(ThreadingHTTPServer):
+    """HTTP stand-in for google.serper.dev/search with a fixed response latency."""
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, latency=0.1, host="127.0.0.1", port=0):
+        super().__init__((host, port), _SerperHandler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}/search"
+
+    def start(self):
+        return _start(self)
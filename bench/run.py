@@ -0,0 +1,288 @@
+"""Offline benchmarks for the Flask app, BedrockAgent and SerperSearchDataset.
+
+Starts local stand-ins (bench/fakes.py) for SMTP, IMAP, Bedrock and Serper,
+points the app at them and drives each scenario under a thread pool. Prints
+one JSON report with p50/p95/p99 latency and requests/sec per scenario.
+
+    python -m bench.run --requests 500 --concurrency 16 --output bench.json
+    python -m bench.run --scenarios messages,send --baseline bench.json
+"""
+import os, sys, json, math, time, logging, argparse, imaplib, tempfile, threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from werkzeug.serving import make_server
+
+from bench.fakes import SMTPSink, IMAPServer, Mailbox, FakeBedrockClient, SerperStub, seed_mailbox, PRODUCTS
+
+SCENARIOS = ("sync", "messages", "messages_live", "dashboard", "quotes", "send", "send_batch",
+             "agent", "agent_many", "search")
+# compared against --baseline; higher is worse for latency, lower is worse for throughput
+WATCHED = (("latency_ms", "p95", 1), ("requests_per_sec", None, -1))
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(latencies, errors, elapsed, concurrency):
+    ordered = sorted(latencies)
+    ms = lambda v: None if v is None else round(v * 1000, 2)
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "concurrency": concurrency,
+        "elapsed": round(elapsed, 3),
+        "requests_per_sec": round(len(latencies) / elapsed, 1) if elapsed > 0 else None,
+        "latency_ms": {"p50": ms(percentile(ordered, 50)), "p95": ms(percentile(ordered, 95)),
+                       "p99": ms(percentile(ordered, 99)), "max": ms(ordered[-1] if ordered else None),
+                       "mean": ms(sum(ordered) / len(ordered) if ordered else None)},
+    }
+
+
+def drive(fn, requests_, concurrency):
+    """Call fn(i) for i in range(requests_) on `concurrency` threads; failures count as errors."""
+    latencies, errors, lock = [], [0], threading.Lock()
+
+    def one(i):
+        start = time.perf_counter()
+        try:
+            fn(i)
+        except Exception as e:
+            with lock:
+                errors[0] += 1
+                if errors[0] == 1:
+                    print(f"  first error: {e!r}", file=sys.stderr)
+            return
+        took = time.perf_counter() - start
+        with lock:
+            latencies.append(took)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests_)))
+    return summarize(latencies, errors[0], time.perf_counter() - start, concurrency)
+
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.workdir = args.workdir or tempfile.mkdtemp(prefix="retail-bench-")
+        os.makedirs(self.workdir, exist_ok=True)
+        self.smtp = SMTPSink().start()
+        self.box = Mailbox()
+        self.tokens = seed_mailbox(self.box, threads=args.threads, replies=args.replies,
+                                   attachment_bytes=args.attachment_kb * 1024, seed=args.seed)
+        self.imap = IMAPServer(self.box).start()
+        self.bedrock = FakeBedrockClient(latency=args.bedrock_latency, jitter=args.bedrock_latency / 4,
+                                         throttle_rate=args.bedrock_throttle, seed=args.seed)
+        self.serper = SerperStub(latency=args.serper_latency).start()
+        self.app = self._load_app()
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)  # no per-request access log
+        self.server = make_server("127.0.0.1", 0, self.app.app, threaded=True)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.server.server_port}"
+        self._local = threading.local()
+
+    def _load_app(self):
+        # app.py reads its configuration at import time
+        path = lambda name: os.path.join(self.workdir, name)
+        os.environ.update(
+            SMTP_HOST="127.0.0.1", SMTP_PORT=str(self.smtp.server_address[1]),
+            IMAP_HOST="127.0.0.1", IMAP_PORT=str(self.imap.server_address[1]), IMAP_IDLE="false",
+            EMAIL_USER="buyer@bench.example", EMAIL_PASS="", MAIL_SYNC_INTERVAL="3600",
+            MAIL_STORE_PATH=path("mail_store.db"), OUTBOX_PATH=path("outbox.db"), MAILBOXES_FILE=path("mailboxes.json"),
+            DASHBOARD_PATH=path("dashboard.db"), QUOTES_PATH=path("quotes.db"),
+            SMTP_POOL_SIZE=str(self.args.smtp_pool_size),
+        )
+        from search import agent
+        agent.get_bedrock_client = lambda *a, **kw: self.bedrock
+        import app
+
+        host, port = self.imap.server_address
+
+        def imap_connect():
+            # the fake speaks plain IMAP; app.imap_connect expects implicit TLS
+            M = imaplib.IMAP4(host, port)
+            M.login("buyer@bench.example", "bench")
+            return M
+
+        app.imap_connect = imap_connect
+        app.mail_store.connect = imap_connect
+        app.smtp_pool.starttls = False
+        return app
+
+    # --- helpers --------------------------------------------------------------
+
+    def http(self, method, path, **kwargs):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        resp = session.request(method, self.base + path, timeout=120, **kwargs)
+        if resp.status_code >= 400:
+            raise RuntimeError(f"{method} {path} -> {resp.status_code}: {resp.text[:200]}")
+        return resp
+
+    def token(self, i):
+        return self.tokens[i % len(self.tokens)]
+
+    def wait_for_outbox(self, timeout=120):
+        start = time.perf_counter()
+        while time.perf_counter() - start < timeout:
+            counts = self.app.outbox.counts()
+            if not counts.get("queued") and not counts.get("sending"):
+                break
+            time.sleep(0.01)
+        return time.perf_counter() - start
+
+    # --- scenarios ------------------------------------------------------------
+
+    def sync(self, n, c):
+        start = time.perf_counter()
+        stored = len(self.app.mail_store.sync())
+        cold = time.perf_counter() - start
+        # incremental syncs against an unchanged mailbox; the store serializes them anyway
+        result = drive(lambda i: self.app.mail_store.sync(), max(1, n // 10), 1)
+        result["cold"] = {"messages": stored, "seconds": round(cold, 3),
+                          "messages_per_sec": round(stored / cold, 1) if cold > 0 else None,
+                          "imap_bytes": self.imap.bytes_sent}
+        return result
+
+    def messages(self, n, c):
+        return drive(lambda i: self.http("GET", "/email/messages", params={
+            "limit": 20, **({"thread_token": self.token(i)} if i % 2 else {})}), n, c)
+
+    def messages_live(self, n, c):
+        return drive(lambda i: self.http("GET", "/email/messages", params={
+            "live": "true", "limit": 10, "thread_token": self.token(i)}), n, c)
+
+    def dashboard(self, n, c):
+        offers = lambda i: [{"id": f"o{i}-{j}", "supplierName": f"Supplier {j}", "pricePerUnit": 1.5 + j / 10,
+                             "minimumOrder": 500, "leadTime": "3 weeks", "status": "pending"} for j in range(3)]
+        products = [{"id": f"p{i}", "name": p.title(), "quantity": 1000, "unit": "kg", "threadToken": self.tokens[i],
+                     "offers": offers(i)} for i, p in enumerate(PRODUCTS[:len(self.tokens)])]
+        self.http("POST", "/api/inventory", json={"products": products, "replace": True})
+        return drive(lambda i: self.http("GET", "/api/dashboard"), n, c)
+
+    def quotes(self, n, c):
+        return drive(lambda i: self.http("GET", "/email/quotes", params={"thread_token": self.token(i)}), n, c)
+
+    def send(self, n, c):
+        before = self.smtp.messages
+        result = drive(lambda i: self.http("POST", "/email/send", json={
+            "to": f"supplier{i}@bench.example", "subject": "RFQ", "text": "Please quote " * 40,
+            "thread_token": self.token(i)}), n, c)
+        drain = self.wait_for_outbox()
+        delivered = self.smtp.messages - before
+        result["delivery"] = {"delivered": delivered, "drain_seconds": round(drain, 3),
+                              "messages_per_sec": round(delivered / (result["elapsed"] + drain), 1)}
+        return result
+
+    def send_batch(self, n, c):
+        recipients = lambda i: [{"to": f"supplier{i}-{j}@bench.example", "thread_token": self.token(i + j),
+                                 "substitutions": {"name": f"Supplier {j}"}} for j in range(self.args.batch_size)]
+        result = drive(lambda i: self.http("POST", "/email/send/batch", json={
+            "recipients": recipients(i), "subject": "RFQ for $name", "text": "Hello $name, please quote."}), n, c)
+        result["messages_per_request"] = self.args.batch_size
+        return result
+
+    def agent(self, n, c):
+        from search.agent import BedrockAgent
+        agent = BedrockAgent()
+        return drive(lambda i: agent.generate_response(f"Summarize offer {i}", max_tokens=200), n, c)
+
+    def agent_many(self, n, c):
+        from search.agent import BedrockAgent
+        out = BedrockAgent().generate_many([f"Draft a reply to supplier {i}" for i in range(n)],
+                                           max_concurrency=c, max_tokens=200)
+        return dict(out["stats"], concurrency=c)
+
+    def search(self, n, c):
+        from search.search import SerperSearchDataset
+        ds = SerperSearchDataset(api_key="bench", cache=False, warm_dir=None, pool_size=c)
+        ds.url = self.serper.url
+        ds.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=c))
+        return drive(lambda i: ds.search(f"{PRODUCTS[i % len(PRODUCTS)]} suppliers {i}"), n, c)
+
+    def run(self, names):
+        report = {"config": {k: v for k, v in vars(self.args).items() if k not in ("baseline", "output")},
+                  "results": {}}
+        if "sync" not in names:
+            self.app.mail_store.sync()
+        for name in names:
+            print(f"running {name} ...", file=sys.stderr)
+            report["results"][name] = getattr(self, name)(self.args.requests, self.args.concurrency)
+        report["fakes"] = {"smtp_connections": self.smtp.connections, "smtp_messages": self.smtp.messages,
+                           "imap_bytes_sent": self.imap.bytes_sent, "bedrock_calls": self.bedrock.calls,
+                           "bedrock_throttled": self.bedrock.throttled, "serper_requests": self.serper.requests}
+        return report
+
+
+def compare(report, baseline, tolerance):
+    """Scenarios whose p95 latency rose, or throughput fell, by more than `tolerance`."""
+    regressions = []
+    for name, result in report["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if not old:
+            continue
+        for key, sub, sign in WATCHED:
+            now, then = result.get(key), old.get(key)
+            if sub:
+                now, then = (now or {}).get(sub), (then or {}).get(sub)
+            if not now or not then:
+                continue
+            change = (now - then) / then
+            if sign * change > tolerance:
+                regressions.append({"scenario": name, "metric": f"{key}.{sub}" if sub else key,
+                                    "baseline": then, "current": now, "change": round(change, 3)})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"Comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=100, help="Synthetic RFQ threads in the IMAP mailbox")
+    parser.add_argument("--replies", type=int, default=2, help="Supplier replies per thread")
+    parser.add_argument("--attachment-kb", type=int, default=128, help="Attachment size per reply (0 for none)")
+    parser.add_argument("--batch-size", type=int, default=10, help="Recipients per /email/send/batch request")
+    parser.add_argument("--smtp-pool-size", type=int, default=4)
+    parser.add_argument("--bedrock-latency", type=float, default=0.2, help="Seconds per fake Bedrock call")
+    parser.add_argument("--bedrock-throttle", type=float, default=0.0, help="Share of Bedrock calls throttled")
+    parser.add_argument("--serper-latency", type=float, default=0.1, help="Seconds per fake Serper call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="Directory for the SQLite stores (default: a new temp dir)")
+    parser.add_argument("--output", help="Also write the JSON report here")
+    parser.add_argument("--baseline", help="Earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed relative p95/throughput change before flagging a regression")
+    args = parser.parse_args(argv)
+
+    names = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    # the cold sync has to run before anything else touches the mail store
+    names.sort(key=lambda s: s != "sync")
+
+    report = Bench(args).run(names)
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    return 1 if report.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
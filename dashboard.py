@@ -0,0 +1,208 @@
+import json, time, sqlite3, threading
+from datetime import datetime, timezone
+from email.utils import parseaddr, parsedate_to_datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id                 TEXT PRIMARY KEY,
+    name               TEXT NOT NULL,
+    category           TEXT,
+    quantity           REAL,
+    unit               TEXT,
+    status             TEXT NOT NULL,
+    confirmed_offer_id TEXT,
+    notes              TEXT,
+    thread_token       TEXT,
+    updated_at         REAL NOT NULL,
+    change_seq         INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS offers (
+    product_id     TEXT NOT NULL,
+    id             TEXT NOT NULL,
+    supplier_name  TEXT NOT NULL,
+    email          TEXT,
+    website        TEXT,
+    price_per_unit REAL,
+    minimum_order  REAL,
+    lead_time      TEXT,
+    freight_terms  TEXT,
+    status         TEXT NOT NULL,
+    extra          TEXT,
+    updated_at     REAL NOT NULL,
+    PRIMARY KEY (product_id, id)
+);
+CREATE TABLE IF NOT EXISTS removed_products (
+    id         TEXT PRIMARY KEY,
+    change_seq INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dashboard_state (
+    id         INTEGER PRIMARY KEY CHECK (id = 1),
+    change_seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS products_change ON products (change_seq);
+CREATE INDEX IF NOT EXISTS products_token ON products (thread_token);
+"""
+
+PRODUCT_FIELDS = "id, name, category, quantity, unit, status, confirmed_offer_id, notes, thread_token, updated_at"
+OFFER_FIELDS = ("product_id, id, supplier_name, email, website, price_per_unit, minimum_order, lead_time, "
+                "freight_terms, status, extra, updated_at")
+# offer keys the UI sends that have their own column; anything else is kept in `extra`
+OFFER_KEYS = {"id", "supplierName", "email", "website", "pricePerUnit", "minimumOrder", "leadTime",
+              "freightTerms", "status", "lastUpdated"}
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat().replace("+00:00", "Z") if ts else None
+
+def _offer(r):
+    return {"id": r[1], "supplierName": r[2], "email": r[3], "website": r[4], "pricePerUnit": r[5],
+            "minimumOrder": r[6], "leadTime": r[7], "freightTerms": r[8], "status": r[9],
+            "lastUpdated": _iso(r[11]), **json.loads(r[10] or "{}")}
+
+def _product(r, offers):
+    return {"id": r[0], "name": r[1], "category": r[2], "quantity": r[3], "unit": r[4], "status": r[5],
+            "confirmedOfferId": r[6], "notes": r[7], "threadToken": r[8], "lastUpdated": _iso(r[9]),
+            "offers": offers}
+
+
+class DashboardStore:
+    """Products the buyer is sourcing and the supplier offers on each, versioned by a change sequence.
+
+    Every write bumps one store-wide sequence and stamps the touched products
+    with it (an offer change stamps its product), so `products(since)` returns
+    exactly the products a client holding version `since` needs to replace.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        db = self._db()
+        db.executescript(SCHEMA)
+        db.execute("INSERT OR IGNORE INTO dashboard_state (id, change_seq) VALUES (1, 0)")
+        db.commit()
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _next_seq(self, db):
+        db.execute("UPDATE dashboard_state SET change_seq = change_seq + 1 WHERE id = 1")
+        return self.seq(db)
+
+    def seq(self, db=None):
+        return (db or self._db()).execute("SELECT change_seq FROM dashboard_state WHERE id = 1").fetchone()[0]
+
+    # --- reads ---------------------------------------------------------------
+
+    def products(self, since=0):
+        """Products (with their offers) changed after sequence `since`; all of them for since=0."""
+        db = self._db()
+        rows = db.execute(f"SELECT {PRODUCT_FIELDS} FROM products WHERE change_seq > ? ORDER BY name, id",
+                          (since,)).fetchall()
+        if not rows:
+            return []
+        offers = {}
+        for r in db.execute(f"SELECT {OFFER_FIELDS} FROM offers WHERE product_id IN "
+                            f"({','.join('?' * len(rows))}) ORDER BY price_per_unit IS NULL, price_per_unit",
+                            [r[0] for r in rows]):
+            offers.setdefault(r[0], []).append(_offer(r))
+        return [_product(r, offers.get(r[0], [])) for r in rows]
+
+    def removed(self, since):
+        return [r[0] for r in self._db().execute("SELECT id FROM removed_products WHERE change_seq > ?", (since,))]
+
+    def product_for_token(self, tokens):
+        """Map RFQ thread tokens to product ids."""
+        tokens = [t for t in set(tokens) if t]
+        if not tokens:
+            return {}
+        return dict(self._db().execute(
+            f"SELECT thread_token, id FROM products WHERE thread_token IN ({','.join('?' * len(tokens))})", tokens))
+
+    # --- writes --------------------------------------------------------------
+
+    def upsert(self, products, replace=False):
+        """Insert or update products and their offers. With replace=True, products not listed are removed."""
+        db = self._db()
+        now = time.time()
+        with db:
+            seq = self._next_seq(db)
+            for p in products:
+                db.execute(
+                    "INSERT INTO products (id, name, category, quantity, unit, status, confirmed_offer_id, notes, "
+                    "thread_token, updated_at, change_seq) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET name = excluded.name, category = excluded.category, "
+                    "quantity = excluded.quantity, unit = excluded.unit, status = excluded.status, "
+                    "confirmed_offer_id = excluded.confirmed_offer_id, notes = excluded.notes, "
+                    "thread_token = excluded.thread_token, updated_at = excluded.updated_at, "
+                    "change_seq = excluded.change_seq",
+                    (p["id"], p["name"], p.get("category"), p.get("quantity"), p.get("unit"),
+                     p.get("status") or "negotiating", p.get("confirmedOfferId"), p.get("notes"),
+                     p.get("threadToken"), now, seq))
+                db.execute("DELETE FROM removed_products WHERE id = ?", (p["id"],))
+                if "offers" in p:
+                    db.execute("DELETE FROM offers WHERE product_id = ?", (p["id"],))
+                    db.executemany(
+                        f"INSERT INTO offers ({OFFER_FIELDS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        [(p["id"], o["id"], o["supplierName"], o.get("email"), o.get("website"),
+                          o.get("pricePerUnit"), o.get("minimumOrder"), o.get("leadTime"), o.get("freightTerms"),
+                          o.get("status") or "pending",
+                          json.dumps({k: v for k, v in o.items() if k not in OFFER_KEYS}), now)
+                         for o in p["offers"]])
+            if replace:
+                keep = [p["id"] for p in products]
+                gone = [r[0] for r in db.execute(
+                    f"SELECT id FROM products WHERE id NOT IN ({','.join('?' * len(keep))})", keep)]
+                self._remove(db, gone, seq)
+        return seq
+
+    def remove(self, product_ids):
+        db = self._db()
+        with db:
+            self._remove(db, product_ids, self._next_seq(db))
+
+    def _remove(self, db, product_ids, seq):
+        for pid in product_ids:
+            db.execute("DELETE FROM offers WHERE product_id = ?", (pid,))
+            if db.execute("DELETE FROM products WHERE id = ?", (pid,)).rowcount:
+                db.execute("INSERT OR REPLACE INTO removed_products (id, change_seq) VALUES (?, ?)", (pid, seq))
+
+    def confirm(self, product_id, offer_id):
+        """Confirm one offer for a product; returns the updated product, or None if either doesn't exist."""
+        db = self._db()
+        now = time.time()
+        with db:
+            if not db.execute("SELECT 1 FROM offers WHERE product_id = ? AND id = ?", (product_id, offer_id)).fetchone():
+                return None
+            seq = self._next_seq(db)
+            db.execute("UPDATE offers SET status = CASE WHEN id = ? THEN 'confirmed' "
+                       "WHEN status = 'confirmed' THEN 'outbid' ELSE status END, updated_at = ? "
+                       "WHERE product_id = ?", (offer_id, now, product_id))
+            db.execute("UPDATE products SET status = 'confirmed', confirmed_offer_id = ?, updated_at = ?, "
+                       "change_seq = ? WHERE id = ?", (offer_id, now, seq, product_id))
+        return next(p for p in self.products(seq - 1) if p["id"] == product_id)
+
+
+def inbox_item(message, product_id=None):
+    """Shape a MailStore message the way the dashboard inbox expects it."""
+    name, addr = parseaddr(message["from"] or "")
+    try:
+        received = parsedate_to_datetime(message["date"]).astimezone(timezone.utc)
+        received_at = received.isoformat().replace("+00:00", "Z")
+    except (TypeError, ValueError):
+        received_at = None
+    return {"id": f"message-{message['uid']}", "supplierName": name or addr or "Unknown sender",
+            "subject": message["subject"], "preview": message["snippet"], "receivedAt": received_at,
+            "relatedProductId": product_id, "threadToken": message.get("thread_token"),
+            "unread": not message["seen"]}
+
+
+def parse_version(version):
+    """'<dashboard seq>.<mail modseq>' -> (int, int); raises ValueError if malformed."""
+    dashboard, _, mail = (version or "").partition(".")
+    return int(dashboard), int(mail)
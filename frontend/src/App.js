@@ -1,7 +1,10 @@
-import { useCallback, useEffect, useMemo, useState } from 'react';
+import { useCallback, useEffect, useMemo, useRef, useState } from 'react';
 import axios from 'axios';
 import './App.css';
 
+// matches mailboxes.DEFAULT_STORE on the server
+const DEFAULT_STORE = 'default';
+
 const SURVEY_STEPS = [
   {
     id: 0,
@@ -242,13 +245,50 @@ function App() {
     return () => window.clearTimeout(timeout);
   }, [dashboardToast]);
 
+  // Version of the dashboard data we hold, so refreshes only download what changed.
+  const dashboardVersionRef = useRef(null);
+  const dashboardStateRef = useRef(dashboardState);
+  dashboardStateRef.current = dashboardState;
+
   const fetchDashboardData = useCallback(async () => {
     setDashboardStatus({ loading: true, error: '' });
     try {
-      const response = await axios.get('/api/dashboard');
-      const products = Array.isArray(response?.data?.products) ? response.data.products : [];
-      const inbox = Array.isArray(response?.data?.inbox) ? response.data.inbox : [];
+      const version = dashboardVersionRef.current;
+      const response = await axios.get('/api/dashboard', {
+        params: version ? { since: version } : {},
+        headers: version ? { 'If-None-Match': `"${version}"` } : {},
+        validateStatus: (status) => status === 200 || status === 304,
+      });
+
+      if (response.status === 304) {
+        setDashboardStatus({ loading: false, error: '' });
+        return true;
+      }
 
+      const data = response?.data || {};
+      const changedProducts = Array.isArray(data.products) ? data.products : [];
+      const changedInbox = Array.isArray(data.inbox) ? data.inbox : [];
+      let products = changedProducts;
+      let inbox = changedInbox;
+
+      if (!data.full && version) {
+        const current = dashboardStateRef.current;
+        const removedProducts = new Set(data.removedProducts || []);
+        const removedThreads = new Set(data.removedThreads || []);
+        const productUpdates = new Map(changedProducts.map((product) => [product.id, product]));
+        const inboxUpdates = new Map(changedInbox.map((thread) => [thread.id, thread]));
+
+        products = current.products
+          .filter((product) => !removedProducts.has(product.id) && !productUpdates.has(product.id))
+          .concat(changedProducts)
+          .sort((a, b) => a.name.localeCompare(b.name));
+        inbox = current.inbox
+          .filter((thread) => !removedThreads.has(thread.id) && !inboxUpdates.has(thread.id))
+          .concat(changedInbox)
+          .sort((a, b) => (b.receivedAt || '').localeCompare(a.receivedAt || ''));
+      }
+
+      dashboardVersionRef.current = data.version || null;
       setDashboardState({ products, inbox });
 
       if (products.length) {
@@ -266,6 +306,7 @@ function App() {
       const message =
         error?.response?.data?.message ||
         'Live agent data is unavailable right now. Showing the latest synced results.';
+      dashboardVersionRef.current = null;
       setDashboardState(FALLBACK_DASHBOARD);
       if (FALLBACK_DASHBOARD.products.length) {
         const fallbackProductId = FALLBACK_DASHBOARD.products[0].id;
@@ -285,6 +326,47 @@ function App() {
     fetchDashboardData();
   }, [appStage, fetchDashboardData, dashboardState.products.length]);
 
+  useEffect(() => {
+    if (appStage !== 'dashboard' || typeof window.EventSource === 'undefined') return undefined;
+
+    // New supplier mail is pushed by the server as soon as IMAP IDLE sees it.
+    const source = new window.EventSource('/email/events');
+    source.addEventListener('messages', (event) => {
+      let payload;
+      try {
+        payload = JSON.parse(event.data);
+      } catch (error) {
+        return;
+      }
+      // The stream carries every registered mailbox; this inbox shows the default store only.
+      const store = payload.store || DEFAULT_STORE;
+      if (store !== DEFAULT_STORE) return;
+      // Same id as the /api/dashboard inbox items, which are default-store only too.
+      const incoming = (payload.messages || []).map((message) => ({
+        id: `message-${message.uid}`,
+        supplierName: message.from,
+        subject: message.subject,
+        preview: message.snippet,
+        receivedAt: message.date ? new Date(message.date).toISOString() : new Date().toISOString(),
+        relatedProductId: null,
+        unread: true,
+      }));
+      if (!incoming.length) return;
+
+      setDashboardState((state) => {
+        const known = new Set(state.inbox.map((thread) => thread.id));
+        const fresh = incoming.filter((thread) => !known.has(thread.id));
+        return fresh.length ? { ...state, inbox: [...fresh, ...state.inbox] } : state;
+      });
+      setDashboardToast({
+        type: 'info',
+        message: `${incoming.length} new supplier ${incoming.length === 1 ? 'reply' : 'replies'} received.`,
+      });
+    });
+
+    return () => source.close();
+  }, [appStage]);
+
   const storeProfileValid = useMemo(() => {
     const emailPattern = /^[^\s@]+@[^\s@]+\.[^\s@]+$/;
     return (
@@ -330,6 +412,8 @@ function App() {
 
   const sortedOffers = useMemo(() => {
     if (!selectedProduct?.offers?.length) return [];
+    // Offers ranked by /api/offers/rank already arrive best first.
+    if (selectedProduct.offers.every((offer) => offer.score != null)) return selectedProduct.offers;
     return [...selectedProduct.offers].sort((a, b) => {
       if (a.pricePerUnit == null) return 1;
       if (b.pricePerUnit == null) return -1;
@@ -435,20 +519,47 @@ function App() {
     return suppliers.sort((a, b) => a.pricePerUnit - b.pricePerUnit);
   };
 
-  const handleSubmit = () => {
+  const fetchRankedOffers = async (item) => {
+    try {
+      const response = await axios.post('/api/offers/rank', {
+        product: item.productName,
+        quantity: Number(item.quantity),
+        unit: item.unit,
+        k: 10,
+      });
+      const slug = item.productName.toLowerCase().replace(/\s+/g, '-');
+      return (response?.data?.offers || []).map((offer) => ({
+        id: `offer-${slug}-${offer.supplier_id}`,
+        supplierName: offer.company_name,
+        email: offer.email || null,
+        website: offer.website || null,
+        pricePerUnit: offer.price,
+        minimumOrder: offer.moq,
+        leadTime: offer.lead_time_days != null ? `${offer.lead_time_days} days` : null,
+        freightTerms: null,
+        status: 'pending',
+        lastUpdated: new Date().toISOString(),
+        score: offer.score,
+      }));
+    } catch (error) {
+      return [];
+    }
+  };
+
+  const handleSubmit = async () => {
     setSubmissionState({ status: 'loading', message: 'Processing your request…' });
 
+    const items = inventoryItems.filter((item) => item.productName.trim() && Number(item.quantity) > 0);
+    const rankedOffers = await Promise.all(items.map(fetchRankedOffers));
+
     setTimeout(() => {
-      const products = inventoryItems
-        .filter((item) => item.productName.trim() && Number(item.quantity) > 0)
+      const products = items
         .map((item, index) => {
           const productId = `product-${item.productName.toLowerCase().replace(/\s+/g, '-')}-${index}`;
-          const offers = generateMockSuppliers(
-            item.productName,
-            item.targetPrice,
-            Number(item.quantity),
-            supplierContacts
-          );
+          // Fall back to sample offers when the catalog has nothing for this product.
+          const offers = rankedOffers[index].length
+            ? rankedOffers[index]
+            : generateMockSuppliers(item.productName, item.targetPrice, Number(item.quantity), supplierContacts);
 
           const statuses = ['negotiating', 'awaiting-response', 'counter-received'];
           const status = statuses[Math.floor(Math.random() * statuses.length)];
@@ -493,6 +604,9 @@ function App() {
         setSelectedProductId(products[0].id);
       }
 
+      // Persist the request so the dashboard endpoint serves it from now on.
+      axios.post('/api/inventory', { products, replace: true }).catch(() => {});
+
       setSubmissionState({
         status: 'success',
         message: 'Your request has been processed! Review supplier offers below.',
@@ -0,0 +1,24 @@
+import os, tempfile, multiprocessing
+
+# gunicorn -c gunicorn_conf.py asgi:app
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '5001')}")
+worker_class = "uvicorn.workers.UvicornWorker"
+# each worker is one event loop; mail I/O doesn't need a thread per request, so size by CPU.
+# Only one worker runs the IMAP sync; the others feed their SSE clients from the shared store
+# (EVENTS_POLL_INTERVAL) and /metrics merges every worker's snapshot from METRICS_DIR.
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+
+
+def on_starting(server):
+    # workers inherit the master's environment, so they all find the same directory
+    if workers > 1 and not os.getenv("METRICS_DIR"):
+        os.environ["METRICS_DIR"] = tempfile.mkdtemp(prefix="retail-agent-metrics-")
+# SSE clients keep connections open indefinitely; the keepalive comment every 15s isn't worker silence
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+# recycle workers now and then so slow leaks can't build up; jitter keeps them from restarting together
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "10000"))
+max_requests_jitter = max_requests // 10
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+loglevel = os.getenv("LOG_LEVEL", "info")
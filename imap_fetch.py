@@ -0,0 +1,306 @@
+import re, email, quopri, binascii
+from itertools import takewhile
+from email.header import decode_header
+from email.parser import BytesHeaderParser
+from metrics import MAIL_BYTES, phase
+
+HEADER_FIELDS = "FROM SUBJECT DATE MESSAGE-ID IN-REPLY-TO REFERENCES"
+SNIPPET_CHARS = 200
+
+_atom_end = re.compile(rb"[\s()\[\]{\"]")
+
+
+def _dec(h):
+    if not h: return ""
+    parts = decode_header(h)
+    out = []
+    for text, enc in parts:
+        out.append(text.decode(enc or "utf-8", "replace") if isinstance(text, bytes) else text)
+    return "".join(out)
+
+def _snippet(text):
+    return " ".join(text.split())[:SNIPPET_CHARS]
+
+
+def _fetch(M, uids, items):
+    with phase("imap", "fetch"):
+        typ, data = M.uid("fetch", uids, items)
+    _count(typ, data)
+    return typ, data
+
+async def _fetch_async(M, uids, items):
+    with phase("imap", "fetch"):
+        typ, data = await M.uid("fetch", uids, items)
+    _count(typ, data)
+    return typ, data
+
+def _count(typ, data):
+    if typ == "OK":
+        MAIL_BYTES.inc(sum(len(d[1]) for d in data if isinstance(d, tuple)), protocol="imap", direction="in")
+
+
+def compress_uids(uids):
+    """[b'7', b'3', b'4', b'5'] -> b'3:5,7' so large UID sets stay short on the wire."""
+    nums = sorted({int(u) for u in uids})
+    ranges, start = [], None
+    for i, n in enumerate(nums):
+        if start is None:
+            start = n
+        if i + 1 == len(nums) or nums[i + 1] != n + 1:
+            ranges.append(f"{start}:{n}" if n != start else str(n))
+            start = None
+    return ",".join(ranges).encode()
+
+
+# --- FETCH response parsing -------------------------------------------------
+
+def _tokenize(line, out):
+    i, n = 0, len(line)
+    while i < n:
+        c = line[i:i + 1]
+        if c.isspace():
+            i += 1
+        elif c == b"(":
+            out.append(_OPEN)
+            i += 1
+        elif c == b")":
+            out.append(_CLOSE)
+            i += 1
+        elif c == b'"':
+            j, buf = i + 1, bytearray()
+            while j < n and line[j:j + 1] != b'"':
+                if line[j:j + 1] == b"\\":
+                    j += 1
+                buf += line[j:j + 1]
+                j += 1
+            out.append(bytes(buf))
+            i = j + 1
+        elif c == b"{":
+            # literal marker; the literal itself arrives as the next tuple element
+            i = line.index(b"}", i) + 1
+        else:
+            m = _atom_end.search(line, i)
+            j = m.start() if m else n
+            if j < n and line[j:j + 1] == b"[":
+                # section spec such as BODY[HEADER.FIELDS (FROM)]<0> is one atom
+                j = line.index(b"]", j) + 1
+                if line[j:j + 1] == b"<":
+                    j = line.index(b">", j) + 1
+            atom = line[i:j]
+            out.append(None if atom.upper() == b"NIL" else _Atom(atom))
+            i = j
+
+
+class _Atom(bytes):
+    pass
+
+_OPEN, _CLOSE = object(), object()
+
+
+def _nest(tokens, pos):
+    items = []
+    while pos < len(tokens):
+        t = tokens[pos]
+        if t is _OPEN:
+            sub, pos = _nest(tokens, pos + 1)
+            items.append(sub)
+        elif t is _CLOSE:
+            return items, pos + 1
+        else:
+            items.append(t)
+            pos += 1
+    return items, pos
+
+
+def parse_fetch(data):
+    """Turn imaplib's FETCH data into [{b'UID': b'12', b'FLAGS': [...], ...}]."""
+    tokens = []
+    for item in data:
+        if isinstance(item, tuple):
+            _tokenize(item[0], tokens)
+            tokens.append(item[1])
+        elif item:
+            _tokenize(item, tokens)
+    flat, _ = _nest(tokens, 0)
+    out = []
+    for i in range(0, len(flat) - 1):
+        # "<seq> (key value key value ...)"
+        if isinstance(flat[i], _Atom) and flat[i].isdigit() and isinstance(flat[i + 1], list):
+            kv = flat[i + 1]
+            out.append({bytes(kv[j]).upper(): kv[j + 1] for j in range(0, len(kv) - 1, 2)})
+    return out
+
+
+def _section(r, prefix):
+    # servers differ in how they echo section specs back, so match on the prefix
+    for k, v in r.items():
+        if k.startswith(prefix):
+            return v or b""
+    return None
+
+
+# --- BODYSTRUCTURE ----------------------------------------------------------
+
+def _params(plist):
+    if not isinstance(plist, list):
+        return {}
+    return {bytes(plist[i]).lower(): bytes(plist[i + 1]) for i in range(0, len(plist) - 1, 2)}
+
+def find_text_part(bs, section=""):
+    """Return (section, transfer_encoding, charset) of the first inline text/plain part."""
+    if not isinstance(bs, list) or not bs:
+        return None
+    if isinstance(bs[0], list):
+        # child parts come first, then the multipart subtype and extension data
+        for i, child in enumerate(takewhile(lambda p: isinstance(p, list), bs)):
+            found = find_text_part(child, f"{section}.{i + 1}" if section else str(i + 1))
+            if found:
+                return found
+        return None
+    ctype = (bytes(bs[0] or b"") + b"/" + bytes(bs[1] or b"")).lower()
+    if ctype != b"text/plain":
+        return None
+    disposition = bs[9] if len(bs) > 9 and isinstance(bs[9], list) else None
+    if disposition and bytes(disposition[0] or b"").lower() == b"attachment":
+        return None
+    charset = _params(bs[2]).get(b"charset", b"utf-8").decode("ascii", "replace")
+    encoding = bytes(bs[5] or b"7bit").lower().decode("ascii", "replace")
+    return section or "1", encoding, charset
+
+def _decode_partial(raw, encoding, charset):
+    if encoding == "base64":
+        raw = re.sub(rb"\s+", b"", raw)
+        raw = raw[:len(raw) - len(raw) % 4]
+        try:
+            raw = binascii.a2b_base64(raw)
+        except binascii.Error:
+            raw = b""
+    elif encoding == "quoted-printable":
+        raw = quopri.decodestring(re.sub(rb"=[0-9A-Fa-f]?$", b"", raw))
+    try:
+        return raw.decode(charset, "replace")
+    except LookupError:
+        return raw.decode("utf-8", "replace")
+
+
+# --- fetch modes ------------------------------------------------------------
+
+def _summaries(uids, snippet_bytes):
+    # I/O-free core of fetch_summaries: yields (uid set, fetch items) and is sent
+    # back (typ, data), so the blocking and asyncio clients share the parsing
+    if not uids:
+        return []
+    typ, data = yield (compress_uids(uids),
+                       f"(UID FLAGS BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS ({HEADER_FIELDS})])")
+    if typ != "OK":
+        return []
+
+    by_uid, sections = {}, {}
+    with phase("imap", "parse"):
+        rows = parse_fetch(data)
+    for r in rows:
+        hdr = _section(r, b"BODY[HEADER.FIELDS")
+        if b"UID" not in r or hdr is None:
+            continue  # unsolicited FETCH (e.g. a flag change on another message)
+        uid = bytes(r[b"UID"])
+        msg = BytesHeaderParser().parsebytes(hdr)
+        flags = [bytes(f) for f in r.get(b"FLAGS") or []]
+        by_uid[uid] = {
+            "uid": uid.decode(),
+            "from": _dec(msg.get("From")),
+            "subject": _dec(msg.get("Subject")),
+            "date": msg.get("Date") or "",
+            "snippet": "",
+            "message_id": msg.get("Message-Id") or "",
+            "in_reply_to": msg.get("In-Reply-To") or "",
+            "references": " ".join((msg.get("References") or "").split()),
+            "seen": b"\\Seen" in flags,
+            "body": "",
+        }
+        part = find_text_part(r.get(b"BODYSTRUCTURE"))
+        if part:
+            sections.setdefault(part[0], []).append((uid, part[1], part[2]))
+
+    for section, members in sections.items():
+        typ, data = yield (compress_uids(u for u, _, _ in members),
+                           f"(UID BODY.PEEK[{section}]<0.{snippet_bytes}>)")
+        if typ != "OK":
+            continue
+        prefix = f"BODY[{section}]".encode()
+        with phase("imap", "parse"):
+            raw = {bytes(r[b"UID"]): _section(r, prefix) or b"" for r in parse_fetch(data) if b"UID" in r}
+        for uid, encoding, charset in members:
+            text = _decode_partial(raw.get(uid, b""), encoding, charset)
+            by_uid[uid]["body"] = text
+            by_uid[uid]["snippet"] = _snippet(text)
+
+    return [by_uid[u] for u in (bytes(u) for u in uids) if u in by_uid]
+
+
+def fetch_summaries(M, uids, snippet_bytes=2048):
+    """Headers + a byte-limited text snippet for `uids`, without downloading attachments.
+
+    One UID FETCH returns headers, flags and BODYSTRUCTURE for the whole set; a
+    second fetch per distinct text-part section (usually one or two) pulls the
+    first `snippet_bytes` of each message's text/plain part. Nothing is marked
+    \\Seen. Returns dicts in the order of `uids`.
+    """
+    steps = _summaries(uids, snippet_bytes)
+    try:
+        request = next(steps)
+        while True:
+            request = steps.send(_fetch(M, *request))
+    except StopIteration as done:
+        return done.value
+
+
+async def fetch_summaries_async(M, uids, snippet_bytes=2048):
+    """fetch_summaries() over an asyncio client whose `uid()` is a coroutine (see aiomail.AsyncIMAP)."""
+    steps = _summaries(uids, snippet_bytes)
+    try:
+        request = next(steps)
+        while True:
+            request = steps.send(await _fetch_async(M, *request))
+    except StopIteration as done:
+        return done.value
+
+
+def fetch_full(M, uids):
+    """Legacy mode: download each message with RFC822 and parse it locally."""
+    items = []
+    for uid in uids:
+        typ, msgdata = _fetch(M, uid, "(RFC822)")
+        if typ != "OK" or not msgdata or not msgdata[0]:
+            continue
+        raw = msgdata[0][1]
+        with phase("imap", "parse"):
+            msg = email.message_from_bytes(raw)
+
+        # extract a small text/plain snippet
+        snippet = ""
+        if msg.is_multipart():
+            for part in msg.walk():
+                if part.get_content_type() == "text/plain" and "attachment" not in str(part.get("Content-Disposition") or "").lower():
+                    payload = part.get_payload(decode=True) or b""
+                    snippet = _snippet(payload.decode(part.get_content_charset() or "utf-8", "replace"))
+                    break
+        else:
+            payload = msg.get_payload(decode=True) or b""
+            snippet = _snippet(payload.decode(msg.get_content_charset() or "utf-8", "replace"))
+
+        items.append({
+            "uid": uid.decode(),
+            "from": _dec(msg.get("From")),
+            "subject": _dec(msg.get("Subject")),
+            "date": msg.get("Date") or "",
+            "snippet": snippet,
+            "message_id": msg.get("Message-Id") or "",
+            "in_reply_to": msg.get("In-Reply-To") or "",
+        })
+    return items
+
+
+def store_flags(M, uids, flags=r"(\Seen)", op="+FLAGS"):
+    """Set flags on every UID in one UID STORE."""
+    if uids:
+        M.uid("store", compress_uids(uids), op, flags)
@@ -0,0 +1,160 @@
+import ssl, time, queue, select, asyncio, logging, threading
+
+log = logging.getLogger(__name__)
+
+
+class EventBroker:
+    """Fan-out of events to any number of subscriber queues (one per SSE client)."""
+
+    def __init__(self, maxsize=100):
+        self.maxsize = maxsize
+        self._subs = {}  # queue -> event loop, or None for a thread-side queue.Queue
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        q = queue.Queue(self.maxsize)
+        with self._lock:
+            self._subs[q] = None
+        return q
+
+    def subscribe_async(self):
+        """Subscribe from a running event loop; events arrive on an asyncio.Queue."""
+        q = asyncio.Queue(self.maxsize)
+        with self._lock:
+            self._subs[q] = asyncio.get_running_loop()
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subs.pop(q, None)
+
+    @staticmethod
+    def _offer(q, event):
+        try:
+            q.put_nowait(event)
+        except (queue.Full, asyncio.QueueFull):
+            pass  # a stalled client misses events rather than blocking everyone
+
+    def publish(self, event):
+        with self._lock:
+            subs = list(self._subs.items())
+        for q, loop in subs:
+            if loop is None:
+                self._offer(q, event)
+            else:
+                try:
+                    loop.call_soon_threadsafe(self._offer, q, event)
+                except RuntimeError:
+                    pass  # loop already closed
+
+    def __len__(self):
+        with self._lock:
+            return len(self._subs)
+
+
+class IdleListener(threading.Thread):
+    """Holds one IMAP session in IDLE and calls `on_change()` whenever the folder changes.
+
+    The session re-issues IDLE every `renew` seconds (servers drop IDLE after
+    ~30 minutes) and reconnects with backoff if the connection is lost. With
+    a `limiter`, the session holds one of `host`'s connection slots while open.
+    """
+
+    CHANGE_RESPONSES = (b"EXISTS", b"EXPUNGE", b"FETCH", b"RECENT")
+
+    def __init__(self, connect, on_change, mailbox="INBOX", renew=25 * 60, limiter=None, host=None,
+                 acquire_timeout=30.0):
+        super().__init__(daemon=True, name="imap-idle")
+        self.connect = connect
+        self.on_change = on_change
+        self.mailbox = mailbox
+        self.renew = renew
+        self.limiter = limiter
+        self.host = host
+        self.acquire_timeout = acquire_timeout
+        self._stopping = threading.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        backoff = 1
+        while not self._stopping.is_set():
+            M = None
+            held = False
+            try:
+                if self.limiter is not None:
+                    self.limiter.acquire(self.host, self.acquire_timeout)
+                    held = True
+                M = self.connect()
+                if "IDLE" not in M.capabilities:
+                    log.warning("IMAP server has no IDLE; relying on periodic sync")
+                    return
+                M.select(self.mailbox)
+                self.on_change()  # catch up on anything missed while disconnected
+                backoff = 1
+                while not self._stopping.is_set():
+                    if self._idle(M):
+                        self.on_change()
+            except Exception:
+                log.exception("IMAP IDLE session failed; reconnecting in %ss", backoff)
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, 60)
+            finally:
+                if M is not None:
+                    try:
+                        M.logout()
+                    except Exception:
+                        pass
+                if held:
+                    self.limiter.release(self.host)
+
+    def _readable(self, M, timeout):
+        # imaplib reads through the buffered M.file, and the SSL layer has its own buffer;
+        # a line already sitting in either never wakes select()
+        sock = M.sock
+        if self._buffered(M) or getattr(sock, "pending", lambda: 0)():
+            return True
+        return bool(select.select([sock], [], [], timeout)[0])
+
+    @staticmethod
+    def _buffered(M):
+        # peek() only reads the socket when its buffer is empty, and non-blocking that read just comes back empty
+        timeout = M.sock.gettimeout()
+        M.sock.setblocking(False)
+        try:
+            return bool(M.file.peek(1))
+        except (BlockingIOError, ssl.SSLWantReadError):
+            return False
+        finally:
+            M.sock.settimeout(timeout)
+
+    def _idle(self, M):
+        # imaplib grows idle() only in 3.14, so speak the protocol directly
+        tag = M._new_tag()
+        M.send(tag + b" IDLE\r\n")
+        line = M.readline()
+        if not line.startswith(b"+"):
+            raise M.abort(f"IDLE refused: {line!r}")
+
+        changed = False
+        deadline = time.monotonic() + self.renew
+        while not changed and not self._stopping.is_set() and time.monotonic() < deadline:
+            if not self._readable(M, 1.0):
+                continue
+            line = M.readline()
+            if not line:
+                raise M.abort("connection closed during IDLE")
+            parts = line.split(None, 3)
+            # "* 12 EXISTS", "* 3 EXPUNGE", "* 5 FETCH (FLAGS (...))"
+            if len(parts) >= 3 and parts[0] == b"*" and parts[2].upper() in self.CHANGE_RESPONSES:
+                changed = True
+
+        M.send(b"DONE\r\n")
+        while True:
+            line = M.readline()
+            if not line:
+                raise M.abort("connection closed while ending IDLE")
+            if line.startswith(tag):
+                break
+        return changed
@@ -0,0 +1,462 @@
+import re, time, base64, sqlite3, logging, threading
+from email.utils import getaddresses, parsedate_to_datetime
+from imap_fetch import fetch_summaries, store_flags, parse_fetch
+from metrics import phase
+
+log = logging.getLogger(__name__)
+
+RFQ_TOKEN = re.compile(r"\[RFQ:([^\]]+)\]")
+MSG_ID = re.compile(r"<[^<>\s]+>")
+FETCH_CHUNK = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sync_state (
+    mailbox       TEXT PRIMARY KEY,
+    uidvalidity   INTEGER,
+    uidnext       INTEGER,
+    synced_at     REAL,
+    highestmodseq INTEGER,
+    change_seq    INTEGER NOT NULL DEFAULT 0,
+    reset_seq     INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    mailbox      TEXT NOT NULL,
+    uid          INTEGER NOT NULL,
+    message_id   TEXT,
+    in_reply_to  TEXT,
+    refs         TEXT,
+    sender       TEXT,
+    subject      TEXT,
+    date         TEXT,
+    snippet      TEXT,
+    body         TEXT,
+    rfq_token    TEXT,
+    seen         INTEGER NOT NULL DEFAULT 0,
+    seen_pending INTEGER NOT NULL DEFAULT 0,
+    change_seq   INTEGER NOT NULL DEFAULT 0,
+    thread_id    TEXT,
+    UNIQUE (mailbox, uid)
+);
+CREATE TABLE IF NOT EXISTS sent (
+    mailbox     TEXT NOT NULL,
+    message_id  TEXT NOT NULL,
+    in_reply_to TEXT,
+    refs        TEXT,
+    sender      TEXT,
+    recipients  TEXT,
+    subject     TEXT,
+    date        TEXT,
+    snippet     TEXT,
+    rfq_token   TEXT,
+    thread_id   TEXT,
+    UNIQUE (mailbox, message_id)
+);
+-- union-find, kept flat: every Message-ID and "rfq:<token>" seen maps straight to its thread's root
+CREATE TABLE IF NOT EXISTS thread_keys (
+    mailbox   TEXT NOT NULL,
+    key       TEXT NOT NULL,
+    thread_id TEXT NOT NULL,
+    PRIMARY KEY (mailbox, key)
+);
+CREATE TABLE IF NOT EXISTS expunged (
+    mailbox    TEXT NOT NULL,
+    uid        INTEGER NOT NULL,
+    change_seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_token ON messages (mailbox, rfq_token, uid);
+CREATE INDEX IF NOT EXISTS messages_seen ON messages (mailbox, seen, uid);
+CREATE INDEX IF NOT EXISTS messages_change ON messages (mailbox, change_seq);
+CREATE INDEX IF NOT EXISTS expunged_change ON expunged (mailbox, change_seq);
+CREATE INDEX IF NOT EXISTS messages_thread ON messages (mailbox, thread_id);
+CREATE INDEX IF NOT EXISTS sent_thread ON sent (mailbox, thread_id);
+CREATE INDEX IF NOT EXISTS thread_keys_thread ON thread_keys (mailbox, thread_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (
+    subject, body, content='messages', content_rowid='rowid'
+);
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, subject, body) VALUES (new.rowid, new.subject, new.body);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, subject, body) VALUES ('delete', old.rowid, old.subject, old.body);
+END;
+"""
+
+# columns added after the first release, for stores created by older versions
+MIGRATIONS = {
+    "sync_state": [("highestmodseq", "INTEGER"), ("change_seq", "INTEGER NOT NULL DEFAULT 0"),
+                   ("reset_seq", "INTEGER NOT NULL DEFAULT 0")],
+    "messages": [("change_seq", "INTEGER NOT NULL DEFAULT 0"), ("thread_id", "TEXT")],
+}
+
+COLUMNS = "uid, sender, subject, date, snippet, message_id, in_reply_to, seen, rfq_token"
+
+
+class StaleCursor(ValueError):
+    pass
+
+
+def _row(r):
+    return {"uid": str(r[0]), "from": r[1], "subject": r[2], "date": r[3],
+            "snippet": r[4], "message_id": r[5], "in_reply_to": r[6], "seen": bool(r[7]), "thread_token": r[8]}
+
+def _sent_row(r):
+    return {"uid": None, "from": r[0], "to": r[1].split(", ") if r[1] else [], "subject": r[2], "date": r[3],
+            "snippet": r[4], "message_id": r[5], "in_reply_to": r[6], "seen": True, "thread_token": r[7],
+            "direction": "out"}
+
+def _when(date):
+    try:
+        return parsedate_to_datetime(date).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+def _thread_keys(message_id, in_reply_to, refs, rfq_token):
+    # everything that ties a message to a conversation: its own id, the ids it answers, and the RFQ tag
+    keys = MSG_ID.findall(" ".join(filter(None, (message_id, in_reply_to, refs))))
+    if rfq_token:
+        keys.append(f"rfq:{rfq_token}")
+    return list(dict.fromkeys(keys))
+
+def _fts_query(q):
+    # quote every term so user input can't trip FTS5 query syntax
+    return " ".join('"' + t.replace('"', '""') + '"' for t in q.split())
+
+
+class MailStore:
+    """SQLite copy of one IMAP folder, kept current by incremental `sync()` calls.
+
+    `connect` returns a logged-in imaplib connection. Reads never touch IMAP;
+    only `sync()` does, using UIDVALIDITY/UIDNEXT to fetch just the new UIDs.
+    Several accounts can share one database file; `account` keeps their rows apart.
+    """
+
+    def __init__(self, path, connect=None, mailbox="INBOX", snippet_bytes=2048, account=None):
+        self.path = path
+        self.connect = connect
+        self.folder = mailbox
+        # rows are keyed by this; a bare folder name keeps single-account stores readable as before
+        self.mailbox = f"{account}/{mailbox}" if account else mailbox
+        self.snippet_bytes = snippet_bytes
+        self._local = threading.local()
+        self._sync_lock = threading.Lock()
+        db = self._db()
+        with db:
+            for table, cols in MIGRATIONS.items():
+                have = {r[1] for r in db.execute(f"PRAGMA table_info({table})")}
+                for name, decl in cols:
+                    if have and name not in have:
+                        db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+        db.executescript(SCHEMA)
+        self._index_threads(db)
+
+    def __getstate__(self):
+        # sync child processes get their own SQLite handles and lock
+        state = dict(self.__dict__)
+        del state["_local"], state["_sync_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+        self._sync_lock = threading.Lock()
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    # --- reads ---------------------------------------------------------------
+
+    def _state(self, db):
+        r = db.execute("SELECT uidvalidity, uidnext, highestmodseq, change_seq, reset_seq FROM sync_state "
+                       "WHERE mailbox = ?", (self.mailbox,)).fetchone()
+        return r or (None, None, None, 0, 0)
+
+    def _next_seq(self, db):
+        # caller holds a write transaction; every batch of changes gets its own sequence number
+        db.execute("INSERT OR IGNORE INTO sync_state (mailbox) VALUES (?)", (self.mailbox,))
+        db.execute("UPDATE sync_state SET change_seq = change_seq + 1 WHERE mailbox = ?", (self.mailbox,))
+        return db.execute("SELECT change_seq FROM sync_state WHERE mailbox = ?", (self.mailbox,)).fetchone()[0]
+
+    # --- reads ---------------------------------------------------------------
+
+    def make_cursor(self, uid):
+        uidvalidity = self._state(self._db())[0]
+        return base64.urlsafe_b64encode(f"{uidvalidity}:{uid}".encode()).decode().rstrip("=")
+
+    def _cursor_uid(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+            uidvalidity, uid = (int(x) for x in raw.split(":"))
+        except ValueError:
+            raise StaleCursor("malformed cursor")
+        if uidvalidity != self._state(self._db())[0]:
+            raise StaleCursor("mailbox was rebuilt since this cursor was issued")
+        return uid
+
+    def query(self, unseen=False, thread_token=None, limit=10, q=None, cursor=None):
+        """Newest-first page of messages; returns (items, next_cursor)."""
+        sql = f"SELECT {COLUMNS} FROM messages WHERE mailbox = ?"
+        args = [self.mailbox]
+        if cursor:
+            sql += " AND uid < ?"
+            args.append(self._cursor_uid(cursor))
+        if unseen:
+            sql += " AND seen = 0"
+        if thread_token:
+            # the thread index also finds replies whose client dropped the [RFQ:...] tag
+            sql += " AND thread_id = (SELECT thread_id FROM thread_keys WHERE mailbox = ? AND key = ?)"
+            args += [self.mailbox, f"rfq:{thread_token}"]
+        if q:
+            sql += " AND rowid IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)"
+            args.append(_fts_query(q))
+        sql += " ORDER BY uid DESC LIMIT ?"
+        args.append(limit + 1)
+        items = [_row(r) for r in self._db().execute(sql, args)]
+        next_cursor = self.make_cursor(items[limit - 1]["uid"]) if len(items) > limit else None
+        return items[:limit], next_cursor
+
+    def changes(self, since):
+        """Messages added or re-flagged, and UIDs expunged, after change sequence `since`.
+
+        `reset` is true when the mailbox was rebuilt (UIDVALIDITY changed) since
+        then, in which case the caller should drop its copy and start over.
+        """
+        db = self._db()
+        _, _, _, current, reset_seq = self._state(db)
+        items = [_row(r) for r in db.execute(
+            f"SELECT {COLUMNS} FROM messages WHERE mailbox = ? AND change_seq > ? ORDER BY uid DESC",
+            (self.mailbox, since))]
+        expunged = [str(r[0]) for r in db.execute(
+            "SELECT uid FROM expunged WHERE mailbox = ? AND change_seq > ? ORDER BY uid DESC", (self.mailbox, since))]
+        return {"messages": items, "expunged": expunged, "modseq": current, "reset": since < reset_seq}
+
+    def modseq(self):
+        return self._state(self._db())[3]
+
+    def bodies(self, uids):
+        """Stored text (the first `snippet_bytes` of the body) for the given UIDs, keyed by UID."""
+        uids = [int(u) for u in uids]
+        if not uids:
+            return {}
+        rows = self._db().execute(
+            f"SELECT uid, body FROM messages WHERE mailbox = ? AND uid IN ({','.join('?' * len(uids))})",
+            [self.mailbox] + uids)
+        return {str(uid): body or "" for uid, body in rows}
+
+    def thread(self, token=None, message_id=None):
+        """The whole conversation an RFQ token or Message-ID belongs to, received and sent, oldest first.
+
+        Returns None when neither is known. Cost is the size of the thread,
+        not of the mailbox.
+        """
+        db = self._db()
+        key = f"rfq:{token}" if token else (MSG_ID.findall(message_id or "") or [None])[0]
+        row = db.execute("SELECT thread_id FROM thread_keys WHERE mailbox = ? AND key = ?",
+                         (self.mailbox, key)).fetchone()
+        if not row:
+            return None
+        thread_id = row[0]
+        received = [dict(_row(r), direction="in") for r in db.execute(
+            f"SELECT {COLUMNS} FROM messages WHERE mailbox = ? AND thread_id = ?", (self.mailbox, thread_id))]
+        sent = [_sent_row(r) for r in db.execute(
+            "SELECT sender, recipients, subject, date, snippet, message_id, in_reply_to, rfq_token FROM sent "
+            "WHERE mailbox = ? AND thread_id = ?", (self.mailbox, thread_id))]
+        items = sorted(received + sent, key=lambda m: (_when(m["date"]), int(m["uid"] or 0)))
+        tokens = sorted({m["thread_token"] for m in items if m["thread_token"]})
+        return {"thread_id": thread_id, "thread_tokens": tokens, "messages": items}
+
+    def record_sent(self, msg):
+        """Index an outgoing EmailMessage so its thread view includes our side of the conversation."""
+        subject = msg["Subject"] or ""
+        m = RFQ_TOKEN.search(subject)
+        token = m.group(1) if m else None
+        body = msg.get_body(("plain",))
+        snippet = body.get_content()[:self.snippet_bytes] if body is not None else ""
+        to = ", ".join(addr for _, addr in getaddresses(msg.get_all("To", []) + msg.get_all("Cc", [])))
+        db = self._db()
+        with db:
+            thread_id = self._link(db, _thread_keys(msg["Message-ID"], msg["In-Reply-To"], msg["References"], token))
+            db.execute("INSERT OR IGNORE INTO sent (mailbox, message_id, in_reply_to, refs, sender, recipients, "
+                       "subject, date, snippet, rfq_token, thread_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       (self.mailbox, msg["Message-ID"], msg["In-Reply-To"], msg["References"], msg["From"], to,
+                        subject, msg["Date"], snippet, token, thread_id))
+        return thread_id
+
+    def _link(self, db, keys):
+        # caller holds a write transaction. Union every thread the keys already belong to and
+        # return the root; the absorbed threads are repointed, so lookups stay one hop.
+        if not keys:
+            return None
+        found = {r[0] for r in db.execute(
+            f"SELECT DISTINCT thread_id FROM thread_keys WHERE mailbox = ? AND key IN ({','.join('?' * len(keys))})",
+            [self.mailbox] + keys)}
+        root = min(found) if found else keys[0]
+        merged = sorted(found - {root})
+        if merged:
+            marks = ",".join("?" * len(merged))
+            for table in ("thread_keys", "messages", "sent"):
+                db.execute(f"UPDATE {table} SET thread_id = ? WHERE mailbox = ? AND thread_id IN ({marks})",
+                           [root, self.mailbox] + merged)
+        db.executemany("INSERT OR IGNORE INTO thread_keys (mailbox, key, thread_id) VALUES (?, ?, ?)",
+                       [(self.mailbox, k, root) for k in keys])
+        return root
+
+    def _index_threads(self, db):
+        # messages stored before the thread index existed
+        rows = db.execute("SELECT uid, message_id, in_reply_to, refs, rfq_token FROM messages "
+                          "WHERE mailbox = ? AND thread_id IS NULL ORDER BY uid", (self.mailbox,)).fetchall()
+        if rows:
+            with db:
+                # one row at a time: a later row can merge threads, and _link only repoints rows already written
+                for r in rows:
+                    db.execute("UPDATE messages SET thread_id = ? WHERE mailbox = ? AND uid = ?",
+                               (self._link(db, _thread_keys(*r[1:])), self.mailbox, r[0]))
+
+    def synced_at(self):
+        r = self._db().execute("SELECT synced_at FROM sync_state WHERE mailbox = ?", (self.mailbox,)).fetchone()
+        return r[0] if r else None
+
+    def mark_seen(self, uids):
+        """Mark locally now; the flags are pushed to the server on the next sync."""
+        db = self._db()
+        with db:
+            seq = self._next_seq(db)
+            db.executemany("UPDATE messages SET seen = 1, seen_pending = 1, change_seq = ? "
+                           "WHERE mailbox = ? AND uid = ? AND seen = 0",
+                           [(seq, self.mailbox, int(u)) for u in uids])
+
+    # --- sync ----------------------------------------------------------------
+
+    def sync(self):
+        """Bring the store up to date; returns the newly stored messages."""
+        with self._sync_lock, phase("imap", "sync"):
+            M = self.connect()
+            try:
+                return self._sync(M)
+            finally:
+                try:
+                    M.logout()
+                except Exception:
+                    pass
+
+    def _sync(self, M):
+        db = self._db()
+        condstore = "CONDSTORE" in M.capabilities
+        typ, data = M.select(f"{self.folder} (CONDSTORE)" if condstore else self.folder)
+        if typ != "OK":
+            raise RuntimeError(f"cannot select {self.folder}: {data}")
+        exists = int(data[0] or 0)
+        uidvalidity = int(M.response("UIDVALIDITY")[1][0])
+        uidnext = M.response("UIDNEXT")[1][0]
+        uidnext = int(uidnext) if uidnext else None
+        highestmodseq = M.response("HIGHESTMODSEQ")[1][0]
+        highestmodseq = int(highestmodseq) if highestmodseq else None
+
+        old_uidvalidity, last_uidnext, old_modseq, _, _ = self._state(db)
+        last_uidnext = last_uidnext or 1
+        if old_uidvalidity is not None and old_uidvalidity != uidvalidity:
+            log.info("UIDVALIDITY changed for %s, resyncing from scratch", self.mailbox)
+            with db:
+                seq = self._next_seq(db)
+                db.execute("DELETE FROM messages WHERE mailbox = ?", (self.mailbox,))
+                db.execute("DELETE FROM expunged WHERE mailbox = ?", (self.mailbox,))
+                db.execute("UPDATE sync_state SET reset_seq = ? WHERE mailbox = ?", (seq, self.mailbox))
+            last_uidnext, old_modseq = 1, None
+
+        self._push_seen(M, db)
+        if last_uidnext > 1:
+            if condstore and old_modseq and highestmodseq:
+                # CONDSTORE: skip entirely when nothing changed, else fetch only what did
+                if highestmodseq != old_modseq:
+                    self._refresh_flags(M, db, last_uidnext, changedsince=old_modseq)
+            else:
+                self._refresh_flags(M, db, last_uidnext)
+
+        new = []
+        if uidnext is None or uidnext > last_uidnext:
+            with phase("imap", "search"):
+                typ, data = M.uid("search", None, "UID", f"{last_uidnext}:*")
+            uids = [u for u in (data[0].split() if typ == "OK" else []) if int(u) >= last_uidnext]
+            for i in range(0, len(uids), FETCH_CHUNK):
+                items = fetch_summaries(M, uids[i:i + FETCH_CHUNK], snippet_bytes=self.snippet_bytes)
+                self._insert(db, items)
+                new += items
+            if uidnext is None:
+                uidnext = max([int(u) for u in uids] + [last_uidnext - 1]) + 1
+
+        if condstore and highestmodseq:
+            # CHANGEDSINCE doesn't report expunges; EXISTS tells us whether any happened
+            local = db.execute("SELECT COUNT(*) FROM messages WHERE mailbox = ?", (self.mailbox,)).fetchone()[0]
+            if local > exists:
+                typ, data = M.uid("search", None, "ALL")
+                if typ == "OK":
+                    self._expunge_missing(db, {int(u) for u in data[0].split()})
+
+        with db:
+            db.execute("INSERT OR IGNORE INTO sync_state (mailbox) VALUES (?)", (self.mailbox,))
+            db.execute("UPDATE sync_state SET uidvalidity = ?, uidnext = ?, highestmodseq = ?, synced_at = ? "
+                       "WHERE mailbox = ?", (uidvalidity, uidnext, highestmodseq, time.time(), self.mailbox))
+        return new
+
+    def _push_seen(self, M, db):
+        uids = [str(r[0]) for r in db.execute(
+            "SELECT uid FROM messages WHERE mailbox = ? AND seen_pending = 1", (self.mailbox,))]
+        if uids:
+            store_flags(M, uids)
+            with db:
+                db.execute("UPDATE messages SET seen_pending = 0 WHERE mailbox = ? AND seen_pending = 1",
+                           (self.mailbox,))
+
+    def _refresh_flags(self, M, db, last_uidnext, changedsince=None):
+        # FLAGS only, so this stays cheap. A full sweep also finds expunged UIDs:
+        # they are simply missing from the reply.
+        args = ("(UID FLAGS)",) + ((f"(CHANGEDSINCE {changedsince})",) if changedsince else ())
+        with phase("imap", "fetch"):
+            typ, data = M.uid("fetch", f"1:{last_uidnext - 1}", *args)
+        if typ != "OK":
+            return
+        seen = {int(r[b"UID"]): b"\\Seen" in (r.get(b"FLAGS") or []) for r in parse_fetch(data) if b"UID" in r}
+        local = {r[0]: r[1] for r in db.execute(
+            "SELECT uid, seen FROM messages WHERE mailbox = ? AND seen_pending = 0", (self.mailbox,))}
+        changed = [(u, int(seen[u])) for u, s in local.items() if u in seen and bool(s) != seen[u]]
+        if changed:
+            with db:
+                seq = self._next_seq(db)
+                db.executemany("UPDATE messages SET seen = ?, change_seq = ? WHERE mailbox = ? AND uid = ?",
+                               [(s, seq, self.mailbox, u) for u, s in changed])
+        if changedsince is None:
+            self._expunge_missing(db, set(seen))
+
+    def _expunge_missing(self, db, server_uids):
+        gone = [r[0] for r in db.execute("SELECT uid FROM messages WHERE mailbox = ?", (self.mailbox,))
+                if r[0] not in server_uids]
+        if gone:
+            with db:
+                seq = self._next_seq(db)
+                db.executemany("DELETE FROM messages WHERE mailbox = ? AND uid = ?", [(self.mailbox, u) for u in gone])
+                db.executemany("INSERT INTO expunged (mailbox, uid, change_seq) VALUES (?, ?, ?)",
+                               [(self.mailbox, u, seq) for u in gone])
+
+    def _insert(self, db, items):
+        if not items:
+            return
+        with db:
+            seq = self._next_seq(db)
+            for it in items:
+                m = RFQ_TOKEN.search(it["subject"])
+                token = m.group(1) if m else None
+                # link and write each row before the next: a later message may merge this one's
+                # thread, and _link only repoints rows that are already in the table
+                thread_id = self._link(db, _thread_keys(it["message_id"], it["in_reply_to"], it["references"], token))
+                db.execute("INSERT OR IGNORE INTO messages (mailbox, uid, message_id, in_reply_to, refs, sender, "
+                           "subject, date, snippet, body, rfq_token, seen, change_seq, thread_id) "
+                           "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           (self.mailbox, int(it["uid"]), it["message_id"], it["in_reply_to"], it["references"],
+                            it["from"], it["subject"], it["date"], it["snippet"], it["body"],
+                            token, int(it["seen"]), seq, thread_id))
+
@@ -0,0 +1,300 @@
+import os, json, time, zlib, imaplib, logging, threading
+import multiprocessing as mp
+from contextlib import contextmanager
+from metrics import phase
+
+log = logging.getLogger(__name__)
+
+DEFAULT_STORE = "default"
+RUNNING = float("inf")
+
+
+class UnknownMailbox(KeyError):
+    pass
+
+
+class HostBusy(Exception):
+    pass
+
+
+class Mailbox:
+    """One store's RFQ inbox: where it lives and how to log in."""
+
+    def __init__(self, store, host, user, password, port=993, folder="INBOX"):
+        self.store = store
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.folder = folder
+
+    @classmethod
+    def from_dict(cls, d):
+        # "password_env" keeps secrets out of the registry file
+        password = d.get("password") or os.getenv(d.get("password_env") or "")
+        return cls(str(d["store"]), d["imap_host"], d["user"], password,
+                   port=int(d.get("imap_port", 993)), folder=d.get("folder", "INBOX"))
+
+    def __repr__(self):
+        return f"Mailbox({self.store!r}, {self.user!r} @ {self.host})"
+
+
+class TimedIMAP4_SSL(imaplib.IMAP4_SSL):
+    # IMAP4_SSL connects and handshakes in one call; split it so both phases show up
+    def _create_socket(self, timeout):
+        with phase("imap", "connect"):
+            sock = imaplib.IMAP4._create_socket(self, timeout)
+        with phase("imap", "tls"):
+            return self.ssl_context.wrap_socket(sock, server_hostname=self.host)
+
+def imap_connect(mailbox, timeout=30.0):
+    M = TimedIMAP4_SSL(mailbox.host, mailbox.port, timeout=timeout)
+    try:
+        with phase("imap", "auth"):
+            M.login(mailbox.user, mailbox.password)
+    except Exception:
+        M.shutdown()
+        raise
+    return M
+
+
+class MailboxRegistry:
+    """Mailboxes by store id, loaded from a JSON list like
+    `[{"store": "s12", "imap_host": "...", "user": "...", "password_env": "S12_PASS"}]`.
+    """
+
+    def __init__(self, mailboxes=()):
+        self._boxes = {}
+        self._lock = threading.Lock()
+        for mb in mailboxes:
+            self.add(mb)
+
+    @classmethod
+    def load(cls, path, default=None):
+        boxes = [default] if default else []
+        if path and os.path.exists(path):
+            with open(path) as f:
+                boxes += [Mailbox.from_dict(d) for d in json.load(f)]
+        return cls(boxes)
+
+    def add(self, mailbox):
+        with self._lock:
+            self._boxes[mailbox.store] = mailbox
+
+    def get(self, store):
+        try:
+            return self._boxes[store]
+        except KeyError:
+            raise UnknownMailbox(store) from None
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._boxes.values()))
+
+    def __len__(self):
+        return len(self._boxes)
+
+
+class HostLimiter:
+    """Caps concurrent IMAP sessions per server host, shared by sync workers and live requests."""
+
+    def __init__(self, limit=4):
+        self.limit = limit
+        self._active = {}
+        self._cond = threading.Condition()
+
+    # free() and take() expect the caller to hold _cond
+    def free(self, host):
+        return self._active.get(host, 0) < self.limit
+
+    def take(self, host):
+        self._active[host] = self._active.get(host, 0) + 1
+
+    def acquire(self, host, timeout=None):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.free(host), timeout):
+                raise HostBusy(f"no IMAP session free for {host} after {timeout}s")
+            self.take(host)
+
+    def release(self, host):
+        with self._cond:
+            self._active[host] -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, host, timeout=30.0):
+        self.acquire(host, timeout)
+        try:
+            yield
+        finally:
+            self.release(host)
+
+    def stats(self):
+        with self._cond:
+            return dict(self._active)
+
+
+class SyncScheduler:
+    """Syncs many MailStores on a fixed pool of worker threads.
+
+    Each store is due `interval` seconds after its last sync (sooner when
+    kicked, later with backoff after a failure). A free worker takes the
+    longest-overdue store whose IMAP host is under its connection limit, so
+    a slow or saturated host holds back only its own mailboxes.
+
+    With `processes` > 1 the stores are sharded by store id across spawned
+    child processes, each running its own scheduler. The children and this
+    process's live requests split the limiter's per-host budget, and new
+    messages are relayed back so `on_new` still runs here. The budget is per
+    parent process: separate server processes each have their own.
+    """
+
+    def __init__(self, stores, hosts, limiter=None, workers=4, interval=30.0, max_backoff=600.0,
+                 on_new=None, processes=0):
+        self.stores = dict(stores)  # store id -> MailStore
+        self.hosts = dict(hosts)  # store id -> IMAP host
+        self.limiter = limiter or HostLimiter()
+        self.workers = workers
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.on_new = on_new
+        self.processes = processes
+        self._due = {sid: 0.0 for sid in self.stores}
+        self._failures = {}
+        self._running = set()
+        self._cond = self.limiter._cond  # shared, so a live request releasing a host slot wakes the workers
+        self._started = False
+        self._children = []  # [(process, kick queue)] in process mode
+        self._budget = self.limiter.limit
+
+    # --- public ---------------------------------------------------------------
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        if self.processes > 1:
+            self._spawn()
+            return
+        for i in range(self.workers):
+            threading.Thread(target=self._work, daemon=True, name=f"mail-sync-{i}").start()
+
+    def kick(self, store=DEFAULT_STORE):
+        """Sync `store` as soon as a worker and a host slot are free."""
+        if self._children:
+            _, q = self._children[self._shard(store)]
+            q.put(store)
+            return
+        with self._cond:
+            if store in self._due:
+                self._due[store] = 0.0
+                self._cond.notify_all()
+
+    def stats(self):
+        if self._children:
+            # the per-store state lives in the child processes
+            return {"stores": len(self.stores), "processes": len(self._children)}
+        with self._cond:
+            now = time.monotonic()
+            return {"stores": len(self.stores), "processes": 0, "running": len(self._running),
+                    "overdue": sum(d <= now for sid, d in self._due.items() if sid not in self._running),
+                    "failing": len(self._failures)}
+
+    # --- threads --------------------------------------------------------------
+
+    def _pick(self):
+        # caller holds _cond; earliest-due wins, skipping stores whose host is at its limit
+        now = time.monotonic()
+        best, wake = None, None
+        for sid, due in self._due.items():
+            if sid in self._running:
+                continue
+            if due > now:
+                wake = due if wake is None else min(wake, due)
+            elif self.limiter.free(self.hosts[sid]) and (best is None or due < self._due[best]):
+                best = sid
+        return best, wake
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while True:
+                    sid, wake = self._pick()
+                    if sid is not None:
+                        break
+                    self._cond.wait(None if wake is None else max(0.0, wake - time.monotonic()))
+                host = self.hosts[sid]
+                self._running.add(sid)
+                self._due[sid] = RUNNING
+                self.limiter.take(host)
+            new = None
+            try:
+                new = self.stores[sid].sync()
+                self._failures.pop(sid, None)
+                delay = self.interval
+            except Exception:
+                n = self._failures[sid] = self._failures.get(sid, 0) + 1
+                delay = min(self.interval * 2 ** n, self.max_backoff)
+                log.exception("mail sync failed for %s; retrying in %.0fs", sid, delay)
+            finally:
+                self.limiter.release(host)
+                with self._cond:
+                    self._running.discard(sid)
+                    # a kick that landed mid-sync reset due to 0 and still gets its own run
+                    if self._due[sid] == RUNNING:
+                        self._due[sid] = time.monotonic() + delay
+                    self._cond.notify_all()
+            # a failing callback is not a failed sync; don't back the store off for it
+            if new and self.on_new:
+                try:
+                    self.on_new(sid, new)
+                except Exception:
+                    log.exception("mail sync callback failed for %s", sid)
+
+    # --- processes ------------------------------------------------------------
+
+    def _shard(self, store):
+        return zlib.crc32(store.encode()) % self.processes
+
+    def _spawn(self):
+        # spawn, not fork: the parent already runs threads (outbox sender, server pools) whose
+        # locks a forked child would inherit mid-use. Stores and Mailboxes pickle across.
+        ctx = mp.get_context("spawn")
+        shards = [{} for _ in range(self.processes)]
+        for sid, store in self.stores.items():
+            shards[self._shard(sid)][sid] = store
+        # the children and this process's live requests split one per-host budget
+        limit = max(1, (self.limiter.limit - 1) // self.processes)
+        with self._cond:
+            self.limiter.limit = max(1, self.limiter.limit - limit * self.processes)
+        if limit * self.processes + self.limiter.limit > self._budget:
+            log.warning("IMAP host limit %d is below %d sync processes + 1; each host may see %d sessions",
+                        self._budget, self.processes, limit * self.processes + self.limiter.limit)
+        self._new = ctx.Queue() if self.on_new else None
+        for i, shard in enumerate(shards):
+            kicks = ctx.Queue()
+            p = ctx.Process(target=_run_shard, daemon=True, name=f"mail-sync-{i}",
+                            args=(shard, {sid: self.hosts[sid] for sid in shard}, limit, self.workers,
+                                  self.interval, self.max_backoff, self._new, kicks))
+            p.start()
+            self._children.append((p, kicks))
+        if self._new is not None:
+            threading.Thread(target=self._relay, daemon=True, name="mail-sync-relay").start()
+
+    def _relay(self):
+        while True:
+            sid, new = self._new.get()
+            try:
+                self.on_new(sid, new)
+            except Exception:
+                log.exception("mail sync callback failed for %s", sid)
+
+
+def _run_shard(shard, hosts, limit, workers, interval, max_backoff, new, kicks):
+    # entry point of a sync child process
+    on_new = (lambda sid, items: new.put((sid, items))) if new is not None else None
+    child = SyncScheduler(shard, hosts, HostLimiter(limit), workers=workers, interval=interval,
+                          max_backoff=max_backoff, on_new=on_new)
+    child.start()
+    while True:
+        child.kick(kicks.get())
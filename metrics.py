@@ -0,0 +1,323 @@
+import sys, time, bisect, logging, threading, traceback
+from collections import Counter as _Tally, deque
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+# seconds; covers a cached SQLite read up to a slow Bedrock completion
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+def _num(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self, values=None):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        if values is None:
+            with self._lock:
+                values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines += self._samples(key, value)
+        return lines
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def combine(self, a, b):
+        return a + b
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_labels(self.labelnames, key)} {_num(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), aggregate="sum"):
+        super().__init__(name, help, labelnames)
+        # across worker processes: "sum" for per-process state, "max" for values every worker reads
+        # from the same shared store
+        self.aggregate = aggregate
+
+    def combine(self, a, b):
+        return a + b if self.aggregate == "sum" else max(a, b)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), [list(counts), total]] for key, (counts, total) in self._values.items()]
+
+    def combine(self, a, b):
+        return [x + y for x, y in zip(a[0], b[0])], a[1] + b[1]
+
+    def _samples(self, key, value):
+        counts, total = value
+        lines, running = [], 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            running += n
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _num(bound))])} {running}")
+        lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_num(total)}")
+        lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {running}")
+        return lines
+
+
+class Registry:
+    """Named metrics plus collectors that refresh gauges at scrape time."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _add(self, cls, name, help, labelnames=(), **kw):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, help, labelnames, **kw)
+            return self._metrics[name]
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=(), aggregate="sum"):
+        return self._add(Gauge, name, help, labelnames, aggregate=aggregate)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram, name, help, labelnames, buckets=buckets)
+
+    def collector(self, fn):
+        """Register `fn()` to run before every render, e.g. to copy pool stats into gauges."""
+        self._collectors.append(fn)
+        return fn
+
+    def _collect(self):
+        for fn in list(self._collectors):
+            try:
+                fn()
+            except Exception:
+                log.exception("metrics collector %s failed", getattr(fn, "__name__", fn))
+        with self._lock:
+            return [self._metrics[n] for n in sorted(self._metrics)]
+
+    def render(self):
+        return "\n".join(line for m in self._collect() for line in m.render()) + "\n"
+
+    def snapshot(self):
+        """Current values as JSON-friendly lists, for merging across worker processes."""
+        return {m.name: m.snapshot() for m in self._collect()}
+
+    def render_merged(self, snapshots):
+        """Render the combination of several `snapshot()`s: counters and histograms add up,
+        gauges follow their `aggregate`."""
+        with self._lock:
+            metrics = [self._metrics[n] for n in sorted(self._metrics)]
+        lines = []
+        for m in metrics:
+            merged = {}
+            for snap in snapshots:
+                for key, value in snap.get(m.name, ()):
+                    key = tuple(key)
+                    merged[key] = m.combine(merged[key], value) if key in merged else value
+            lines += m.render(merged)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+MAIL_PHASE = REGISTRY.histogram("mail_phase_seconds", "Time spent per SMTP/IMAP phase", ("protocol", "phase"))
+MAIL_ERRORS = REGISTRY.counter("mail_errors_total", "SMTP/IMAP phases that raised", ("protocol", "phase"))
+MAIL_BYTES = REGISTRY.counter("mail_bytes_total", "Message bytes sent over SMTP or fetched over IMAP",
+                              ("protocol", "direction"))
+HTTP_REQUESTS = REGISTRY.histogram("http_request_seconds", "Flask request latency",
+                                   ("method", "endpoint", "status"))
+
+
+@contextmanager
+def phase(protocol, name):
+    """Time one SMTP/IMAP phase; exceptions are counted and re-raised."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        MAIL_ERRORS.inc(protocol=protocol, phase=name)
+        raise
+    finally:
+        MAIL_PHASE.observe(time.perf_counter() - start, protocol=protocol, phase=name)
+
+
+# --- listeners for the search/ modules --------------------------------------
+# search/agent.py and search/search.py stay importable on their own, so they
+# publish events through add_listener() instead of importing this module.
+
+BEDROCK_SECONDS = REGISTRY.histogram("bedrock_request_seconds", "Bedrock invoke_model latency", ("model",))
+BEDROCK_REQUESTS = REGISTRY.counter("bedrock_requests_total", "Bedrock calls by outcome", ("model", "status"))
+BEDROCK_TOKENS = REGISTRY.counter("bedrock_tokens_total", "Bedrock tokens by kind", ("model", "kind"))
+BEDROCK_BYTES = REGISTRY.counter("bedrock_bytes_total", "Bedrock request/response body bytes", ("direction",))
+BEDROCK_RETRIES = REGISTRY.counter("bedrock_retries_total", "Bedrock batch retries", ("model", "code"))
+BEDROCK_CACHE = REGISTRY.counter("bedrock_cache_total", "Bedrock ResponseCache lookups", ("result",))
+SERPER_SECONDS = REGISTRY.histogram("serper_request_seconds", "Serper HTTP latency")
+SERPER_REQUESTS = REGISTRY.counter("serper_requests_total", "Serper HTTP calls by outcome", ("status",))
+SERPER_BYTES = REGISTRY.counter("serper_response_bytes_total", "Serper response body bytes")
+SERPER_CACHE = REGISTRY.counter("serper_cache_total", "Serper lookups by how they were served", ("result",))
+
+TOKEN_KINDS = {"input_tokens": "input", "output_tokens": "output",
+               "cache_read_input_tokens": "cache_read", "cache_creation_input_tokens": "cache_creation"}
+
+
+def bedrock_listener(event, data):
+    model = data.get("model", "")
+    if event == "request":
+        BEDROCK_SECONDS.observe(data["seconds"], model=model)
+        BEDROCK_REQUESTS.inc(model=model, status=data.get("error") or "ok")
+        BEDROCK_BYTES.inc(data.get("request_bytes", 0), direction="out")
+        BEDROCK_BYTES.inc(data.get("response_bytes", 0), direction="in")
+    elif event == "usage":
+        if data.get("cache_hit") is not None:
+            BEDROCK_CACHE.inc(result="hit" if data["cache_hit"] else "miss")
+        if not data.get("cache_hit"):
+            # a cache hit cost no tokens
+            for field, kind in TOKEN_KINDS.items():
+                if data["usage"].get(field):
+                    BEDROCK_TOKENS.inc(data["usage"][field], model=model, kind=kind)
+    elif event == "retry":
+        BEDROCK_RETRIES.inc(model=model, code=data.get("code") or "")
+
+def search_listener(event, data):
+    if event == "request":
+        SERPER_SECONDS.observe(data["seconds"])
+        SERPER_REQUESTS.inc(status=data.get("status") or "error")
+        SERPER_BYTES.inc(data.get("response_bytes", 0))
+    elif event == "lookup":
+        SERPER_CACHE.inc(result=data["result"])
+
+
+# --- slow request profiler --------------------------------------------------
+
+class SlowRequestProfiler:
+    """Opt-in sampling profiler: keeps stack samples for requests slower than `threshold`.
+
+    While any request is being tracked, one daemon thread snapshots the tracked
+    threads' stacks every `interval` seconds (sys._current_frames, so nothing is
+    injected into the request itself). When a request finishes over the
+    threshold its most frequent stacks are logged and kept in `recent`.
+    """
+
+    def __init__(self, threshold=1.0, interval=0.005, depth=30, top=10, keep=20):
+        self.threshold = threshold
+        self.interval = interval
+        self.depth = depth
+        self.top = top
+        self.recent = deque(maxlen=keep)
+        self._active = {}  # thread id -> Counter of stacks
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        tid = threading.get_ident()
+        with self._lock:
+            self._active[tid] = _Tally()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample, daemon=True, name="profiler")
+                self._thread.start()
+        self._wake.set()
+        return tid
+
+    def stop(self, tid, elapsed, label):
+        with self._lock:
+            samples = self._active.pop(tid, None)
+        if not samples or elapsed < self.threshold:
+            return None
+        total = sum(samples.values())
+        report = {"request": label, "seconds": round(elapsed, 3), "samples": total,
+                  "stacks": [{"share": round(n / total, 3), "stack": list(stack)}
+                             for stack, n in samples.most_common(self.top)]}
+        self.recent.append(report)
+        log.warning("slow request %s took %.3fs; hottest stack (%d%% of %d samples):\n  %s", label, elapsed,
+                    100 * report["stacks"][0]["share"], total, "\n  ".join(report["stacks"][0]["stack"]))
+        return report
+
+    def _sample(self):
+        while True:
+            self._wake.wait()
+            with self._lock:
+                if not self._active:
+                    self._wake.clear()
+                    continue
+                tids = list(self._active)
+            frames = sys._current_frames()
+            for tid in tids:
+                frame = frames.get(tid)
+                if frame is None:
+                    continue
+                stack = tuple(f"{fs.name} ({fs.filename.rsplit('/', 1)[-1]}:{fs.lineno})"
+                              for fs in traceback.extract_stack(frame, limit=self.depth))
+                with self._lock:
+                    if tid in self._active:
+                        self._active[tid][stack] += 1
+            time.sleep(self.interval)
@@ -0,0 +1,188 @@
+import json, time, uuid, random, smtplib, sqlite3, logging, threading
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import getaddresses
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id              TEXT PRIMARY KEY,
+    message_id      TEXT NOT NULL UNIQUE,
+    sender          TEXT,
+    recipients      TEXT NOT NULL,
+    subject         TEXT,
+    raw             BLOB NOT NULL,
+    status          TEXT NOT NULL,
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error      TEXT,
+    created_at      REAL NOT NULL,
+    updated_at      REAL NOT NULL,
+    sent_at         REAL,
+    refused         TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, next_attempt_at);
+"""
+
+# columns added since the first release: (name, declaration)
+MIGRATIONS = [("refused", "TEXT")]
+
+JOB_FIELDS = "id, message_id, recipients, subject, status, attempts, next_attempt_at, last_error, created_at, sent_at, refused"
+
+
+def _job(r):
+    return {"job_id": r[0], "message_id": r[1], "to": json.loads(r[2]), "subject": r[3], "status": r[4],
+            "attempts": r[5], "next_attempt_at": r[6], "last_error": r[7], "created_at": r[8], "sent_at": r[9],
+            "refused": json.loads(r[10]) if r[10] else {}}
+
+def _permanent(e):
+    # 5xx replies won't get better by retrying; 4xx and dropped connections might
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in e.recipients.values())
+    if isinstance(e, smtplib.SMTPResponseException):
+        return e.smtp_code >= 500
+    return False
+
+
+class Outbox:
+    """Durable SQLite queue of outgoing messages, deduplicated by Message-ID.
+
+    Jobs move queued -> sending -> sent, or back to queued with a backoff
+    delay on a transient error, or to failed once retries are exhausted. A
+    send the server accepted for only some recipients ends as partial, with
+    the refused addresses kept on the job. A job stuck in `sending` (the
+    process died mid-send) becomes due again after `lease` seconds.
+    """
+
+    def __init__(self, path, lease=300.0):
+        self.path = path
+        self.lease = lease
+        self._local = threading.local()
+        db = self._db()
+        with db:
+            have = {r[1] for r in db.execute("PRAGMA table_info(jobs)")}
+            for name, decl in MIGRATIONS:
+                if have and name not in have:
+                    db.execute(f"ALTER TABLE jobs ADD COLUMN {name} {decl}")
+        db.executescript(SCHEMA)
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=FULL")
+            self._local.db = db
+        return db
+
+    def enqueue(self, msg):
+        """Queue an EmailMessage; returns (job, created). Re-enqueueing a Message-ID returns the existing job."""
+        db = self._db()
+        now = time.time()
+        to = [addr for _, addr in getaddresses(msg.get_all("To", []) + msg.get_all("Cc", []))]
+        job_id = uuid.uuid4().hex
+        cur = db.execute(
+            "INSERT OR IGNORE INTO jobs (id, message_id, sender, recipients, subject, raw, status, "
+            "next_attempt_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+            (job_id, msg["Message-ID"], msg["From"], json.dumps(to), msg["Subject"],
+             msg.as_bytes(policy=msg.policy.clone(linesep="\r\n")), now, now, now))
+        job = self.get_by_message_id(msg["Message-ID"])
+        return job, cur.rowcount == 1
+
+    def get(self, job_id):
+        r = self._db().execute(f"SELECT {JOB_FIELDS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job(r) if r else None
+
+    def get_by_message_id(self, message_id):
+        r = self._db().execute(f"SELECT {JOB_FIELDS} FROM jobs WHERE message_id = ?", (message_id,)).fetchone()
+        return _job(r) if r else None
+
+    def claim(self, limit):
+        """Lease up to `limit` due jobs to the caller: [(job_id, sender, recipients, raw, attempts)]."""
+        db = self._db()
+        now = time.time()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = db.execute(
+                "SELECT id, sender, recipients, raw, attempts FROM jobs "
+                "WHERE status IN ('queued', 'sending') AND next_attempt_at <= ? "
+                "ORDER BY next_attempt_at LIMIT ?", (now, limit)).fetchall()
+            db.executemany("UPDATE jobs SET status = 'sending', next_attempt_at = ?, updated_at = ? WHERE id = ?",
+                           [(now + self.lease, now, r[0]) for r in rows])
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return [(r[0], r[1], json.loads(r[2]), r[3], r[4]) for r in rows]
+
+    def mark_sent(self, job_id, refused=None):
+        """`refused` is sendmail's {address: (code, reply)} for recipients the server rejected."""
+        now = time.time()
+        status = "partial" if refused else "sent"
+        refused = json.dumps({addr: [code, reply.decode(errors="replace") if isinstance(reply, bytes) else reply]
+                              for addr, (code, reply) in refused.items()}) if refused else None
+        self._db().execute("UPDATE jobs SET status = ?, attempts = attempts + 1, sent_at = ?, updated_at = ?, "
+                           "last_error = NULL, refused = ? WHERE id = ?", (status, now, now, refused, job_id))
+
+    def mark_retry(self, job_id, error, delay):
+        now = time.time()
+        self._db().execute("UPDATE jobs SET status = 'queued', attempts = attempts + 1, next_attempt_at = ?, "
+                           "last_error = ?, updated_at = ? WHERE id = ?", (now + delay, error, now, job_id))
+
+    def mark_failed(self, job_id, error):
+        now = time.time()
+        self._db().execute("UPDATE jobs SET status = 'failed', attempts = attempts + 1, last_error = ?, "
+                           "updated_at = ? WHERE id = ?", (error, now, job_id))
+
+    def counts(self):
+        return dict(self._db().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+class OutboxSender(threading.Thread):
+    """Drains the outbox in batches over an SMTPPool, retrying with jittered exponential backoff."""
+
+    def __init__(self, outbox, pool, batch_size=20, workers=4, max_attempts=6,
+                 base_delay=2.0, max_delay=600.0, poll_interval=5.0):
+        super().__init__(daemon=True, name="outbox-sender")
+        self.outbox = outbox
+        self.pool = pool
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="outbox")
+        self._wake = threading.Event()
+
+    def kick(self):
+        self._wake.set()
+
+    def run(self):
+        while True:
+            try:
+                jobs = self.outbox.claim(self.batch_size)
+            except Exception:
+                log.exception("outbox claim failed")
+                jobs = []
+            if jobs:
+                list(self._executor.map(self._send, jobs))
+                continue  # keep draining while there is work
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _send(self, job):
+        job_id, sender, recipients, raw, attempts = job
+        try:
+            refused = self.pool.sendmail(sender, recipients, raw)
+        except Exception as e:
+            attempts += 1
+            if _permanent(e) or attempts >= self.max_attempts:
+                log.warning("outbox job %s failed permanently: %s", job_id, e)
+                self.outbox.mark_failed(job_id, str(e))
+            else:
+                delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+                self.outbox.mark_retry(job_id, str(e), delay * random.uniform(0.5, 1.0))
+            return
+        if refused:
+            log.warning("outbox job %s refused for %s", job_id, ", ".join(refused))
+        self.outbox.mark_sent(job_id, refused)
@@ -0,0 +1,244 @@
+import re, json, time, hashlib, sqlite3, logging, threading
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS quotes (
+    message_id TEXT PRIMARY KEY,
+    source     TEXT NOT NULL,
+    quote      TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+UNIT = (r"kgs?|kilo(?:gram)?s?|lbs?|pounds?|tons?|tonnes?|mt|cases?|cartons?|units?|pcs|pieces?|pallets?|"
+        r"liters?|litres?|l|gallons?|bags?|boxes?|dozen|each|ea")
+AMOUNT = r"\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?"
+
+PRICE = re.compile(
+    rf"(?:(?P<cur>US\$|\$|€|£|USD|EUR|GBP)\s?(?P<amount>{AMOUNT})|(?P<amount2>{AMOUNT})\s?(?P<cur2>USD|EUR|GBP|dollars?))"
+    rf"(?:\s*(?:/|per|a|an)\s*(?P<unit>{UNIT})\b)?", re.I)
+PRICE_CONTEXT = re.compile(r"\b(?:price|priced|pricing|quote|quoted|quotation|offer|rate|cost|at)\b[^.\n]{0,40}$", re.I)
+TOTAL = re.compile(r"^\s*(?:total|in total|overall|deposit|shipping|freight)\b", re.I)
+MOQ = re.compile(
+    rf"\b(?:MOQ|minimum order(?: quantity)?|min\.? order(?: qty| quantity)?)\b[^\d\n]{{0,25}}"
+    rf"(?P<qty>{AMOUNT})\s*(?P<unit>{UNIT})?\b", re.I)
+LEAD_TIME = re.compile(
+    r"\b(?:lead[ -]?time|ships?|shipping|shipped|delivery|deliver(?:ed)?|dispatch(?:ed)?|ready)\b[^\d\n]{0,30}?"
+    r"(?P<lo>\d+)(?:\s*(?:-|–|to)\s*(?P<hi>\d+))?\s*(?P<unit>business days?|working days?|days?|weeks?|wks?)\b", re.I)
+INCOTERM = re.compile(r"\b(?P<term>EXW|FCA|FAS|FOB|CFR|CIF|CPT|CIP|DAP|DPU|DDP)\b(?:\s+(?P<place>[A-Z][\w'-]*(?:\s+[A-Z][\w'-]*){0,2}))?")
+DELIVERED = re.compile(r"\b(?:free (?:shipping|delivery)|delivered (?:price|to)|price includes (?:shipping|delivery))\b", re.I)
+# wording that suggests a quote is in there even when the patterns found no price
+QUOTE_HINT = re.compile(r"\b(?:price|pricing|quote|quotation|offer|per (?:kg|lb|unit|case)|moq|lead time|fob|cif)\b|[$€£]\s?\d", re.I)
+
+CURRENCIES = {"$": "USD", "us$": "USD", "usd": "USD", "dollar": "USD", "dollars": "USD",
+              "€": "EUR", "eur": "EUR", "£": "GBP", "gbp": "GBP"}
+
+QUOTE_FIELDS = ("price_per_unit", "currency", "price_unit", "moq", "moq_unit", "lead_time_days", "lead_time",
+                "freight_terms")
+
+LLM_SYSTEM_PROMPT = "You extract supplier price quotes from emails. Reply with JSON only, no commentary."
+LLM_INSTRUCTIONS = """For each email below, return one JSON object with these keys:
+id, price_per_unit (number or null), currency (ISO code or null), price_unit (e.g. "kg", "case" or null),
+moq (number or null), moq_unit, lead_time_days (number of days or null; use the upper bound of a range),
+freight_terms (e.g. "FOB Houston", "Delivered" or null).
+If an email quotes several price tiers, use the tier that applies to the smallest order.
+Use null for anything the email does not state. Return a JSON array of these objects, in the same order.
+"""
+
+
+def _number(text):
+    return float(text.replace(",", ""))
+
+def _unit(text):
+    if not text:
+        return None
+    text = text.lower()
+    for canonical, prefixes in (("kg", ("kg", "kilo")), ("lb", ("lb", "pound")), ("ton", ("ton", "mt")),
+                                ("l", ("l",)), ("gallon", ("gallon",)), ("unit", ("unit", "pc", "piece", "each", "ea"))):
+        if text.startswith(prefixes):
+            return canonical
+    return text.rstrip("s") if len(text) > 3 else text
+
+def message_key(message):
+    """Cache key: the Message-ID, or a hash of the content for messages without one."""
+    if message.get("message_id"):
+        return message["message_id"]
+    digest = hashlib.sha256(f"{message.get('subject')}\n{message.get('body')}".encode()).hexdigest()
+    return f"sha256:{digest}"
+
+
+def parse_quote(text):
+    """Regex pass over a reply; returns (quote, status).
+
+    status is 'ok' (exactly one price found), 'none' (nothing that looks like
+    a quote) or 'ambiguous' (several prices, or quote wording without a
+    price the patterns understand). Ambiguous replies are sent to the LLM.
+    """
+    quote = dict.fromkeys(QUOTE_FIELDS)
+    prices = {}
+    for m in PRICE.finditer(text):
+        amount = _number(m.group("amount") or m.group("amount2"))
+        unit = _unit(m.group("unit"))
+        before, after = text[max(0, m.start() - 60):m.start()], text[m.end():m.end() + 20]
+        if TOTAL.match(after) or re.search(r"\b(?:total|deposit|shipping|freight)\b[^.\n]{0,15}$", before, re.I):
+            continue
+        if unit is None and not PRICE_CONTEXT.search(before):
+            continue  # a bare amount is only a price if the sentence says so
+        currency = CURRENCIES.get((m.group("cur") or m.group("cur2")).lower())
+        prices.setdefault((amount, unit), currency)
+
+    if len(prices) == 1:
+        (quote["price_per_unit"], quote["price_unit"]), quote["currency"] = next(iter(prices.items()))
+
+    m = MOQ.search(text)
+    if m:
+        quote["moq"], quote["moq_unit"] = _number(m.group("qty")), _unit(m.group("unit"))
+    m = LEAD_TIME.search(text)
+    if m:
+        days = int(m.group("hi") or m.group("lo"))
+        unit = m.group("unit").lower()
+        quote["lead_time_days"] = days * 7 if unit.startswith("w") else days
+        quote["lead_time"] = text[m.start("lo"):m.end("unit")]
+    m = INCOTERM.search(text)
+    if m:
+        quote["freight_terms"] = " ".join(filter(None, (m.group("term").upper(), m.group("place"))))
+    elif DELIVERED.search(text):
+        quote["freight_terms"] = "Delivered"
+
+    if len(prices) == 1:
+        return quote, "ok"
+    if not prices and not QUOTE_HINT.search(text):
+        return quote, "none"
+    return quote, "ambiguous"
+
+
+class QuoteExtractor:
+    """Turns supplier replies into structured quotes, parsing each Message-ID once.
+
+    The regex pass handles the common phrasings; only ambiguous replies go to
+    the LLM, several per prompt, with the prompts themselves run concurrently.
+    Regex and LLM results (and 'no quote' verdicts) are cached in SQLite; a
+    reply whose LLM call failed is not cached, so it is retried next time.
+    """
+
+    def __init__(self, path, agent_factory=None, batch_size=8, max_concurrency=4, max_chars=1500):
+        self.path = path
+        self.agent_factory = agent_factory
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_chars = max_chars
+        self._agent = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._db().executescript(SCHEMA)
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def cached(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        rows = self._db().execute(
+            f"SELECT message_id, source, quote FROM quotes WHERE message_id IN ({','.join('?' * len(keys))})", keys)
+        return {k: dict(json.loads(q), source=src) for k, src, q in rows}
+
+    def _store(self, results):
+        now = time.time()
+        self._db().executemany(
+            "INSERT OR REPLACE INTO quotes (message_id, source, quote, created_at) VALUES (?, ?, ?, ?)",
+            [(k, q["source"], json.dumps({f: q[f] for f in QUOTE_FIELDS}), now) for k, q in results.items()])
+
+    def extract(self, messages):
+        """Quotes for `messages` (dicts with message_id, subject and body), keyed by message_key().
+
+        Each quote has the QUOTE_FIELDS plus `source`: 'regex', 'llm', 'none'
+        or 'unresolved' (ambiguous and the LLM was unavailable).
+        """
+        keyed = {message_key(m): m for m in messages}
+        results = self.cached(keyed)
+        fresh, ambiguous = {}, {}
+        for key, m in keyed.items():
+            if key in results:
+                continue
+            quote, status = parse_quote(f"{m.get('subject') or ''}\n{m.get('body') or ''}")
+            if status == "ambiguous":
+                ambiguous[key] = (m, quote)
+            else:
+                fresh[key] = dict(quote, source="regex" if status == "ok" else "none")
+
+        if ambiguous:
+            llm = self._extract_llm({k: m for k, (m, _) in ambiguous.items()})
+            for key, (_, quote) in ambiguous.items():
+                if key in llm:
+                    # the LLM fills the gaps; fields the regex pass was sure of stay
+                    fresh[key] = {f: quote[f] if quote[f] is not None else llm[key].get(f) for f in QUOTE_FIELDS}
+                    fresh[key]["source"] = "llm"
+                else:
+                    results[key] = dict(quote, source="unresolved")
+
+        self._store(fresh)
+        results.update(fresh)
+        return results
+
+    def _get_agent(self):
+        with self._lock:
+            if self._agent is None and self.agent_factory is not None:
+                try:
+                    self._agent = self.agent_factory()
+                except Exception:
+                    log.exception("LLM unavailable for quote extraction")
+            return self._agent
+
+    def _extract_llm(self, messages):
+        agent = self._get_agent()
+        if agent is None:
+            return {}
+        keys = list(messages)
+        batches = [keys[i:i + self.batch_size] for i in range(0, len(keys), self.batch_size)]
+        prompts = []
+        for batch in batches:
+            parts = [LLM_INSTRUCTIONS]
+            for n, key in enumerate(batch):
+                m = messages[key]
+                parts.append(f"### id: {n}\nSubject: {m.get('subject') or ''}\n{(m.get('body') or '')[:self.max_chars]}")
+            prompts.append("\n\n".join(parts))
+
+        out = agent.generate_many(prompts, max_concurrency=self.max_concurrency, system_prompt=LLM_SYSTEM_PROMPT,
+                                  max_tokens=150 * self.batch_size, temperature=0)
+        found = {}
+        for batch, result in zip(batches, out["results"]):
+            if "error" in result:
+                log.warning("quote extraction batch failed: %s", result["error"])
+                continue
+            for item in _json_array(result["response"]):
+                n = _batch_index(item.get("id"), len(batch))
+                if n is not None:
+                    found[batch[n]] = {f: item.get(f) for f in QUOTE_FIELDS}
+        return found
+
+
+def _batch_index(value, size):
+    # the model echoes the "### id: n" it was given; anything else (-1, 1.5, true) can't be trusted
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or not 0 <= value < size:
+        return None
+    return value
+
+
+def _json_array(text):
+    start, end = text.find("["), text.rfind("]")
+    if start < 0 or end < start:
+        return []
+    try:
+        items = json.loads(text[start:end + 1])
+    except ValueError:
+        return []
+    return [it for it in items if isinstance(it, dict)]
@@ -1,8 +1,293 @@
 import os
 import json
-import boto3
-from typing import Dict, Optional, List
-from botocore.exceptions import ClientError
+import time
+import random
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, List, Union
+
+# boto3/botocore are imported lazily: importing them costs hundreds of
+# milliseconds, which short-lived workers shouldn't pay unless they call Bedrock.
+
+DEFAULT_MAX_POOL_CONNECTIONS = int(os.getenv('BEDROCK_MAX_POOL_CONNECTIONS', '25'))
+
+_clients: Dict[tuple, object] = {}
+_clients_lock = threading.Lock()
+
+_listeners: List[Callable[[str, Dict], None]] = []
+
+
+def add_listener(fn: Callable[[str, Dict], None]) -> None:
+    """
+    Register `fn(event, data)` to observe Bedrock traffic, e.g. for metrics.
+    
+    Events:
+        - request: one invoke_model call (model, seconds, request_bytes,
+          response_bytes, and the error code if it failed)
+        - usage: token usage of a result (model, usage, cache_hit)
+        - retry: a generate_many/chat_many retry (model, code)
+    """
+    _listeners.append(fn)
+
+
+def remove_listener(fn: Callable[[str, Dict], None]) -> None:
+    if fn in _listeners:
+        _listeners.remove(fn)
+
+
+def _emit(event: str, data: Dict) -> None:
+    for fn in list(_listeners):
+        try:
+            fn(event, data)
+        except Exception:
+            pass  # observers must never break a request
+
+
+def get_bedrock_client(
+    region_name: str,
+    aws_access_key_id: Optional[str] = None,
+    aws_secret_access_key: Optional[str] = None,
+    max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS
+):
+    """
+    Return a process-wide bedrock-runtime client, creating it on first use.
+    
+    Clients are cached per region, credentials and pool size, so repeated
+    calls reuse the same warm HTTPS connection pool. boto3 clients are
+    thread-safe and can be shared between threads.
+    
+    Args:
+        region_name: AWS region
+        aws_access_key_id: AWS access key (None uses the default credential chain)
+        aws_secret_access_key: AWS secret key
+        max_pool_connections: Size of botocore's HTTP connection pool
+        
+    Returns:
+        A boto3 bedrock-runtime client
+    """
+    key = (region_name, aws_access_key_id, aws_secret_access_key, max_pool_connections)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            import boto3
+            from botocore.config import Config
+            
+            # boto3 sessions are not thread-safe, so build a private one under the lock
+            client = boto3.session.Session().client(
+                'bedrock-runtime',
+                region_name=region_name,
+                aws_access_key_id=aws_access_key_id,
+                aws_secret_access_key=aws_secret_access_key,
+                config=Config(max_pool_connections=max_pool_connections, tcp_keepalive=True)
+            )
+            _clients[key] = client
+    return client
+
+
+class BedrockError(Exception):
+    """
+    A Bedrock API error, keeping the service error code.
+    
+    `retryable` is True for throttling and transient capacity errors, which
+    are worth retrying after a delay.
+    """
+    
+    RETRYABLE_CODES = {
+        'ThrottlingException', 'throttlingException',
+        'TooManyRequestsException', 'ServiceUnavailableException',
+        'serviceUnavailableException', 'ModelNotReadyException',
+        'InternalServerException', 'internalServerException',
+        'modelStreamErrorException',
+    }
+    
+    def __init__(self, code: str, message: str):
+        super().__init__(f"Bedrock API error ({code}): {message}")
+        self.code = code
+        self.message = message
+    
+    @property
+    def retryable(self) -> bool:
+        return self.code in self.RETRYABLE_CODES
+    
+    @property
+    def throttled(self) -> bool:
+        return self.code.lower() in ('throttlingexception', 'toomanyrequestsexception')
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit that adapts to throttling, AIMD style.
+    
+    Every successful call raises the limit by 1/limit (about +1 per full
+    window of calls); every throttled call halves it, at most once per
+    `cooldown` seconds so that a burst of rejections from the same window
+    only counts once. The limit stays between 1 and `max_limit`.
+    """
+    
+    def __init__(self, max_limit: int, initial: Optional[int] = None, cooldown: float = 1.0):
+        self.max_limit = max_limit
+        self.limit = float(initial or max_limit)
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+    
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+    
+    def release(self, throttled: bool = False) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(1.0, self.limit / 2)
+                    self._last_decrease = now
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+class ResponseCache:
+    """
+    Two-tier cache of Bedrock results: an in-memory LRU in front of SQLite.
+    
+    Keys are a hash of the model ID and the request body (system prompt,
+    messages and sampling parameters) with its dict keys sorted, so identical
+    requests hit the cache however their dicts were ordered. Nothing else is
+    normalized: a request that differs in whitespace gets its own entry.
+    Entries expire after `ttl` seconds; the memory tier holds at most
+    `max_memory_entries` and the disk tier is trimmed, least recently used
+    first, to `max_disk_bytes`.
+    """
+    
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        ttl: float = 24 * 3600,
+        max_memory_entries: int = 512,
+        max_disk_bytes: int = 256 * 1024 * 1024
+    ):
+        """
+        Args:
+            path: SQLite file for the disk tier (None keeps the cache in memory only)
+            ttl: Seconds an entry stays valid
+            max_memory_entries: Capacity of the in-memory LRU tier
+            max_disk_bytes: Approximate size limit of the disk tier
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self._memory: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._puts = 0
+        if path:
+            self._db().execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db().execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (accessed_at)")
+    
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+    
+    @staticmethod
+    def make_key(model_id: str, body: Dict) -> str:
+        """
+        Hash the model ID and a request body, exactly as sent, into a cache key.
+        
+        Only dict key order is canonicalized; whitespace in messages, `system`
+        or `stop_sequences` changes what the model sees, so it changes the key.
+        """
+        canonical = json.dumps([model_id, body], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode()).hexdigest()
+    
+    def get(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[0] <= self.ttl:
+                self._memory.move_to_end(key)
+                return entry[1]
+        
+        if self.path:
+            row = self._db().execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row and now - row[1] <= self.ttl:
+                self._db().execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                value = json.loads(row[0])
+                self._remember(key, row[1], value)
+                return value
+        return None
+    
+    def put(self, key: str, value: Dict) -> None:
+        now = time.time()
+        self._remember(key, now, value)
+        if not self.path:
+            return
+        
+        data = json.dumps(value)
+        self._db().execute(
+            "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (key, data, len(data), now, now)
+        )
+        with self._lock:
+            self._puts += 1
+            check = self._puts % 100 == 1
+        if check:
+            self._evict(now)
+    
+    def _remember(self, key: str, created_at: float, value: Dict) -> None:
+        with self._lock:
+            self._memory[key] = (created_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+    
+    def _evict(self, now: float) -> None:
+        db = self._db()
+        db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > self.max_disk_bytes:
+            # drop least recently used rows until roughly 90% of the limit
+            excess = total - int(self.max_disk_bytes * 0.9)
+            db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY accessed_at "
+                "ROWS UNBOUNDED PRECEDING) - size AS before FROM responses) WHERE before < ?)", (excess,)
+            )
+    
+    def record(self, hit: bool, usage: Dict) -> Dict:
+        """Update the counters and return the stats reported with a result."""
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.tokens_saved += usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+            else:
+                self.misses += 1
+            return {"hit": hit, "hits": self.hits, "misses": self.misses, "tokens_saved": self.tokens_saved}
 
 
 class BedrockAgent:
@@ -13,10 +298,12 @@ class BedrockAgent:
     
     def __init__(
         self,
-        region_name: Optional[str] = us-east-1,
-        aws_access_key_id: Optional[str] = AWS_ACCESS_KEY_ID,
-        aws_secret_access_key: Optional[str] = AWS_SECRET_ACCESS_KEY,
-        model_id: str = "anthropic.claude-3-sonnet-20240229-v1:0"
+        region_name: Optional[str] = None,
+        aws_access_key_id: Optional[str] = None,
+        aws_secret_access_key: Optional[str] = None,
+        model_id: str = "anthropic.claude-3-sonnet-20240229-v1:0",
+        max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS,
+        cache: Optional[ResponseCache] = None
     ):
         """
         Initialize the Bedrock agent.
@@ -31,17 +318,21 @@ class BedrockAgent:
                 - anthropic.claude-3-opus-20240229-v1:0 (Claude 3 Opus)
                 - meta.llama3-8b-instruct-v1:0 (Llama 3 8B)
                 - meta.llama3-70b-instruct-v1:0 (Llama 3 70B)
+            max_pool_connections: HTTP connection pool size of the shared client
+            cache: Optional ResponseCache. Used for temperature 0 requests, or
+                any request made with cache=True
         """
         self.region_name = region_name or os.getenv('AWS_REGION', 'us-east-1')
         self.model_id = model_id
+        self.cache = cache
         
-        # Initialize boto3 client
+        # Reuse the process-wide client for these credentials
         try:
-            self.bedrock_runtime = boto3.client(
-                'bedrock-runtime',
-                region_name=self.region_name,
-                aws_access_key_id=aws_access_key_id or os.getenv('AWS_ACCESS_KEY_ID'),
-                aws_secret_access_key=aws_secret_access_key or os.getenv('AWS_SECRET_ACCESS_KEY')
+            self.bedrock_runtime = get_bedrock_client(
+                self.region_name,
+                aws_access_key_id or os.getenv('AWS_ACCESS_KEY_ID'),
+                aws_secret_access_key or os.getenv('AWS_SECRET_ACCESS_KEY'),
+                max_pool_connections
             )
         except Exception as e:
             raise ValueError(f"Failed to initialize Bedrock client: {e}. "
@@ -54,7 +345,8 @@ class BedrockAgent:
         max_tokens: int = 1000,
         temperature: float = 0.7,
         top_p: float = 0.9,
-        stop_sequences: Optional[List[str]] = None
+        stop_sequences: Optional[List[str]] = None,
+        cache: Optional[bool] = None
     ) -> Dict:
         """
         Generate a response from Bedrock model.
@@ -66,79 +358,68 @@ class BedrockAgent:
             temperature: Sampling temperature (0.0 to 1.0)
             top_p: Top-p sampling parameter
             stop_sequences: List of stop sequences
+            cache: Force the response cache on (True) or off (False). By
+                default it is used only when temperature is 0
             
         Returns:
             Dictionary containing:
                 - response: The generated text response
                 - usage: Token usage information
                 - model: Model ID used
+                - cache: Hit flag and running hit/miss/tokens-saved counts
+                  (only when the cache was consulted)
         """
+        use_cache = self._use_cache(cache, temperature)
+        
         # Determine model provider and format request accordingly
         if self.model_id.startswith('anthropic.claude'):
             return self._invoke_claude(
-                prompt, system_prompt, max_tokens, temperature, top_p, stop_sequences
+                prompt, system_prompt, max_tokens, temperature, top_p, stop_sequences, use_cache
             )
         elif self.model_id.startswith('meta.llama'):
             return self._invoke_llama(
-                prompt, max_tokens, temperature, top_p, stop_sequences
+                prompt, max_tokens, temperature, top_p, stop_sequences, use_cache
             )
         else:
             # Try Claude format as default
             return self._invoke_claude(
-                prompt, system_prompt, max_tokens, temperature, top_p, stop_sequences
+                prompt, system_prompt, max_tokens, temperature, top_p, stop_sequences, use_cache
             )
     
-    def _invoke_claude(
+    def _use_cache(self, cache: Optional[bool], temperature: float) -> bool:
+        if self.cache is None:
+            return False
+        return cache if cache is not None else temperature == 0
+    
+    def _claude_body(
         self,
-        prompt: str,
-        system_prompt: Optional[str],
+        messages: List[Dict],
+        system_prompt: Optional[Union[str, List[Dict]]],
         max_tokens: int,
         temperature: float,
-        top_p: float,
-        stop_sequences: Optional[List[str]]
+        top_p: Optional[float] = None,
+        stop_sequences: Optional[List[str]] = None
     ) -> Dict:
-        """Invoke Claude model via Bedrock."""
+        """Build an Anthropic Messages API request body."""
         body = {
             "anthropic_version": "bedrock-2023-05-31",
             "max_tokens": max_tokens,
             "temperature": temperature,
-            "top_p": top_p,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ]
+            "messages": messages
         }
         
+        if top_p is not None:
+            body["top_p"] = top_p
+        
         if system_prompt:
             body["system"] = system_prompt
         
         if stop_sequences:
             body["stop_sequences"] = stop_sequences
         
-        try:
-            response = self.bedrock_runtime.invoke_model(
-                modelId=self.model_id,
-                body=json.dumps(body)
-            )
-            
-            response_body = json.loads(response['body'].read())
-            
-            return {
-                "response": response_body['content'][0]['text'],
-                "usage": {
-                    "input_tokens": response_body.get('usage', {}).get('input_tokens', 0),
-                    "output_tokens": response_body.get('usage', {}).get('output_tokens', 0)
-                },
-                "model": self.model_id
-            }
-        except ClientError as e:
-            error_code = e.response['Error']['Code']
-            error_message = e.response['Error']['Message']
-            raise Exception(f"Bedrock API error ({error_code}): {error_message}")
+        return body
     
-    def _invoke_llama(
+    def _llama_body(
         self,
         prompt: str,
         max_tokens: int,
@@ -146,7 +427,7 @@ class BedrockAgent:
         top_p: float,
         stop_sequences: Optional[List[str]]
     ) -> Dict:
-        """Invoke Llama model via Bedrock."""
+        """Build a Llama request body."""
         body = {
             "prompt": prompt,
             "max_gen_len": max_tokens,
@@ -157,33 +438,114 @@ class BedrockAgent:
         if stop_sequences:
             body["stop"] = stop_sequences
         
+        return body
+    
+    def _invoke(self, body: Dict) -> Dict:
+        """Call invoke_model with a JSON request body and return the decoded response body."""
+        from botocore.exceptions import ClientError
+        
+        payload = json.dumps(body)
+        event = {"model": self.model_id, "request_bytes": len(payload), "response_bytes": 0}
+        start = time.perf_counter()
         try:
             response = self.bedrock_runtime.invoke_model(
                 modelId=self.model_id,
-                body=json.dumps(body)
+                body=payload
             )
-            
-            response_body = json.loads(response['body'].read())
-            
-            return {
-                "response": response_body['generation'],
-                "usage": {
-                    "input_tokens": response_body.get('prompt_token_count', 0),
-                    "output_tokens": response_body.get('generation_token_count', 0)
-                },
-                "model": self.model_id
-            }
+            raw = response['body'].read()
+            event["response_bytes"] = len(raw)
+            return json.loads(raw)
         except ClientError as e:
             error_code = e.response['Error']['Code']
             error_message = e.response['Error']['Message']
-            raise Exception(f"Bedrock API error ({error_code}): {error_message}")
+            event["error"] = error_code
+            raise BedrockError(error_code, error_message)
+        except Exception as e:
+            event["error"] = type(e).__name__
+            raise
+        finally:
+            if _listeners:
+                _emit("request", dict(event, seconds=time.perf_counter() - start))
+    
+    def _call(self, body: Dict, parse, use_cache: bool) -> Dict:
+        """Invoke with `body` and shape the response with `parse`, going through the cache if asked."""
+        if not use_cache:
+            result = parse(self._invoke(body))
+            _emit("usage", {"model": self.model_id, "usage": result["usage"], "cache_hit": None})
+            return result
+        
+        key = self.cache.make_key(self.model_id, body)
+        result = self.cache.get(key)
+        hit = result is not None
+        if not hit:
+            result = parse(self._invoke(body))
+            self.cache.put(key, result)
+        _emit("usage", {"model": self.model_id, "usage": result["usage"], "cache_hit": hit})
+        return dict(result, cache=self.cache.record(hit, result["usage"]))
+    
+    def _parse_claude(self, response_body: Dict) -> Dict:
+        usage = response_body.get('usage', {})
+        result = {
+            "response": response_body['content'][0]['text'],
+            "usage": {
+                "input_tokens": usage.get('input_tokens', 0),
+                "output_tokens": usage.get('output_tokens', 0)
+            },
+            "model": self.model_id
+        }
+        # Present only when the request carried cache_control blocks
+        for field in ('cache_read_input_tokens', 'cache_creation_input_tokens'):
+            if field in usage:
+                result["usage"][field] = usage[field]
+        return result
+    
+    def _parse_llama(self, response_body: Dict) -> Dict:
+        return {
+            "response": response_body['generation'],
+            "usage": {
+                "input_tokens": response_body.get('prompt_token_count', 0),
+                "output_tokens": response_body.get('generation_token_count', 0)
+            },
+            "model": self.model_id
+        }
+    
+    def _invoke_claude(
+        self,
+        prompt: str,
+        system_prompt: Optional[str],
+        max_tokens: int,
+        temperature: float,
+        top_p: float,
+        stop_sequences: Optional[List[str]],
+        use_cache: bool = False
+    ) -> Dict:
+        """Invoke Claude model via Bedrock."""
+        body = self._claude_body(
+            [{"role": "user", "content": prompt}],
+            system_prompt, max_tokens, temperature, top_p, stop_sequences
+        )
+        return self._call(body, self._parse_claude, use_cache)
+    
+    def _invoke_llama(
+        self,
+        prompt: str,
+        max_tokens: int,
+        temperature: float,
+        top_p: float,
+        stop_sequences: Optional[List[str]],
+        use_cache: bool = False
+    ) -> Dict:
+        """Invoke Llama model via Bedrock."""
+        body = self._llama_body(prompt, max_tokens, temperature, top_p, stop_sequences)
+        return self._call(body, self._parse_llama, use_cache)
     
     def chat(
         self,
         messages: List[Dict[str, str]],
-        system_prompt: Optional[str] = None,
+        system_prompt: Optional[Union[str, List[Dict]]] = None,
         max_tokens: int = 1000,
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        cache: Optional[bool] = None
     ) -> Dict:
         """
         Chat with the model using a conversation history.
@@ -191,44 +553,18 @@ class BedrockAgent:
         Args:
             messages: List of message dicts with 'role' and 'content' keys.
                      Roles can be 'user' or 'assistant'
-            system_prompt: Optional system prompt
+            system_prompt: Optional system prompt, either a string or a list of
+                Anthropic text blocks (which may carry cache_control)
             max_tokens: Maximum tokens to generate
             temperature: Sampling temperature
+            cache: Force the response cache on or off (see generate_response)
             
         Returns:
             Dictionary with response and usage info
         """
         if self.model_id.startswith('anthropic.claude'):
-            body = {
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": max_tokens,
-                "temperature": temperature,
-                "messages": messages
-            }
-            
-            if system_prompt:
-                body["system"] = system_prompt
-            
-            try:
-                response = self.bedrock_runtime.invoke_model(
-                    modelId=self.model_id,
-                    body=json.dumps(body)
-                )
-                
-                response_body = json.loads(response['body'].read())
-                
-                return {
-                    "response": response_body['content'][0]['text'],
-                    "usage": {
-                        "input_tokens": response_body.get('usage', {}).get('input_tokens', 0),
-                        "output_tokens": response_body.get('usage', {}).get('output_tokens', 0)
-                    },
-                    "model": self.model_id
-                }
-            except ClientError as e:
-                error_code = e.response['Error']['Code']
-                error_message = e.response['Error']['Message']
-                raise Exception(f"Bedrock API error ({error_code}): {error_message}")
+            body = self._claude_body(messages, system_prompt, max_tokens, temperature)
+            return self._call(body, self._parse_claude, self._use_cache(cache, temperature))
         else:
             # For non-Claude models, use the last user message
             last_user_message = next(
@@ -242,8 +578,279 @@ class BedrockAgent:
                 last_user_message['content'],
                 system_prompt,
                 max_tokens,
-                temperature
+                temperature,
+                cache=cache
             )
+    
+    def generate_many(
+        self,
+        prompts: List[str],
+        max_concurrency: int = 8,
+        max_retries: int = 5,
+        **kwargs
+    ) -> Dict:
+        """
+        Run generate_response over many prompts concurrently.
+        
+        Args:
+            prompts: Prompts to send
+            max_concurrency: Upper bound on requests in flight. The working
+                limit halves on throttling and creeps back up on success
+            max_retries: Retries per prompt for throttling/transient errors,
+                with jittered exponential backoff
+            **kwargs: Passed to generate_response (system_prompt, max_tokens, ...)
+            
+        Returns:
+            Dictionary containing:
+                - results: One entry per prompt, in input order. Failed prompts
+                  get {"error": ..., "code": ...} instead of a response
+                - stats: requests, failed, retries, throttled, elapsed,
+                  requests_per_sec, tokens_per_sec and final_concurrency
+        """
+        return self._run_many(
+            lambda prompt: self.generate_response(prompt, **kwargs),
+            prompts, max_concurrency, max_retries
+        )
+    
+    def chat_many(
+        self,
+        conversations: List[List[Dict]],
+        max_concurrency: int = 8,
+        max_retries: int = 5,
+        **kwargs
+    ) -> Dict:
+        """
+        Run chat over many conversations concurrently (see generate_many).
+        
+        Args:
+            conversations: Message lists, one per conversation
+            max_concurrency: Upper bound on requests in flight
+            max_retries: Retries per conversation for retryable errors
+            **kwargs: Passed to chat (system_prompt, max_tokens, ...)
+            
+        Returns:
+            Dictionary with results in input order and throughput stats
+        """
+        return self._run_many(
+            lambda messages: self.chat(messages, **kwargs),
+            conversations, max_concurrency, max_retries
+        )
+    
+    def _run_many(
+        self,
+        call: Callable[[object], Dict],
+        items: List,
+        max_concurrency: int,
+        max_retries: int,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0
+    ) -> Dict:
+        limiter = AdaptiveLimiter(max_concurrency)
+        counts = {"retries": 0, "throttled": 0}
+        counts_lock = threading.Lock()
+        
+        def run(item):
+            attempt = 0
+            while True:
+                limiter.acquire()
+                try:
+                    result = call(item)
+                except BedrockError as e:
+                    limiter.release(throttled=e.throttled)
+                    with counts_lock:
+                        counts["throttled"] += e.throttled
+                    if not e.retryable or attempt >= max_retries:
+                        return {"error": str(e), "code": e.code}
+                    with counts_lock:
+                        counts["retries"] += 1
+                    _emit("retry", {"model": self.model_id, "code": e.code})
+                    # full jitter keeps retries from landing in lockstep
+                    time.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+                    attempt += 1
+                    continue
+                except Exception as e:
+                    limiter.release()
+                    return {"error": str(e), "code": None}
+                limiter.release()
+                return result
+        
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="bedrock") as pool:
+            results = list(pool.map(run, items))
+        elapsed = max(time.monotonic() - start, 1e-9)
+        
+        tokens = sum(
+            r["usage"].get("input_tokens", 0) + r["usage"].get("output_tokens", 0)
+            for r in results if "usage" in r
+        )
+        failed = sum(1 for r in results if "error" in r)
+        return {
+            "results": results,
+            "stats": {
+                "requests": len(results),
+                "failed": failed,
+                "retries": counts["retries"],
+                "throttled": counts["throttled"],
+                "elapsed": round(elapsed, 3),
+                "requests_per_sec": round((len(results) - failed) / elapsed, 2),
+                "tokens_per_sec": round(tokens / elapsed, 1),
+                "final_concurrency": int(limiter.limit)
+            }
+        }
+    
+    def generate_stream(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        top_p: float = 0.9,
+        stop_sequences: Optional[List[str]] = None
+    ) -> "BedrockStream":
+        """
+        Stream a response from the Bedrock model as it is generated.
+        
+        Takes the same arguments as generate_response(). Iterate over the
+        returned BedrockStream to receive text deltas; once it is exhausted,
+        its `usage` attribute holds the token counts.
+        
+        Example:
+            stream = agent.generate_stream("Draft an RFQ for 500kg of rice")
+            for text in stream:
+                print(text, end="", flush=True)
+            print(stream.usage)
+        """
+        if self.model_id.startswith('meta.llama'):
+            body = self._llama_body(prompt, max_tokens, temperature, top_p, stop_sequences)
+        else:
+            body = self._claude_body(
+                [{"role": "user", "content": prompt}],
+                system_prompt, max_tokens, temperature, top_p, stop_sequences
+            )
+        return self._invoke_stream(body)
+    
+    def chat_stream(
+        self,
+        messages: List[Dict[str, str]],
+        system_prompt: Optional[str] = None,
+        max_tokens: int = 1000,
+        temperature: float = 0.7
+    ) -> "BedrockStream":
+        """
+        Streaming counterpart of chat(); see generate_stream() for the return value.
+        """
+        if not self.model_id.startswith('anthropic.claude'):
+            last_user_message = next(
+                (msg for msg in reversed(messages) if msg['role'] == 'user'),
+                None
+            )
+            if not last_user_message:
+                raise ValueError("No user message found in conversation history")
+            return self.generate_stream(last_user_message['content'], system_prompt, max_tokens, temperature)
+        
+        body = self._claude_body(messages, system_prompt, max_tokens, temperature)
+        return self._invoke_stream(body)
+    
+    def _invoke_stream(self, body: Dict) -> "BedrockStream":
+        """Call invoke_model_with_response_stream and wrap its event stream."""
+        from botocore.exceptions import ClientError
+        
+        payload = json.dumps(body)
+        event = {"model": self.model_id, "request_bytes": len(payload), "response_bytes": 0}
+        start = time.perf_counter()
+        try:
+            response = self.bedrock_runtime.invoke_model_with_response_stream(
+                modelId=self.model_id,
+                body=payload
+            )
+            # the "request" event goes out once the stream is finished
+            return BedrockStream(response['body'], self.model_id, request=event, started=start)
+        except ClientError as e:
+            error_code = e.response['Error']['Code']
+            error_message = e.response['Error']['Message']
+            event["error"] = error_code
+            if _listeners:
+                _emit("request", dict(event, seconds=time.perf_counter() - start))
+            raise BedrockError(error_code, error_message)
+        except Exception as e:
+            event["error"] = type(e).__name__
+            if _listeners:
+                _emit("request", dict(event, seconds=time.perf_counter() - start))
+            raise
+
+
+class BedrockStream:
+    """
+    Iterator over the text deltas of a streaming Bedrock response.
+    
+    Understands both the Anthropic Messages stream events and the Llama
+    generation chunks. `usage` and `stop_reason` are set once the stream has
+    been fully consumed. With `request`, the metrics "request" event for the
+    call is emitted when the stream ends, fails or is closed.
+    """
+    
+    def __init__(self, events, model_id: str, request: Optional[Dict] = None, started: Optional[float] = None):
+        self.events = events
+        self.model = model_id
+        self.usage: Optional[Dict] = None
+        self.stop_reason: Optional[str] = None
+        self._request = request
+        self._started = time.perf_counter() if started is None else started
+    
+    def __iter__(self):
+        if self._request is None:
+            yield from self._deltas()
+            return
+        try:
+            yield from self._deltas()
+        except BedrockError as e:
+            self._request["error"] = e.code
+            raise
+        except Exception as e:
+            self._request["error"] = type(e).__name__
+            raise
+        finally:
+            if _listeners:
+                _emit("request", dict(self._request, seconds=time.perf_counter() - self._started))
+    
+    def _deltas(self):
+        input_tokens = output_tokens = 0
+        
+        for event in self.events:
+            if 'chunk' not in event:
+                # modelStreamErrorException, throttlingException, ...
+                error_code, error = next(iter(event.items()))
+                raise BedrockError(error_code, error.get('message', str(error)))
+            
+            if self._request is not None:
+                self._request["response_bytes"] += len(event['chunk']['bytes'])
+            payload = json.loads(event['chunk']['bytes'])
+            event_type = payload.get('type')
+            
+            if event_type == 'message_start':
+                input_tokens = payload['message'].get('usage', {}).get('input_tokens', input_tokens)
+            elif event_type == 'content_block_delta':
+                text = payload.get('delta', {}).get('text')
+                if text:
+                    yield text
+            elif event_type == 'message_delta':
+                output_tokens = payload.get('usage', {}).get('output_tokens', output_tokens)
+                self.stop_reason = payload.get('delta', {}).get('stop_reason') or self.stop_reason
+            elif 'generation' in payload:
+                # Llama chunks carry the text directly
+                input_tokens = payload.get('prompt_token_count') or input_tokens
+                output_tokens = payload.get('generation_token_count') or output_tokens
+                self.stop_reason = payload.get('stop_reason') or self.stop_reason
+                if payload['generation']:
+                    yield payload['generation']
+            
+            metrics = payload.get('amazon-bedrock-invocationMetrics')
+            if metrics:
+                input_tokens = metrics.get('inputTokenCount', input_tokens)
+                output_tokens = metrics.get('outputTokenCount', output_tokens)
+        
+        self.usage = {"input_tokens": input_tokens, "output_tokens": output_tokens}
+        _emit("usage", {"model": self.model, "usage": self.usage, "cache_hit": None})
 
 
 # Convenience function for quick usage
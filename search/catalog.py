@@ -0,0 +1,663 @@
+import os
+import re
+import csv
+import json
+import glob
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# String columns with at most this many distinct values (or this share of the
+# rows) are stored as categorical codes
+MAX_CATEGORIES = 256
+MAX_CATEGORY_RATIO = 0.5
+
+OPERATORS = ('eq', 'ne', 'in', 'lt', 'lte', 'gt', 'gte', 'between', 'contains')
+
+DEFAULT_SNAPSHOT = os.getenv(
+    'CATALOG_SNAPSHOT',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'suppliers.snapshot')
+)
+
+# Canonical units are kg for mass and liters for volume. The factor converts
+# one source unit into canonical units.
+UNITS = {
+    'kg': ('kg', 1.0), 'kgs': ('kg', 1.0), 'g': ('kg', 0.001),
+    'lb': ('kg', 0.45359237), 'lbs': ('kg', 0.45359237),
+    'ton': ('kg', 1000.0), 'tons': ('kg', 1000.0), 'tonne': ('kg', 1000.0), 'tonnes': ('kg', 1000.0),
+    'l': ('l', 1.0), 'liter': ('l', 1.0), 'liters': ('l', 1.0), 'litre': ('l', 1.0), 'litres': ('l', 1.0),
+    'ml': ('l', 0.001), 'gallon': ('l', 3.785411784), 'gallons': ('l', 3.785411784),
+}
+
+PRICE_COLUMN = re.compile(r'^price_usd_per_(\w+)$')
+MOQ_COLUMN = re.compile(r'^min_order_(\w+)$')
+
+# The unified supplier schema. `price` is USD per canonical unit and `moq`
+# is in canonical units; anything else in a CSV becomes a sparse attribute.
+SCHEMA = {
+    'product': 'category',
+    'supplier_id': 'string',
+    'company_name': 'string',
+    'country': 'category',
+    'city': 'category',
+    'price': 'number',
+    'moq': 'number',
+    'unit': 'category',
+    'lead_time_days': 'number',
+    'certification': 'category',
+    'rating': 'number',
+    'email': 'string',
+    'phone': 'string',
+    'website': 'string',
+    'notes': 'category',
+}
+
+SNAPSHOT_MAGIC = b'SUPCAT01'
+SNAPSHOT_ALIGN = 64
+
+
+class Categorical:
+    """
+    Dictionary-encoded string column: `codes` index into `categories`.
+
+    Code -1 marks a missing value.
+    """
+
+    def __init__(self, codes: np.ndarray, categories: List[str]):
+        self.codes = codes
+        self.categories = categories
+        self.lookup = {value: i for i, value in enumerate(categories)}
+
+    @classmethod
+    def encode(cls, values: Iterable[Optional[str]]) -> 'Categorical':
+        values = list(values)
+        categories = sorted({v for v in values if v is not None})
+        lookup = {value: i for i, value in enumerate(categories)}
+        codes = np.fromiter((lookup.get(v, -1) for v in values), dtype=np.int32, count=len(values))
+        return cls(codes, categories)
+
+    def code(self, value: str) -> int:
+        """Code of `value`, or -2 (matches nothing) if it never occurs."""
+        return self.lookup.get(value, -2)
+
+    def decode(self, rows: np.ndarray) -> List[Optional[str]]:
+        return [self.categories[c] if c >= 0 else None for c in self.codes[rows]]
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+
+class InvertedIndex:
+    """
+    Row ids grouped by category code (CSR layout).
+
+    `rows[starts[c]:starts[c + 1]]` are the ascending row ids whose code is c.
+    """
+
+    def __init__(self, column: Categorical):
+        self.rows = np.argsort(column.codes, kind='stable').astype(np.int64)
+        sorted_codes = column.codes[self.rows]
+        self.starts = np.searchsorted(sorted_codes, np.arange(len(column.categories) + 1))
+
+    @classmethod
+    def from_arrays(cls, rows: np.ndarray, starts: np.ndarray) -> 'InvertedIndex':
+        index = cls.__new__(cls)
+        index.rows, index.starts = rows, starts
+        return index
+
+    def lookup(self, code: int) -> np.ndarray:
+        if code < 0 or code + 1 >= len(self.starts):
+            return np.empty(0, dtype=np.int64)
+        return self.rows[self.starts[code]:self.starts[code + 1]]
+
+
+class SortedIndex:
+    """Row ids of a numeric column in value order, for range lookups by binary search."""
+
+    def __init__(self, column: np.ndarray):
+        self.rows = np.argsort(column, kind='stable').astype(np.int64)
+        self.values = column[self.rows]
+        # NaNs sort last; keep them out of every range
+        self.valid = len(self.values) - int(np.isnan(self.values).sum())
+
+    @classmethod
+    def from_arrays(cls, rows: np.ndarray, values: np.ndarray, valid: int) -> 'SortedIndex':
+        index = cls.__new__(cls)
+        index.rows, index.values, index.valid = rows, values, valid
+        return index
+
+    def range(self, low: float = -np.inf, high: float = np.inf,
+              low_inclusive: bool = True, high_inclusive: bool = True) -> np.ndarray:
+        values = self.values[:self.valid]
+        start = np.searchsorted(values, low, side='left' if low_inclusive else 'right')
+        stop = np.searchsorted(values, high, side='right' if high_inclusive else 'left')
+        return np.sort(self.rows[start:stop])
+
+
+class StringColumn:
+    """
+    Read-only strings packed into one UTF-8 buffer plus an offsets array.
+
+    This is how snapshots store free-text columns: both arrays can be
+    memory-mapped, and a string is decoded only when a row is materialized.
+    An empty string reads back as None.
+    """
+
+    dtype = np.dtype(object)
+
+    def __init__(self, offsets: np.ndarray, data: np.ndarray):
+        self.offsets = offsets
+        self.data = data
+
+    @classmethod
+    def pack(cls, values: Iterable[Optional[str]]) -> 'StringColumn':
+        encoded = [(v or '').encode('utf-8') for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return cls(offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8))
+
+    def _get(self, i: int) -> Optional[str]:
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8') or None
+
+    def __getitem__(self, rows):
+        if isinstance(rows, (int, np.integer)):
+            return self._get(rows)
+        out = np.empty(len(rows), dtype=object)
+        for n, i in enumerate(rows):
+            out[n] = self._get(i)
+        return out
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+
+class AttributeTable:
+    """
+    Sparse product-specific fields (tomato_variety, flavors_available, ...)
+    stored as (row, key, value) triples ordered by row.
+    """
+
+    def __init__(self, rows: np.ndarray, keys: Categorical, values, index: Optional[InvertedIndex] = None):
+        self.rows = rows
+        self.keys = keys
+        self.values = values
+        self.index = index or InvertedIndex(keys)
+
+    @classmethod
+    def from_dicts(cls, per_row: List[Dict[str, str]]) -> 'AttributeTable':
+        rows, keys, values = [], [], []
+        for row, attributes in enumerate(per_row):
+            for key, value in attributes.items():
+                rows.append(row)
+                keys.append(key)
+                values.append(value)
+        return cls(np.array(rows, dtype=np.int64), Categorical.encode(keys), np.array(values, dtype=object))
+
+    def for_rows(self, row_ids: np.ndarray) -> List[Dict[str, str]]:
+        starts = np.searchsorted(self.rows, row_ids, side='left')
+        stops = np.searchsorted(self.rows, row_ids, side='right')
+        result = []
+        for start, stop in zip(starts, stops):
+            entries = np.arange(start, stop)
+            result.append(dict(zip(self.keys.decode(entries), self.values[entries])))
+        return result
+
+    def query(self, key: str, op: str, value) -> np.ndarray:
+        entries = self.index.lookup(self.keys.code(key))
+        data = self.values[entries]
+        if op == 'eq':
+            mask = data == value
+        elif op == 'in':
+            mask = np.isin(data, list(value))
+        elif op == 'contains':
+            mask = _contains(data, value)
+        else:
+            raise ValueError(f"Operator '{op}' is not supported on attribute '{key}'")
+        return np.unique(self.rows[entries[mask]])
+
+
+def _parse_number(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _clean(value):
+    if isinstance(value, str):
+        return value.strip() or None
+    return value
+
+
+def _contains(data: np.ndarray, needle: str) -> np.ndarray:
+    needle = needle.lower()
+    return np.fromiter((needle in (v or '').lower() for v in data), dtype=bool, count=len(data))
+
+
+def _build_column(raw: List, kind: Optional[str]):
+    numbers = [_parse_number(v) for v in raw]
+    if kind is None:
+        # infer: numeric if every present value parses, categorical if few distinct values
+        if all(n is not None or v is None for n, v in zip(numbers, raw)) and any(n is not None for n in numbers):
+            kind = 'number'
+        else:
+            distinct = len(set(raw))
+            fits = distinct <= MAX_CATEGORIES and distinct <= max(1, len(raw) * MAX_CATEGORY_RATIO)
+            kind = 'category' if fits else 'string'
+
+    if kind == 'number':
+        return np.array([np.nan if n is None else n for n in numbers], dtype=np.float64)
+    if kind == 'category':
+        return Categorical.encode(None if v is None else str(v) for v in raw)
+    return np.array([None if v is None else str(v) for v in raw], dtype=object)
+
+
+def normalize_record(row: Dict[str, str], product: str) -> Tuple[Dict, Dict[str, str]]:
+    """
+    Map one CSV row onto SCHEMA.
+
+    Returns (record, attributes): price and MOQ converted to canonical units,
+    and the product-specific columns that are not part of the schema.
+    """
+    record = {'product': product}
+    attributes = {}
+    for field, value in row.items():
+        value = _clean(value)
+        price, moq = PRICE_COLUMN.match(field), MOQ_COLUMN.match(field)
+        if price or moq:
+            source_unit = (price or moq).group(1).lower()
+            if source_unit not in UNITS:
+                raise ValueError(f"Unknown unit '{source_unit}' in column '{field}'")
+            unit, factor = UNITS[source_unit]
+            if record.get('unit') not in (None, unit):
+                raise ValueError(f"Column '{field}' mixes {unit} with {record['unit']} for {product}")
+            number = _parse_number(value)
+            if number is not None:
+                # a price per source unit becomes a price per canonical unit; quantities scale the other way
+                number = number / factor if price else number * factor
+            record['price' if price else 'moq'] = number
+            record['unit'] = unit
+        elif field in SCHEMA:
+            record[field] = value
+        elif value is not None:
+            attributes[field] = value
+    return record, attributes
+
+
+class Catalog:
+    """
+    Column-oriented, indexed supplier catalog.
+
+    Each CSV is parsed once. Numeric columns (price, MOQ, lead time,
+    rating, ...) become float64 NumPy arrays. Low-cardinality string
+    columns (country, certification, ...) become categorical codes. Any
+    other column stays a plain object array. Every categorical column gets
+    an inverted index and every numeric column a sorted index.
+
+    Filters use Django-style keywords and are ANDed together:
+
+        catalog.query(country="Egypt", certification="Organic", lead_time_days__lte=14)
+
+    The most selective indexed predicate yields the candidate rows. The
+    remaining predicates are then evaluated as vectorized masks over those
+    candidates only.
+    """
+
+    def __init__(
+        self,
+        columns: Dict[str, object],
+        name: Optional[str] = None,
+        attributes: Optional[AttributeTable] = None,
+        indexes: Optional[Dict[str, object]] = None
+    ):
+        """
+        Args:
+            columns: Column name -> np.ndarray (numeric or object), Categorical
+                or StringColumn
+            name: Optional catalog name (e.g. the product)
+            attributes: Optional sparse attribute table, filtered as attr__<key>
+            indexes: Prebuilt indexes (from a snapshot); built here if omitted
+        """
+        self.name = name
+        self.columns = columns
+        self.attributes = attributes
+        self.size = len(next(iter(columns.values()))) if columns else 0
+        if indexes is not None:
+            self.indexes = indexes
+            return
+        self.indexes: Dict[str, object] = {}
+        for column, values in columns.items():
+            if isinstance(values, Categorical):
+                self.indexes[column] = InvertedIndex(values)
+            elif values.dtype.kind == 'f':
+                self.indexes[column] = SortedIndex(values)
+
+    @classmethod
+    def from_records(
+        cls,
+        records: List[Dict],
+        name: Optional[str] = None,
+        schema: Optional[Dict[str, str]] = None,
+        attributes: Optional[AttributeTable] = None
+    ) -> 'Catalog':
+        """
+        Build a catalog from records.
+
+        Column kinds ('number', 'category' or 'string') come from `schema`;
+        columns it doesn't list are inferred from their values.
+        """
+        schema = schema or {}
+        fields = list(dict.fromkeys(list(schema) + [field for record in records for field in record]))
+        columns = {
+            field: _build_column([_clean(record.get(field)) for record in records], schema.get(field))
+            for field in fields
+        }
+        return cls(columns, name, attributes)
+
+    @classmethod
+    def from_csv(cls, path: str, name: Optional[str] = None) -> 'Catalog':
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            records = list(csv.DictReader(f))
+        if name is None:
+            name = os.path.splitext(os.path.basename(path))[0].removesuffix('_suppliers')
+        return cls.from_records(records, name)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def query(self, **filters) -> np.ndarray:
+        """
+        Return the ascending row ids matching every filter.
+
+        Keys are `column` (equality) or `column__op`, where op is one of eq,
+        ne, in, lt, lte, gt, gte, between (a (low, high) pair, inclusive) or
+        contains (case-insensitive substring). Sparse attributes are filtered
+        as `attr__<key>` or `attr__<key>__<op>` (eq, in or contains).
+        """
+        predicates = []
+        for key, value in filters.items():
+            column, _, op = key.partition('__')
+            if column == 'attr' and self.attributes is not None:
+                # attr__<key> or attr__<key>__<op>
+                attribute, _, op = op.partition('__')
+                column = f"attr__{attribute}"
+            elif column not in self.columns:
+                raise KeyError(f"Unknown column: {column}")
+            op = op or 'eq'
+            if op not in OPERATORS:
+                raise ValueError(f"Unknown operator '{op}' in filter '{key}'. Use one of {', '.join(OPERATORS)}")
+            predicates.append((column, op, value))
+
+        # start from the most selective index hit, then mask the candidates
+        indexed, remaining = [], []
+        for predicate in predicates:
+            rows = self._index_lookup(*predicate)
+            if rows is None:
+                remaining.append(predicate)
+            else:
+                indexed.append((len(rows), rows, predicate))
+        indexed.sort(key=lambda item: item[0])
+
+        candidates = indexed[0][1] if indexed else None
+        remaining += [predicate for _, _, predicate in indexed[1:]]
+        if candidates is None:
+            candidates = np.arange(self.size, dtype=np.int64)
+        for column, op, value in remaining:
+            if not len(candidates):
+                break
+            candidates = candidates[self._mask(column, op, value, candidates)]
+        return candidates
+
+    def rows(self, row_ids: Optional[np.ndarray] = None, columns: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Materialize rows as dicts (NaN and missing categories become None).
+
+        Sparse attributes are included under 'attributes' when the catalog has
+        them and `columns` is None or lists 'attributes'.
+        """
+        if row_ids is None:
+            row_ids = np.arange(self.size, dtype=np.int64)
+        with_attributes = self.attributes is not None and (columns is None or 'attributes' in columns)
+        names = [name for name in columns or self.columns if name != 'attributes']
+        decoded = {}
+        for name in names:
+            values = self.columns[name]
+            if isinstance(values, Categorical):
+                decoded[name] = values.decode(row_ids)
+            elif values.dtype.kind == 'f':
+                decoded[name] = [None if np.isnan(v) else (int(v) if v.is_integer() else float(v))
+                                 for v in values[row_ids]]
+            else:
+                decoded[name] = list(values[row_ids])
+        result = [{name: decoded[name][i] for name in names} for i in range(len(row_ids))]
+        if with_attributes:
+            for row, attributes in zip(result, self.attributes.for_rows(row_ids)):
+                row['attributes'] = attributes
+        return result
+
+    def select(self, columns: Optional[List[str]] = None, limit: Optional[int] = None, **filters) -> List[Dict]:
+        """Filter and return matching rows as dicts."""
+        row_ids = self.query(**filters)
+        if limit is not None:
+            row_ids = row_ids[:limit]
+        return self.rows(row_ids, columns)
+
+    def _index_lookup(self, column: str, op: str, value) -> Optional[np.ndarray]:
+        if column.startswith('attr__'):
+            return self.attributes.query(column[len('attr__'):], op, value)
+        index = self.indexes.get(column)
+        if isinstance(index, InvertedIndex):
+            values = self.columns[column]
+            if op == 'eq':
+                return index.lookup(values.code(value))
+            if op == 'in':
+                parts = [index.lookup(values.code(v)) for v in value]
+                return np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+        elif isinstance(index, SortedIndex):
+            if op == 'eq':
+                return index.range(value, value)
+            if op in ('lt', 'lte'):
+                return index.range(high=value, high_inclusive=op == 'lte')
+            if op in ('gt', 'gte'):
+                return index.range(low=value, low_inclusive=op == 'gte')
+            if op == 'between':
+                return index.range(value[0], value[1])
+        return None
+
+    def _mask(self, column: str, op: str, value, rows: np.ndarray) -> np.ndarray:
+        if column.startswith('attr__'):
+            return np.isin(rows, self._index_lookup(column, op, value))
+        values = self.columns[column]
+        if isinstance(values, Categorical):
+            codes = values.codes[rows]
+            if op == 'in':
+                return np.isin(codes, [values.code(v) for v in value])
+            if op in ('eq', 'ne'):
+                mask = codes == values.code(value)
+                return mask if op == 'eq' else ~mask
+            if op == 'contains':
+                matches = [i for i, category in enumerate(values.categories) if value.lower() in category.lower()]
+                return np.isin(codes, matches)
+            raise ValueError(f"Operator '{op}' is not supported on categorical column '{column}'")
+
+        data = values[rows]
+        if op == 'contains':
+            return _contains(data, value)
+        if op == 'eq':
+            return data == value
+        if op == 'ne':
+            return data != value
+        if op == 'in':
+            return np.isin(data, list(value))
+        if op == 'lt':
+            return data < value
+        if op == 'lte':
+            return data <= value
+        if op == 'gt':
+            return data > value
+        if op == 'gte':
+            return data >= value
+        return (data >= value[0]) & (data <= value[1])
+
+    def save_snapshot(self, path: str = DEFAULT_SNAPSHOT) -> None:
+        """
+        Write the catalog, its indexes and attributes to a binary snapshot.
+
+        Layout: magic, little-endian uint64 header length, JSON header, then
+        every array's raw bytes aligned to 64 bytes. The file is written
+        next to `path` and renamed into place, so processes that still map
+        the old snapshot keep a consistent view.
+        """
+        buffers = []
+        offset = 0
+
+        def ref(array: np.ndarray) -> Dict:
+            nonlocal offset
+            array = np.ascontiguousarray(array)
+            entry = {'offset': offset, 'nbytes': array.nbytes, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+            padding = -array.nbytes % SNAPSHOT_ALIGN
+            buffers.append(array.tobytes() + b'\0' * padding)
+            offset += array.nbytes + padding
+            return entry
+
+        def categorical(values: Categorical, index: InvertedIndex) -> Dict:
+            return {'codes': ref(values.codes), 'categories': values.categories,
+                    'index': {'rows': ref(index.rows), 'starts': ref(index.starts)}}
+
+        def strings(values) -> Dict:
+            packed = values if isinstance(values, StringColumn) else StringColumn.pack(values)
+            return {'offsets': ref(packed.offsets), 'data': ref(packed.data)}
+
+        columns = []
+        for name, values in self.columns.items():
+            index = self.indexes.get(name)
+            if isinstance(values, Categorical):
+                columns.append(dict(name=name, kind='category', **categorical(values, index)))
+            elif values.dtype.kind == 'f':
+                columns.append({'name': name, 'kind': 'number', 'data': ref(values),
+                                'index': {'rows': ref(index.rows), 'values': ref(index.values), 'valid': index.valid}})
+            else:
+                columns.append(dict(name=name, kind='string', **strings(values)))
+
+        attributes = None
+        if self.attributes is not None:
+            attributes = {'rows': ref(self.attributes.rows),
+                          'keys': categorical(self.attributes.keys, self.attributes.index),
+                          'values': strings(self.attributes.values)}
+
+        header = json.dumps({'name': self.name, 'size': self.size, 'columns': columns,
+                             'attributes': attributes}).encode('utf-8')
+        preamble = SNAPSHOT_MAGIC + len(header).to_bytes(8, 'little') + header
+        preamble += b'\0' * (-len(preamble) % SNAPSHOT_ALIGN)
+
+        tmp = f"{path}.tmp{os.getpid()}"
+        with open(tmp, 'wb') as f:
+            f.write(preamble)
+            for buffer in buffers:
+                f.write(buffer)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    @classmethod
+    def open_snapshot(cls, path: str = DEFAULT_SNAPSHOT) -> 'Catalog':
+        """
+        Memory-map a snapshot written by save_snapshot.
+
+        Nothing is parsed or copied beyond the JSON header. Every worker that
+        opens the same file shares its pages through the OS page cache.
+        """
+        with open(path, 'rb') as f:
+            if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                raise ValueError(f"{path} is not a supplier catalog snapshot")
+            length = int.from_bytes(f.read(8), 'little')
+            header = json.loads(f.read(length))
+        start = len(SNAPSHOT_MAGIC) + 8 + length
+        start += -start % SNAPSHOT_ALIGN
+        buffer = np.memmap(path, dtype=np.uint8, mode='r')
+
+        def array(entry: Dict) -> np.ndarray:
+            begin = start + entry['offset']
+            return buffer[begin:begin + entry['nbytes']].view(np.dtype(entry['dtype'])).reshape(entry['shape'])
+
+        def categorical(entry: Dict) -> Tuple[Categorical, InvertedIndex]:
+            index = InvertedIndex.from_arrays(array(entry['index']['rows']), array(entry['index']['starts']))
+            return Categorical(array(entry['codes']), entry['categories']), index
+
+        def strings(entry: Dict) -> StringColumn:
+            return StringColumn(array(entry['offsets']), array(entry['data']))
+
+        columns, indexes = {}, {}
+        for entry in header['columns']:
+            name = entry['name']
+            if entry['kind'] == 'category':
+                columns[name], indexes[name] = categorical(entry)
+            elif entry['kind'] == 'number':
+                columns[name] = array(entry['data'])
+                index = entry['index']
+                indexes[name] = SortedIndex.from_arrays(array(index['rows']), array(index['values']), index['valid'])
+            else:
+                columns[name] = strings(entry)
+
+        attributes = None
+        if header['attributes']:
+            keys, index = categorical(header['attributes']['keys'])
+            attributes = AttributeTable(array(header['attributes']['rows']), keys,
+                                        strings(header['attributes']['values']), index)
+        return cls(columns, header['name'], attributes, indexes)
+
+
+def ingest(directory: Optional[str] = None) -> Catalog:
+    """
+    Load every *_suppliers.csv in `directory` into one catalog with the unified schema.
+
+    The product comes from the file name (rice_suppliers.csv -> rice).
+    """
+    directory = directory or os.path.dirname(os.path.abspath(__file__))
+    records, attributes = [], []
+    for path in sorted(glob.glob(os.path.join(directory, '*_suppliers.csv'))):
+        product = os.path.basename(path).removesuffix('_suppliers.csv')
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                record, extra = normalize_record(row, product)
+                records.append(record)
+                attributes.append(extra)
+    return Catalog.from_records(records, 'suppliers', SCHEMA, AttributeTable.from_dicts(attributes))
+
+
+def load_catalog(path: str = DEFAULT_SNAPSHOT, directory: Optional[str] = None, rebuild: bool = False) -> Catalog:
+    """
+    Open the unified catalog snapshot, (re)building it first if it is
+    missing or older than any of the CSVs.
+    """
+    directory = directory or os.path.dirname(os.path.abspath(__file__))
+    sources = glob.glob(os.path.join(directory, '*_suppliers.csv'))
+    stale = not os.path.exists(path) or any(os.path.getmtime(src) > os.path.getmtime(path) for src in sources)
+    if rebuild or stale:
+        ingest(directory).save_snapshot(path)
+    return Catalog.open_snapshot(path)
+
+
+def load_catalogs(directory: Optional[str] = None) -> Dict[str, Catalog]:
+    """Load every *_suppliers.csv in `directory` (default: next to this module), keyed by product."""
+    directory = directory or os.path.dirname(os.path.abspath(__file__))
+    catalogs = {}
+    for path in sorted(glob.glob(os.path.join(directory, '*_suppliers.csv'))):
+        catalog = Catalog.from_csv(path)
+        catalogs[catalog.name] = catalog
+    return catalogs
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    target = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SNAPSHOT
+    start = time.perf_counter()
+    ingest().save_snapshot(target)
+    built = time.perf_counter() - start
+    start = time.perf_counter()
+    catalog = Catalog.open_snapshot(target)
+    opened = time.perf_counter() - start
+    print(f"{len(catalog)} suppliers -> {target} ({os.path.getsize(target)} bytes)")
+    print(f"built in {built * 1000:.1f}ms, opened in {opened * 1000:.2f}ms")
@@ -0,0 +1,234 @@
+import re
+import threading
+from typing import Dict, List, Optional, Union
+
+# Bedrock Claude models that accept cache_control checkpoints
+PROMPT_CACHING_MODELS = (
+    'claude-3-5-haiku',
+    'claude-3-7-sonnet',
+    'claude-sonnet-4',
+    'claude-opus-4',
+    'claude-haiku-4',
+)
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a procurement negotiation between a buyer "
+    "and a supplier. Merge the new turns into the existing summary. Keep every "
+    "number, commitment, open question and decision; drop greetings and filler. "
+    "Reply with the updated summary only."
+)
+
+# Facts worth pinning verbatim so they survive summarization
+FACT_PATTERNS = {
+    'price': re.compile(
+        r"\b(?:price|rate|cost|quote[d]?)\b[^.\n$€£]{0,40}?([$€£]\s?\d[\d,]*(?:\.\d+)?(?:\s*(?:/|per)\s*[a-z]+)?)",
+        re.IGNORECASE
+    ),
+    'moq': re.compile(
+        r"\b(?:MOQ|minimum order(?: quantity)?)\b[^\d\n]{0,20}(\d[\d,]*(?:\s*(?:units?|cases?|kg|lbs?|tons?|pallets?|pcs))?)",
+        re.IGNORECASE
+    ),
+    'lead_time': re.compile(
+        r"\blead[ -]?time\b[^\d\n]{0,20}(\d+(?:\s*-\s*\d+)?\s*(?:business\s+)?(?:days?|weeks?))",
+        re.IGNORECASE
+    ),
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+def supports_prompt_caching(model_id: str) -> bool:
+    """Whether Bedrock honours cache_control blocks for this model."""
+    return any(name in model_id for name in PROMPT_CACHING_MODELS)
+
+
+def extract_facts(text: str) -> Dict[str, str]:
+    """Pull price, MOQ and lead time mentions out of a message."""
+    facts = {}
+    for name, pattern in FACT_PATTERNS.items():
+        match = pattern.search(text)
+        if match:
+            facts[name] = match.group(1).strip()
+    return facts
+
+
+class ConversationMemory:
+    """
+    Token-budgeted conversation history for BedrockAgent.chat.
+
+    Recent turns are kept verbatim. Once the estimated prompt size goes over
+    `token_budget`, the oldest turns are folded into a rolling summary (one
+    summarization call per compaction, at temperature 0 so the agent's
+    ResponseCache can serve repeats) and dropped from the history. Key facts
+    such as the agreed price, MOQ and lead time are pinned, so they stay in the
+    prompt word for word however much gets summarized.
+
+    On models that support prompt caching, the system prompt and the summary
+    are sent as cache_control blocks. These change only on compaction, so most
+    turns only pay full price for the recent window.
+    """
+
+    def __init__(
+        self,
+        agent,
+        system_prompt: Optional[str] = None,
+        token_budget: int = 4000,
+        keep_recent: int = 6,
+        summary_max_tokens: int = 500,
+        prompt_caching: Optional[bool] = None,
+        auto_pin: bool = True
+    ):
+        """
+        Args:
+            agent: BedrockAgent used for chat and summarization
+            system_prompt: Stable system prompt for the conversation
+            token_budget: Target upper bound on estimated input tokens per turn
+            keep_recent: Messages kept verbatim before older ones are summarized
+            summary_max_tokens: Maximum length of the rolling summary
+            prompt_caching: Send cache_control blocks (defaults to whether the
+                agent's model supports them)
+            auto_pin: Pin price/MOQ/lead time mentions found in messages
+        """
+        self.agent = agent
+        self.system_prompt = system_prompt
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self.summary_max_tokens = summary_max_tokens
+        self.prompt_caching = (
+            supports_prompt_caching(agent.model_id) if prompt_caching is None else prompt_caching
+        )
+        self.auto_pin = auto_pin
+
+        self.messages: List[Dict[str, str]] = []
+        self.summary = ""
+        self.facts: Dict[str, str] = {}
+        self.summarized_messages = 0
+        self._manual_facts = set()
+        self._lock = threading.Lock()
+
+    def add(self, role: str, content: str) -> None:
+        """Append a turn to the history."""
+        with self._lock:
+            self.messages.append({"role": role, "content": content})
+            if self.auto_pin:
+                for name, value in extract_facts(content).items():
+                    if name not in self._manual_facts:
+                        self.facts[name] = value
+
+    def pin(self, name: str, value: str) -> None:
+        """Pin a fact explicitly; auto-pinning never overwrites it."""
+        with self._lock:
+            self.facts[name] = value
+            self._manual_facts.add(name)
+
+    def unpin(self, name: str) -> None:
+        with self._lock:
+            self.facts.pop(name, None)
+            self._manual_facts.discard(name)
+
+    def estimated_tokens(self) -> int:
+        """Estimated input tokens of the prompt that build() would produce."""
+        text = "\n".join(
+            [self.system_prompt or "", self.summary, self._facts_text()]
+            + [m["content"] for m in self.messages]
+        )
+        return estimate_tokens(text)
+
+    def build(self) -> tuple:
+        """
+        Compact the history if needed and return (system_prompt, messages) for chat().
+
+        The system prompt is a list of text blocks when prompt caching is on,
+        otherwise a plain string.
+        """
+        while self.estimated_tokens() > self.token_budget:
+            cut = self._cut_point()
+            if cut == 0:
+                break
+            self._fold(self.messages[:cut])
+            with self._lock:
+                del self.messages[:cut]
+                self.summarized_messages += cut
+
+        return self._system(), list(self.messages)
+
+    def chat(self, content: str, **kwargs) -> Dict:
+        """
+        Send a user turn with the compacted history and record the reply.
+
+        Args:
+            content: The user message
+            **kwargs: Passed to BedrockAgent.chat (max_tokens, temperature, ...)
+
+        Returns:
+            The chat result, plus a `memory` entry with the estimated prompt
+            size, messages kept verbatim and messages summarized so far
+        """
+        self.add("user", content)
+        try:
+            system_prompt, messages = self.build()
+            result = self.agent.chat(messages, system_prompt=system_prompt, **kwargs)
+        except Exception:
+            with self._lock:
+                self.messages.pop()
+            raise
+
+        self.add("assistant", result["response"])
+        result["memory"] = {
+            "estimated_tokens": self.estimated_tokens(),
+            "messages": len(self.messages),
+            "summarized_messages": self.summarized_messages,
+            "facts": dict(self.facts),
+        }
+        return result
+
+    def _cut_point(self) -> int:
+        # Claude requires the history to start with a user turn, so cut there;
+        # the latest user message is never folded away
+        start = max(len(self.messages) - self.keep_recent, 1)
+        for i in range(start, len(self.messages)):
+            if self.messages[i]["role"] == "user":
+                return i
+        return 0
+
+    def _fold(self, old: List[Dict[str, str]]) -> None:
+        turns = "\n".join(f"{m['role'].upper()}: {m['content']}" for m in old)
+        prompt = f"Existing summary:\n{self.summary or '(none)'}\n\nNew turns:\n{turns}"
+        result = self.agent.generate_response(
+            prompt,
+            system_prompt=SUMMARY_PROMPT,
+            max_tokens=self.summary_max_tokens,
+            temperature=0
+        )
+        self.summary = result["response"].strip()
+
+    def _facts_text(self) -> str:
+        if not self.facts:
+            return ""
+        lines = "\n".join(f"- {name.replace('_', ' ')}: {value}" for name, value in sorted(self.facts.items()))
+        return f"Pinned facts (authoritative):\n{lines}"
+
+    def _system(self) -> Optional[Union[str, List[Dict]]]:
+        parts = [
+            (self.system_prompt or "", True),
+            (f"Summary of the earlier conversation:\n{self.summary}" if self.summary else "", True),
+            # facts change turn to turn, so they go after the cached prefix
+            (self._facts_text(), False),
+        ]
+        parts = [(text, stable) for text, stable in parts if text]
+        if not parts:
+            return None
+
+        if not self.prompt_caching:
+            return "\n\n".join(text for text, _ in parts)
+
+        blocks = []
+        for text, stable in parts:
+            block = {"type": "text", "text": text}
+            if stable:
+                block["cache_control"] = {"type": "ephemeral"}
+            blocks.append(block)
+        return blocks
@@ -0,0 +1,137 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_WEIGHTS = {
+    'price': 0.4,
+    'lead_time': 0.25,
+    'rating': 0.2,
+    'moq': 0.15,
+}
+
+OFFER_COLUMNS = [
+    'product', 'supplier_id', 'company_name', 'country', 'city', 'price', 'moq', 'unit',
+    'lead_time_days', 'certification', 'rating', 'email', 'phone', 'website',
+]
+
+
+def _scaled(values: np.ndarray, higher_is_better: bool) -> np.ndarray:
+    # min-max scale to [0, 1] over the candidates; missing values score 0
+    present = ~np.isnan(values)
+    scores = np.zeros(len(values))
+    if not present.any():
+        return scores
+    low, high = values[present].min(), values[present].max()
+    if high == low:
+        scores[present] = 1.0
+        return scores
+    scaled = (values[present] - low) / (high - low)
+    scores[present] = scaled if higher_is_better else 1.0 - scaled
+    return scores
+
+
+def moq_fit(moq: np.ndarray, quantity: Optional[float]) -> np.ndarray:
+    """1 when the requested quantity meets the MOQ, else the share of the MOQ it covers."""
+    if not quantity:
+        return np.ones(len(moq))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fit = np.where(np.isnan(moq) | (moq <= quantity), 1.0, quantity / moq)
+    return fit
+
+
+def score_matrix(catalog, rows: np.ndarray, quantity: Optional[float]) -> Dict[str, np.ndarray]:
+    """Per-criterion scores in [0, 1] (higher is better) for the candidate rows."""
+    columns = catalog.columns
+    return {
+        'price': _scaled(np.asarray(columns['price'][rows], dtype=np.float64), higher_is_better=False),
+        'lead_time': _scaled(np.asarray(columns['lead_time_days'][rows], dtype=np.float64), higher_is_better=False),
+        'rating': _scaled(np.asarray(columns['rating'][rows], dtype=np.float64), higher_is_better=True),
+        'moq': moq_fit(np.asarray(columns['moq'][rows], dtype=np.float64), quantity),
+    }
+
+
+def pareto_front(matrix: np.ndarray) -> np.ndarray:
+    """
+    Indexes of the non-dominated rows of `matrix` (every column: higher is better).
+
+    Each pass keeps one front point and drops everything it dominates, so the
+    cost is O(n * front size) rather than O(n^2).
+    """
+    candidates = np.arange(len(matrix))
+    remaining = matrix
+    i = 0
+    while i < len(remaining):
+        point = remaining[i]
+        keep = np.any(remaining > point, axis=1) | np.all(remaining == point, axis=1)
+        candidates, remaining = candidates[keep], remaining[keep]
+        i = int(np.sum(keep[:i])) + 1
+    return candidates
+
+
+def rank_offers(
+    catalog,
+    quantity: Optional[float] = None,
+    weights: Optional[Dict[str, float]] = None,
+    k: int = 10,
+    pareto: bool = False,
+    feasible_only: bool = False,
+    **filters
+) -> Dict:
+    """
+    Rank catalog suppliers by a weighted score and return the top k.
+
+    Args:
+        catalog: A Catalog (see catalog.py) with the unified supplier schema
+        quantity: Requested quantity in the catalog's canonical unit, used
+            for MOQ feasibility and total cost
+        weights: Criterion weights (price, lead_time, rating, moq); missing
+            criteria fall back to DEFAULT_WEIGHTS, and weights are normalized
+        k: Number of offers to return
+        pareto: Only consider non-dominated offers (no other offer is at least
+            as good on every criterion and better on one)
+        feasible_only: Drop offers whose MOQ exceeds the quantity
+        **filters: Catalog.query filters, e.g. product='rice', country='Egypt'
+
+    Returns:
+        Dictionary containing:
+            - offers: Up to k supplier rows, best first, each with `score`,
+              per-criterion `scores` and `total_cost`
+            - candidates: Number of rows that matched the filters
+            - considered: Number of rows scored after feasibility/Pareto pruning
+    """
+    weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+    unknown = set(weights) - set(DEFAULT_WEIGHTS)
+    if unknown:
+        raise ValueError(f"Unknown ranking criteria: {', '.join(sorted(unknown))}")
+    total = sum(weights.values())
+    if total <= 0 or any(w < 0 for w in weights.values()):
+        raise ValueError("Ranking weights must be non-negative and not all zero")
+
+    rows = catalog.query(**filters)
+    candidates = len(rows)
+    if feasible_only and quantity:
+        moq = np.asarray(catalog.columns['moq'][rows], dtype=np.float64)
+        rows = rows[np.isnan(moq) | (moq <= quantity)]
+
+    scores = score_matrix(catalog, rows, quantity)
+    criteria = list(DEFAULT_WEIGHTS)
+    matrix = np.column_stack([scores[c] for c in criteria]) if len(rows) else np.empty((0, len(criteria)))
+    if pareto and len(rows):
+        front = pareto_front(matrix)
+        rows, matrix = rows[front], matrix[front]
+
+    combined = matrix @ np.array([weights[c] / total for c in criteria]) if len(rows) else np.empty(0)
+    if k < len(combined):
+        # partial selection of the k best, then order just those
+        top = np.argpartition(-combined, k - 1)[:k]
+    else:
+        top = np.arange(len(combined))
+    top = top[np.argsort(-combined[top], kind='stable')]
+
+    offers = catalog.rows(rows[top], [c for c in OFFER_COLUMNS if c in catalog.columns] + ['attributes'])
+    for offer, i in zip(offers, top):
+        offer['score'] = round(float(combined[i]), 4)
+        offer['scores'] = {c: round(float(matrix[i, n]), 4) for n, c in enumerate(criteria)}
+        if quantity and offer.get('price') is not None:
+            offer['total_cost'] = round(offer['price'] * max(quantity, offer.get('moq') or 0), 2)
+    return {'offers': offers, 'candidates': candidates, 'considered': len(rows)}
@@ -1,15 +1,343 @@
 import requests
 import json
 import os
+import copy
+import glob
+import gzip
+import time
+import sqlite3
+import threading
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import Dict, List, Optional
+from urllib.parse import urlsplit, urlunsplit
+from requests.adapters import HTTPAdapter
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 import csv
 
 
+SEARCH_CACHE_PATH = os.getenv('SERPER_CACHE_PATH', 'serper_cache.db')
+SEARCH_CACHE_TTL = float(os.getenv('SERPER_CACHE_TTL', str(7 * 24 * 3600)))
+
+# (cache path, warm dir) pairs already loaded in this process
+_warmed = set()
+_warmed_lock = threading.Lock()
+
+# Serper calls in flight, shared by every SerperSearchDataset in the process
+_inflight: Dict[Tuple[str, str, int], Future] = {}
+_inflight_lock = threading.Lock()
+
+
+class SearchCache:
+    """SQLite cache of Serper responses keyed by (q, num), with a TTL and an LRU size cap."""
+
+    def __init__(self, path: str = SEARCH_CACHE_PATH, ttl: float = SEARCH_CACHE_TTL,
+                 max_bytes: int = 64 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._db().executescript(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "q TEXT NOT NULL, num INTEGER NOT NULL, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL, PRIMARY KEY (q, num));"
+            "CREATE INDEX IF NOT EXISTS results_lru ON results (accessed_at);"
+        )
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    @staticmethod
+    def key(query: str, num: int) -> Tuple[str, int]:
+        return " ".join(query.split()).lower(), int(num)
+
+    def get(self, query: str, num: int) -> Optional[Dict]:
+        q, num = self.key(query, num)
+        now = time.time()
+        row = self._db().execute("SELECT value, created_at FROM results WHERE q = ? AND num = ?", (q, num)).fetchone()
+        if not row or now - row[1] > self.ttl:
+            return None
+        self._db().execute("UPDATE results SET accessed_at = ? WHERE q = ? AND num = ?", (now, q, num))
+        return json.loads(row[0])
+
+    def put(self, query: str, num: int, value: Dict, created_at: Optional[float] = None):
+        q, num = self.key(query, num)
+        now = time.time()
+        created_at = created_at or now
+        data = json.dumps(value, ensure_ascii=False)
+        # never let an older copy (e.g. a warm-up file) replace a fresher one
+        self._db().execute(
+            "INSERT INTO results (q, num, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (q, num) DO UPDATE SET value = excluded.value, size = excluded.size, "
+            "created_at = excluded.created_at, accessed_at = excluded.accessed_at "
+            "WHERE excluded.created_at > results.created_at",
+            (q, num, data, len(data), created_at, now))
+        with self._lock:
+            self._puts += 1
+            check = self._puts % 100 == 1
+        if check:
+            self.evict(now)
+
+    def evict(self, now: Optional[float] = None):
+        db = self._db()
+        db.execute("DELETE FROM results WHERE created_at < ?", ((now or time.time()) - self.ttl,))
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total > self.max_bytes:
+            excess = total - int(self.max_bytes * 0.9)
+            db.execute(
+                "DELETE FROM results WHERE rowid IN (SELECT rowid FROM (SELECT rowid, SUM(size) OVER "
+                "(ORDER BY accessed_at ROWS UNBOUNDED PRECEDING) - size AS before FROM results) WHERE before < ?)",
+                (excess,))
+
+    def warm(self, directory: str = "datasets") -> int:
+        # saved datasets carry the request in searchParameters; their age counts against the TTL
+        loaded = 0
+        for path in glob.glob(os.path.join(directory, "*.json")):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    results = json.load(f)
+            except (OSError, ValueError):
+                continue
+            params = results.get("searchParameters") if isinstance(results, dict) else None
+            if not params or not params.get("q"):
+                continue
+            created_at = os.path.getmtime(path)
+            if time.time() - created_at > self.ttl:
+                continue
+            self.put(params["q"], params.get("num", 10), results, created_at=created_at)
+            loaded += 1
+        return loaded
+
+    def warm_once(self, directory: str = "datasets") -> int:
+        # the helpers build a new SerperSearchDataset per call; only the first one pays the scan
+        key = (os.path.abspath(self.path), os.path.abspath(directory))
+        with _warmed_lock:
+            if key in _warmed:
+                return 0
+            _warmed.add(key)
+        return self.warm(directory)
+
+
+def _is_gzip(path: str) -> bool:
+    return path.endswith(".gz")
+
+
+class DatasetIndex:
+    """Byte offsets of every line of a plain JSONL dataset, kept in a `<path>.idx` sidecar (uint64 array)."""
+
+    def __init__(self, path: str):
+        if _is_gzip(path):
+            raise ValueError("random access needs an uncompressed .jsonl dataset")
+        self.path = path
+        self.idx_path = path + ".idx"
+        self.offsets = array('Q')
+        if os.path.exists(self.idx_path):
+            with open(self.idx_path, 'rb') as f:
+                self.offsets.frombytes(f.read())
+        self._catch_up()
+
+    def _catch_up(self):
+        # index whatever was appended since the sidecar was last written (or all of it if missing)
+        self.end = 0  # just past the last complete line
+        if not os.path.exists(self.path):
+            return
+        new = array('Q')
+        with open(self.path, 'rb') as f:
+            if self.offsets:
+                f.seek(self.offsets[-1])
+                f.readline()
+                self.end = f.tell()
+            for line in iter(f.readline, b""):
+                if not line.endswith(b"\n"):
+                    break
+                new.append(self.end)
+                self.end += len(line)
+        if new:
+            self.offsets.extend(new)
+            with open(self.idx_path, 'ab') as f:
+                f.write(new.tobytes())
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, i: int) -> Dict:
+        with open(self.path, 'rb') as f:
+            f.seek(self.offsets[i])
+            return json.loads(f.readline())
+
+    def read(self, start: int, stop: Optional[int] = None) -> Iterator[Dict]:
+        if start >= len(self.offsets):
+            return
+        stop = len(self.offsets) if stop is None else min(stop, len(self.offsets))
+        with open(self.path, 'rb') as f:
+            f.seek(self.offsets[start])
+            for _ in range(start, stop):
+                yield json.loads(f.readline())
+
+
+class DatasetWriter:
+    """Append-only JSONL writer (gzip if the path ends in .gz) that fsyncs in batches."""
+
+    def __init__(self, path: str, fsync_every: int = 100, fsync_interval: float = 1.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.index = None if _is_gzip(path) else DatasetIndex(path)
+        if self.index is not None and os.path.exists(path) and os.path.getsize(path) > self.index.end:
+            # drop a line torn by a crash so the next record doesn't get glued onto it
+            os.truncate(path, self.index.end)
+        self._raw = open(path, 'ab')
+        # each writer session adds a gzip member; readers see one continuous stream
+        self._file = gzip.GzipFile(fileobj=self._raw, mode='ab') if _is_gzip(path) else self._raw
+        self._idx = None if self.index is None else open(self.index.idx_path, 'ab')
+        self._pending = array('Q')
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def write(self, record: Dict):
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8')
+        with self._lock:
+            if self.index is not None:
+                self._pending.append(self._raw.tell())
+            self._file.write(line)
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every or time.monotonic() - self._synced_at >= self.fsync_interval:
+                self._sync()
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def _sync(self):
+        if self._file is not self._raw:
+            self._file.flush()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        if self._idx is not None and self._pending:
+            # the index only ever points at lines that are already durable
+            self._idx.write(self._pending.tobytes())
+            self._idx.flush()
+            self.index.offsets.extend(self._pending)
+            self._pending = array('Q')
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        with self._lock:
+            self._sync()
+            if self._file is not self._raw:
+                self._file.close()
+            self._raw.close()
+            if self._idx is not None:
+                self._idx.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_dataset(path: str) -> Iterator[Dict]:
+    # .json files from older versions yield their organic hits
+    if path.endswith(".json"):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        query = data.get("searchParameters", {}).get("q")
+        for item in data.get('organic', []):
+            yield dict(item, query=query)
+        return
+
+    opener = gzip.open if _is_gzip(path) else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.endswith("\n"):  # a torn final line from a crash is skipped
+                yield json.loads(line)
+
+
+def search_hits(query: str, results: Dict) -> Iterator[Dict]:
+    fetched_at = datetime.now().isoformat(timespec="seconds")
+    for item in results.get('organic', []):
+        yield dict(item, query=query, fetched_at=fetched_at)
+
+
+class RateLimiter:
+    """Token bucket: at most `rate` acquisitions per second, with bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = float(burst or max(1, int(rate)))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def expand_queries(products: List[str], regions: Optional[List[str]] = None,
+                   template: str = "{product} wholesale supplier {region}") -> List[str]:
+    if not regions:
+        return [" ".join(template.replace("{region}", "").format(product=p).split()) for p in products]
+    return [template.format(product=p, region=r) for p in products for r in regions]
+
+
+def _link_key(link: str) -> str:
+    parts = urlsplit(link.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower().removeprefix("www."),
+                       parts.path.rstrip("/"), parts.query, ""))
+
+
+_listeners: List[Callable[[str, Dict], None]] = []
+
+
+# fn(event, data): "request" per HTTP call (seconds, status, response_bytes),
+# "lookup" per search() (result: hit, miss or coalesced)
+def add_listener(fn: Callable[[str, Dict], None]):
+    _listeners.append(fn)
+
+
+def remove_listener(fn: Callable[[str, Dict], None]):
+    if fn in _listeners:
+        _listeners.remove(fn)
+
+
+def _emit(event: str, data: Dict):
+    for fn in list(_listeners):
+        try:
+            fn(event, data)
+        except Exception:
+            pass
+
+
 class SerperSearchDataset:
 
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, cache: bool = True,
+                 cache_path: str = SEARCH_CACHE_PATH, cache_ttl: float = SEARCH_CACHE_TTL,
+                 warm_dir: Optional[str] = "datasets", pool_size: int = 16, timeout: float = 30):
     
         self.api_key = api_key or os.getenv('SERPER_API_KEY', '7c970d954c5a222e268bba4add34b02c4a72bbbb')
         self.url = "https://google.serper.dev/search"
@@ -17,18 +345,127 @@ class SerperSearchDataset:
             'X-API-KEY': self.api_key,
             'Content-Type': 'application/json'
         }
+        self.timeout = timeout
+
+        # one keep-alive session so repeated searches reuse the TLS connection
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+        self.cache = SearchCache(cache_path, cache_ttl) if cache else None
+        if self.cache and warm_dir and os.path.isdir(warm_dir):
+            self.cache.warm_once(warm_dir)
+
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0}
+        self._lock = threading.Lock()
+    
+    def search(self, query: str, num_results: int = 10, refresh: bool = False) -> Dict:
     
-    def search(self, query: str, num_results: int = 10) -> Dict:
+        if self.cache and not refresh:
+            cached = self.cache.get(query, num_results)
+            if cached is not None:
+                with self._lock:
+                    self.stats["hits"] += 1
+                _emit("lookup", {"result": "hit"})
+                return cached
+
+        # concurrent identical queries share one HTTP call, even across instances
+        key = (self.api_key, *SearchCache.key(query, num_results))
+        with _inflight_lock:
+            future = _inflight.get(key)
+            leader = future is None
+            if leader:
+                future = _inflight[key] = Future()
+        with self._lock:
+            self.stats["misses" if leader else "coalesced"] += 1
+        _emit("lookup", {"result": "miss" if leader else "coalesced"})
+
+        if not leader:
+            return copy.deepcopy(future.result())
+
+        try:
+            results = self._fetch(query, num_results)
+            if self.cache:
+                self.cache.put(query, num_results, results)
+            future.set_result(results)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with _inflight_lock:
+                _inflight.pop(key, None)
+        return results
+
+    def _fetch(self, query: str, num_results: int) -> Dict:
     
         payload = json.dumps({
             "q": query,
             "num": num_results
         })
         
-        response = requests.request("POST", self.url, headers=self.headers, data=payload)
-        response.raise_for_status()
-        return response.json()
+        start = time.perf_counter()
+        event = {"status": None, "response_bytes": 0}
+        try:
+            response = self.session.post(self.url, data=payload, timeout=self.timeout)
+            event.update(status=str(response.status_code), response_bytes=len(response.content))
+            response.raise_for_status()
+            return response.json()
+        finally:
+            if _listeners:
+                _emit("request", dict(event, seconds=time.perf_counter() - start))
+    
+    def search_many(self, queries: List[str], num_results: int = 10, max_workers: int = 8,
+                    rate: float = 5.0, output_path: Optional[str] = None) -> Dict:
     
+        # each query's hits are appended to output_path (JSONL, .gz ok) as soon as it completes
+        limiter = RateLimiter(rate)
+        queries = list(dict.fromkeys(queries))
+        merged: Dict[str, Dict] = {}
+        failed = []
+        start = time.monotonic()
+
+        def run(query):
+            limiter.acquire()
+            return self.search(query, num_results)
+
+        out = DatasetWriter(output_path) if output_path else None
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                futures = {pool.submit(run, q): q for q in queries}
+                for future in as_completed(futures):
+                    query = futures[future]
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        failed.append({"query": query, "error": str(e)})
+                        continue
+                    if out:
+                        out.write_many(search_hits(query, results))
+                    for item in results.get('organic', []):
+                        link = item.get('link')
+                        if not link:
+                            continue
+                        entry = merged.get(_link_key(link))
+                        if entry is None:
+                            merged[_link_key(link)] = dict(item, queries=[query])
+                        else:
+                            entry["queries"].append(query)
+                            if item.get('position', 1e9) < entry.get('position', 1e9):
+                                entry["position"] = item['position']
+        finally:
+            if out:
+                out.close()
+
+        # links found by more queries first, then by best rank
+        results = sorted(merged.values(), key=lambda r: (-len(r["queries"]), r.get('position', 1e9)))
+        return {
+            "queries": len(queries),
+            "failed": failed,
+            "results": results,
+            "saved_to": output_path,
+            "elapsed": round(time.monotonic() - start, 3)
+        }
+
     def save_dataset(self, query: str, results: Dict, output_dir: str = "datasets", 
                      format: str = "json") -> str:
     
@@ -45,17 +482,28 @@ class SerperSearchDataset:
             with open(filepath, 'w', encoding='utf-8') as f:
                 json.dump(results, f, indent=2, ensure_ascii=False)
         
+        elif format.lower() in ("jsonl", "jsonl.gz"):
+            filepath = os.path.join(output_dir, f"{safe_query}.{format.lower()}")
+            
+            with DatasetWriter(filepath) as writer:
+                writer.write_many(search_hits(query, results))
+        
         elif format.lower() == "csv":
             filename = f"{safe_query}.csv"
             filepath = os.path.join(output_dir, filename)
 
+            rows = list(search_hits(query, results))
+            fieldnames = list(dict.fromkeys(k for row in rows for k in row))
             with open(filepath, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=results[0].keys())
+                writer = csv.DictWriter(f, fieldnames=fieldnames)
                 writer.writeheader()
-                writer.writerows(results)
+                for row in rows:
+                    # nested values such as sitelinks don't fit a cell as-is
+                    writer.writerow({k: json.dumps(v, ensure_ascii=False) if isinstance(v, (dict, list)) else v
+                                     for k, v in row.items()})
         
         else:
-            raise ValueError(f"Unsupported format: {format}. Use 'json' or 'csv'")
+            raise ValueError(f"Unsupported format: {format}. Use 'json', 'jsonl', 'jsonl.gz' or 'csv'")
         
         return filepath
     
@@ -74,9 +522,14 @@ class SerperSearchDataset:
             "saved_to": filepath
         }
     
-    def load_dataset(self, filepath: str) -> Dict:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
+    def load_dataset(self, filepath: str, stream: bool = False):
+        # stream=True returns a generator of hits instead of loading everything
+        if stream:
+            return iter_dataset(filepath)
+        if filepath.endswith(".json"):
+            with open(filepath, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return list(iter_dataset(filepath))
 
 
 def search_and_save(query: str, api_key: Optional[str] = None, 
@@ -87,12 +540,57 @@ def search_and_save(query: str, api_key: Optional[str] = None,
     return searcher.search_and_save(query, num_results, output_dir, format)
 
 
+def search_many(queries: List[str], api_key: Optional[str] = None, num_results: int = 10,
+                max_workers: int = 8, rate: float = 5.0, output_path: Optional[str] = None) -> Dict:
+
+    searcher = SerperSearchDataset(api_key=api_key)
+    return searcher.search_many(queries, num_results, max_workers, rate, output_path)
+
+
+def _main_many(argv: List[str]):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="search.py", description="Run many supplier searches concurrently")
+    parser.add_argument("--queries", nargs="+", default=[], help="explicit queries")
+    parser.add_argument("--products", nargs="+", default=[], help="products to expand against --regions")
+    parser.add_argument("--regions", nargs="+", default=[], help="countries/regions")
+    parser.add_argument("--template", default="{product} wholesale supplier {region}")
+    parser.add_argument("--num", type=int, default=10, help="results per query")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=5.0, help="requests per second")
+    parser.add_argument("--out", help="JSONL file the per-query results stream to")
+    parser.add_argument("--merged", help="JSON file for the merged, deduplicated results")
+    args = parser.parse_args(argv)
+
+    queries = args.queries + (expand_queries(args.products, args.regions, args.template) if args.products else [])
+    if not queries:
+        parser.error("give --queries and/or --products")
+
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    out = args.out or os.path.join("datasets", f"search_many_{stamp}.jsonl")
+    result = search_many(queries, num_results=args.num, max_workers=args.workers, rate=args.rate, output_path=out)
+
+    merged_path = args.merged or os.path.splitext(out)[0] + "_merged.json"
+    with open(merged_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+
+    print(f"{result['queries']} queries in {result['elapsed']}s, {len(result['failed'])} failed")
+    print(f"{len(result['results'])} unique links")
+    print(f"Per-query results: {out}")
+    print(f"Merged results: {merged_path}")
+
+
 if __name__ == "__main__":
     import sys
     
+    if len(sys.argv) > 1 and sys.argv[1].startswith("--"):
+        _main_many(sys.argv[1:])
+        sys.exit(0)
+    
     if len(sys.argv) < 2:
         print("Usage: python search.py 'your search query' [num_results] [format]")
         print("Example: python search.py 'list of rice suppliers' 10 json")
+        print("         python search.py --products rice tomato --regions India Vietnam --rate 5")
         sys.exit(1)
     
     query = sys.argv[1]
@@ -0,0 +1,151 @@
+import ssl, smtplib, threading, time
+from contextlib import contextmanager
+from metrics import MAIL_BYTES, phase
+
+
+class SMTPPoolTimeout(Exception):
+    pass
+
+
+class CountingSMTP(smtplib.SMTP):
+    # send_message() serializes once and hands the bytes to sendmail(), so this counts both paths
+    def sendmail(self, from_addr, to_addrs, msg, *args, **kw):
+        refused = super().sendmail(from_addr, to_addrs, msg, *args, **kw)
+        MAIL_BYTES.inc(len(msg), protocol="smtp", direction="out")
+        return refused
+
+
+class SMTPPool:
+    """Thread-safe pool of logged-in SMTP sessions.
+
+    Sessions are reused LIFO so the warmest connection goes out first. A session
+    idle for longer than `health_check_after` is probed with NOOP before being
+    handed out, and sessions idle past `idle_timeout` are closed.
+    """
+
+    def __init__(self, host, port, user=None, password=None, size=4, idle_timeout=60.0,
+                 health_check_after=10.0, timeout=30.0, acquire_timeout=30.0, starttls=True):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout
+        self.starttls = starttls
+        self._ctx = ssl.create_default_context()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._idle = []  # [(session, last_used)], most recently used last
+        self._in_use = 0
+
+    def _connect(self):
+        with phase("smtp", "connect"):
+            s = CountingSMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            s.ehlo()
+            if self.starttls:
+                with phase("smtp", "tls"):
+                    s.starttls(context=self._ctx)
+                    s.ehlo()
+            if self.user and self.password:
+                with phase("smtp", "auth"):
+                    s.login(self.user, self.password)
+        except Exception:
+            self._close(s)
+            raise
+        return s
+
+    @staticmethod
+    def _close(s):
+        try:
+            s.quit()
+        except (smtplib.SMTPException, OSError):
+            s.close()
+
+    @staticmethod
+    def _alive(s):
+        try:
+            return s.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _prune(self, now):
+        # caller holds self._lock
+        expired = [s for s, used in self._idle if now - used > self.idle_timeout]
+        self._idle = [(s, used) for s, used in self._idle if now - used <= self.idle_timeout]
+        return expired
+
+    def _checkout(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = self._prune(now)
+            s, used = self._idle.pop() if self._idle else (None, now)
+        for old in expired:
+            self._close(old)
+        if s is not None and now - used > self.health_check_after and not self._alive(s):
+            s.close()
+            s = None
+        return s or self._connect()
+
+    def _checkin(self, s):
+        now = time.monotonic()
+        with self._lock:
+            self._idle.append((s, now))
+            expired = self._prune(now)
+        for old in expired:
+            self._close(old)
+
+    @contextmanager
+    def connection(self):
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise SMTPPoolTimeout(f"no SMTP session available after {self.acquire_timeout}s")
+        with self._lock:
+            self._in_use += 1
+        s = None
+        try:
+            s = self._checkout()
+            yield s
+        except (smtplib.SMTPServerDisconnected, OSError):
+            # the session is unusable; drop it instead of returning it to the pool
+            if s is not None:
+                s.close()
+            s = None
+            raise
+        finally:
+            if s is not None:
+                self._checkin(s)
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    def _run(self, fn, retries):
+        # reconnect and retry if the server dropped a pooled session under us
+        for attempt in range(retries + 1):
+            try:
+                # connect/tls/auth are their own phases; "send" is just the transaction
+                with self.connection() as s, phase("smtp", "send"):
+                    return fn(s)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                if attempt == retries:
+                    raise
+
+    def send_message(self, msg, retries=1):
+        """Send `msg` on a pooled session."""
+        return self._run(lambda s: s.send_message(msg), retries)
+
+    def sendmail(self, from_addr, to_addrs, raw, retries=1):
+        """Send an already-serialized message on a pooled session."""
+        return self._run(lambda s: s.sendmail(from_addr, to_addrs, raw), retries)
+
+    def stats(self):
+        with self._lock:
+            return {"size": self.size, "in_use": self._in_use, "idle": len(self._idle)}
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for s, _ in idle:
+            self._close(s)
@@ -0,0 +1,105 @@
+import os
+import sys
+import json
+import subprocess
+import pytest
+from bench.fakes import FakeBedrockClient
+from search.agent import (AdaptiveLimiter, BedrockAgent, BedrockError, BedrockStream, ResponseCache, add_listener,
+                          remove_listener)
+
+
+def _chunk(payload):
+    return {"chunk": {"bytes": json.dumps(payload).encode()}}
+
+
+@pytest.fixture
+def requests_seen():
+    seen = []
+    listener = lambda event, data: seen.append(data) if event == "request" else None
+    add_listener(listener)
+    yield seen
+    remove_listener(listener)
+
+
+def test_stream_emits_its_request_when_done(requests_seen):
+    events = [_chunk({"type": "content_block_delta", "delta": {"text": "hi"}}),
+              _chunk({"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": 1}})]
+    stream = BedrockStream(events, "m", request={"model": "m", "request_bytes": 10, "response_bytes": 0})
+    assert list(stream) == ["hi"]
+    [request] = requests_seen
+    assert request["response_bytes"] == sum(len(e["chunk"]["bytes"]) for e in events)
+    assert "error" not in request and request["seconds"] >= 0
+
+
+def test_stream_emits_its_request_on_error(requests_seen):
+    events = [{"throttlingException": {"message": "slow down"}}]
+    stream = BedrockStream(events, "m", request={"model": "m", "request_bytes": 10, "response_bytes": 0})
+    with pytest.raises(BedrockError):
+        list(stream)
+    assert [r["error"] for r in requests_seen] == ["throttlingException"]
+
+
+def test_importing_the_agent_does_not_load_boto3():
+    out = subprocess.run([sys.executable, "-c", "import sys, search.agent; print('boto3' in sys.modules)"],
+                         capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.dirname(__file__)))
+    assert out.stdout.strip() == "False"
+
+
+def test_agents_share_one_client_per_region_and_credentials():
+    a = BedrockAgent(region_name="us-east-1", aws_access_key_id="k", aws_secret_access_key="s")
+    b = BedrockAgent(region_name="us-east-1", aws_access_key_id="k", aws_secret_access_key="s")
+    c = BedrockAgent(region_name="us-west-2", aws_access_key_id="k", aws_secret_access_key="s")
+    assert a.bedrock_runtime is b.bedrock_runtime
+    assert a.bedrock_runtime is not c.bedrock_runtime
+
+
+def test_cache_key_ignores_dict_order_but_not_whitespace():
+    a = ResponseCache.make_key("m", {"messages": [{"role": "user", "content": "hi"}], "temperature": 0})
+    b = ResponseCache.make_key("m", {"temperature": 0, "messages": [{"content": "hi", "role": "user"}]})
+    c = ResponseCache.make_key("m", {"temperature": 0, "messages": [{"content": "hi ", "role": "user"}]})
+    assert a == b != c
+    assert ResponseCache.make_key("other", {"temperature": 0}) != ResponseCache.make_key("m", {"temperature": 0})
+
+
+def test_deterministic_calls_are_served_from_the_cache(tmp_path):
+    client = FakeBedrockClient(latency=0, jitter=0)
+    agent = BedrockAgent(cache=ResponseCache(str(tmp_path / "r.db")))
+    agent.bedrock_runtime = client
+    first = agent.generate_response("quote?", temperature=0)
+    second = agent.generate_response("quote?", temperature=0)
+    agent.generate_response("quote?", temperature=0.7)
+    assert client.calls == 2
+    assert second["response"] == first["response"]
+    # the disk tier outlives the process-local memory tier
+    agent.cache = ResponseCache(str(tmp_path / "r.db"))
+    agent.generate_response("quote?", temperature=0)
+    assert client.calls == 2
+
+
+def test_limiter_halves_on_throttling_once_per_cooldown_and_creeps_back():
+    limiter = AdaptiveLimiter(8, cooldown=60.0)
+    for _ in range(2):
+        limiter.acquire()
+    limiter.release(throttled=True)
+    limiter.release(throttled=True)  # same window: not halved again
+    assert limiter.limit == 4
+    for _ in range(4):
+        limiter.acquire()
+        limiter.release()
+    assert 4 < limiter.limit < 6
+
+
+def test_generate_many_keeps_input_order_and_reports_failures():
+    class PickyClient(FakeBedrockClient):
+        def invoke_model(self, modelId, body, **kwargs):
+            if "bad" in body:
+                from botocore.exceptions import ClientError
+                raise ClientError({"Error": {"Code": "ValidationException", "Message": "no"}}, "InvokeModel")
+            return super().invoke_model(modelId, body, **kwargs)
+
+    agent = BedrockAgent()
+    agent.bedrock_runtime = PickyClient(latency=0.01, jitter=0)
+    out = agent.generate_many(["a", "bad", "c"], max_concurrency=2)
+    assert [("error" in r) for r in out["results"]] == [False, True, False]
+    assert out["results"][1]["code"] == "ValidationException"
+    assert out["stats"]["failed"] == 1
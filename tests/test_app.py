@@ -0,0 +1,94 @@
+import os
+import importlib
+import pytest
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp("app")
+    for name in ("MAIL_STORE_PATH", "OUTBOX_PATH", "DASHBOARD_PATH", "QUOTES_PATH"):
+        os.environ[name] = str(tmp / f"{name.lower()}.db")
+    os.environ["MAILBOXES_FILE"] = str(tmp / "mailboxes.json")
+    app = importlib.import_module("app")
+    return app.app.test_client()
+
+
+@pytest.mark.parametrize("body", ['[1]', '{"prompt": "hi", "max_tokens": "x"}',
+                                  '{"prompt": "hi", "temperature": null}', '{"messages": "hi"}'])
+def test_agent_stream_rejects_bad_input(client, body):
+    r = client.post("/agent/stream", data=body)
+    assert r.status_code == 400
+    assert "error" in r.get_json()
+
+
+def test_quotes_rejects_a_bad_limit(client):
+    r = client.get("/email/quotes?limit=abc")
+    assert r.status_code == 400
+
+
+@pytest.mark.parametrize("body", ['[1]', '{"filters": [1]}', '{"quantity": "x"}', '{"k": "x"}',
+                                  '{"weights": "x"}', '{"filters": {"nosuch": 1}}'])
+def test_rank_offers_rejects_bad_input(client, body):
+    r = client.post("/api/offers/rank", data=body)
+    assert r.status_code == 400
+    assert "error" in r.get_json()
+
+
+def test_rank_offers_accepts_a_plain_request(client):
+    r = client.post("/api/offers/rank", json={"k": 3, "pareto": True})
+    assert r.status_code == 200
+    assert len(r.get_json()["offers"]) <= 3
+
+
+@pytest.mark.parametrize("body", ['[1]', '{}', '{"recipients": "a@x"}', '{"recipients": [1]}',
+                                  '{"recipients": [{"name": "no address"}]}',
+                                  '{"recipients": [{"to": "a@x", "substitutions": [1]}]}',
+                                  '{"recipients": [{"to": "a@x"}], "subject": 5}'])
+def test_send_batch_rejects_bad_input(client, body):
+    r = client.post("/email/send/batch", data=body)
+    assert r.status_code == 400
+    assert "error" in r.get_json()
+
+
+def test_send_batch_reports_each_recipient(client):
+    # no SMTP server is configured here, so every send fails on its own
+    r = client.post("/email/send/batch", json={"subject": "RFQ for $product",
+                                               "recipients": [{"to": "a@x", "substitutions": {"product": "rice"}},
+                                                              {"to": "b@x", "thread_token": "t1"}]})
+    assert r.status_code == 200
+    body = r.get_json()
+    assert (body["sent"], body["failed"]) == (0, 2)
+    assert [res["subject"] for res in body["results"]] == ["RFQ for rice", "RFQ for $product [RFQ:t1]"]
+    assert all(res["status"] == "error" for res in body["results"])
+
+
+def _mail(uid):
+    return {"uid": str(uid), "message_id": f"<{uid}@sup.example>", "in_reply_to": None, "references": None,
+            "from": "s@sup.example", "subject": "Re: RFQ", "date": "Sat, 17 Oct 2026 09:00:00 +0000",
+            "snippet": "", "body": "", "seen": False}
+
+
+def test_dashboard_sends_only_what_changed_since_a_version(client):
+    version = client.get("/api/dashboard").get_json()["version"]
+    assert client.get(f"/api/dashboard?since={version}").status_code == 304
+    assert client.get("/api/dashboard", headers={"If-None-Match": f'"{version}"'}).status_code == 304
+    client.post("/api/inventory", json={"products": [{"id": "p1", "name": "Rice"}]})
+    delta = client.get(f"/api/dashboard?since={version}").get_json()
+    assert not delta["full"]
+    assert [p["id"] for p in delta["products"]] == ["p1"]
+
+
+def test_dashboard_starts_over_on_a_future_or_oversized_delta(client, monkeypatch):
+    app = importlib.import_module("app")
+    version = client.get("/api/dashboard").get_json()["version"]
+    assert client.get("/api/dashboard?since=999.0").get_json()["full"]
+    monkeypatch.setattr(app, "DASHBOARD_INBOX_LIMIT", 2)
+    store = app.mail_store
+    store._insert(store._db(), [_mail(uid) for uid in range(1, 4)])
+    # three new messages don't fit a two-message delta
+    r = client.get(f"/api/dashboard?since={version}").get_json()
+    assert r["full"] and len(r["inbox"]) == 2
+
+
+def test_dashboard_rejects_a_malformed_since(client):
+    assert client.get("/api/dashboard?since=abc").status_code == 400
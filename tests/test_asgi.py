@@ -0,0 +1,58 @@
+import os
+import sys
+import importlib
+import pytest
+from starlette.testclient import TestClient
+from bench.fakes import SMTPSink
+from aiomail import AsyncSMTPPool
+
+
+@pytest.fixture(scope="module")
+def asgi(tmp_path_factory):
+    if "app" not in sys.modules:  # test_app may have set up the stores already
+        tmp = tmp_path_factory.mktemp("asgi")
+        for name in ("MAIL_STORE_PATH", "OUTBOX_PATH", "DASHBOARD_PATH", "QUOTES_PATH"):
+            os.environ[name] = str(tmp / f"{name.lower()}.db")
+        os.environ["MAILBOXES_FILE"] = str(tmp / "mailboxes.json")
+    return importlib.import_module("asgi")
+
+
+@pytest.fixture
+def client(asgi):
+    # no `with`: the lifespan (mail sync, metrics flushing) stays off
+    return TestClient(asgi.app)
+
+
+@pytest.fixture
+def sink():
+    sink = SMTPSink()
+    sink.start()
+    yield sink
+    sink.shutdown()
+
+
+@pytest.mark.parametrize("body", ['[1]', 'nope', '{"recipients": []}', '{"recipients": [{"name": "x"}]}'])
+def test_batch_rejects_bad_input(client, body):
+    r = client.post("/email/send/batch", content=body)
+    assert r.status_code == 400
+    assert "error" in r.json()
+
+
+def test_batch_shares_pooled_sessions(client, asgi, sink, monkeypatch):
+    monkeypatch.setattr(asgi.wsgi, "EMAIL_USER", "buyer@store.example")
+    monkeypatch.setattr(asgi, "smtp_pool", AsyncSMTPPool(*sink.server_address, starttls=False, size=2))
+    r = client.post("/email/send/batch", json={
+        "subject": "RFQ for $product", "text": "hi",
+        "recipients": [{"to": f"s{n}@sup.example", "thread_token": f"t{n}", "substitutions": {"product": "rice"}}
+                       for n in range(5)]})
+    body = r.json()
+    assert body["sent"] == 5 and body["failed"] == 0
+    assert [x["subject"] for x in body["results"]] == [f"RFQ for rice [RFQ:t{n}]" for n in range(5)]
+    assert sink.connections <= 2
+
+
+def test_messages_maps_errors_to_status_codes(client):
+    assert client.get("/email/messages?store=nope").status_code == 404
+    assert client.get("/email/messages?limit=abc").status_code == 400
+    r = client.get("/email/messages?since_modseq=0")
+    assert r.status_code == 200 and "expunged" in r.json()
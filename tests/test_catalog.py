@@ -0,0 +1,72 @@
+import os
+import pytest
+from search.catalog import Catalog, ingest, load_catalog, normalize_record
+
+RECORDS = [
+    {"company_name": "Nile Grain", "country": "Egypt", "price": 0.9, "lead_time_days": 14, "certification": "Organic"},
+    {"company_name": "Delta Rice", "country": "Egypt", "price": 1.2, "lead_time_days": 30, "certification": None},
+    {"company_name": "Punjab Mills", "country": "India", "price": 0.7, "lead_time_days": 21, "certification": "Organic"},
+    {"company_name": "Mekong Foods", "country": "Vietnam", "price": None, "lead_time_days": 10, "certification": "GAP"},
+]
+SCHEMA = {"company_name": "string", "country": "category", "price": "number", "lead_time_days": "number",
+          "certification": "category"}
+
+
+@pytest.fixture
+def catalog():
+    return Catalog.from_records(RECORDS, "rice", SCHEMA)
+
+
+@pytest.mark.parametrize("filters, expected", [
+    ({"country": "Egypt"}, [0, 1]),
+    ({"country__in": ["India", "Vietnam"]}, [2, 3]),
+    ({"country__ne": "Egypt"}, [2, 3]),
+    ({"price__lte": 0.9}, [0, 2]),
+    ({"price__between": (0.8, 1.2)}, [0, 1]),
+    ({"lead_time_days__lt": 21, "certification": "Organic"}, [0]),
+    ({"company_name__contains": "RICE"}, [1]),
+    ({"country": "Peru"}, []),
+])
+def test_query(catalog, filters, expected):
+    assert catalog.query(**filters).tolist() == expected
+
+
+def test_rows_decode_missing_values(catalog):
+    [row] = catalog.select(["company_name", "price", "certification"], company_name__contains="mekong")
+    assert row == {"company_name": "Mekong Foods", "price": None, "certification": "GAP"}
+
+
+def test_bad_filters_are_rejected(catalog):
+    with pytest.raises(KeyError):
+        catalog.query(nosuch=1)
+    with pytest.raises(ValueError):
+        catalog.query(price__near=1)
+
+
+def test_normalize_record_converts_to_canonical_units():
+    record, attributes = normalize_record(
+        {"supplier_id": "X1", "price_usd_per_lb": "1.00", "min_order_lbs": "100", "grind": "fine"}, "coffee")
+    assert record["unit"] == "kg"
+    assert record["price"] == pytest.approx(1 / 0.45359237)
+    assert record["moq"] == pytest.approx(45.359237)
+    assert attributes == {"grind": "fine"}
+    with pytest.raises(ValueError):
+        normalize_record({"price_usd_per_kg": "1", "min_order_liters": "5"}, "mixed")
+
+
+def test_snapshot_answers_like_the_ingested_catalog(tmp_path):
+    built = ingest()
+    built.save_snapshot(str(tmp_path / "c.snap"))
+    opened = Catalog.open_snapshot(str(tmp_path / "c.snap"))
+    filters = [{"product": "yogurt", "price__lt": 4}, {"country__in": ["Egypt", "India"], "moq__gte": 500},
+               {"attr__tomato_variety": "Heirloom"}, {"company_name__contains": "farms"}]
+    for f in filters:
+        assert opened.select(**f) == built.select(**f)
+    assert set(opened.columns["unit"].categories) == {"kg", "l"}
+
+
+def test_load_catalog_builds_a_missing_snapshot(tmp_path):
+    path = str(tmp_path / "c.snap")
+    catalog = load_catalog(path)
+    assert os.path.exists(path)
+    assert len(catalog) == len(ingest())
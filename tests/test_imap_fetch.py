@@ -0,0 +1,43 @@
+import imaplib
+import random
+import pytest
+from bench.fakes import IMAPServer, Mailbox, supplier_reply
+from imap_fetch import compress_uids, fetch_full, fetch_summaries
+
+
+def test_compress_uids():
+    assert compress_uids([b"7", b"3", b"4", b"5", b"9", b"10"]) == b"3:5,7,9:10"
+    assert compress_uids([b"1"]) == b"1"
+
+
+@pytest.fixture
+def imap():
+    box = Mailbox()
+    rng = random.Random(0)
+    for i in range(4):
+        box.append(supplier_reply(f"t{i}", "rice", rng, attachment_bytes=64 * 1024 if i % 2 else 0))
+    server = IMAPServer(box).start()
+    M = imaplib.IMAP4(*server.server_address)
+    M.login("buyer", "x")
+    M.select("INBOX")
+    yield server, M
+    M.logout()
+    server.shutdown()
+
+
+def test_summaries_match_full_download(imap):
+    _, M = imap
+    uids = [b"3", b"1", b"4", b"2"]
+    summaries = fetch_summaries(M, uids)
+    full = fetch_full(M, uids)
+    assert [s["uid"] for s in summaries] == ["3", "1", "4", "2"]
+    for s, f in zip(summaries, full):
+        assert {k: s[k] for k in f} == f
+
+
+def test_summaries_skip_attachments_and_leave_mail_unread(imap):
+    server, M = imap
+    before = server.bytes_sent
+    fetch_summaries(M, [b"2"], snippet_bytes=256)
+    assert server.bytes_sent - before < 16 * 1024  # uid 2 carries a 64 KiB attachment
+    assert all("\\Seen" not in m["flags"] for m in server.box.msgs)
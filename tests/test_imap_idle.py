@@ -0,0 +1,75 @@
+import time
+import socket
+import imaplib
+import threading
+from imap_idle import EventBroker, IdleListener
+from mailboxes import HostLimiter
+
+
+class NoIdleIMAP:
+    capabilities = ("IMAP4REV1",)
+
+    def logout(self):
+        pass
+
+
+def test_idle_session_holds_a_host_slot():
+    limiter = HostLimiter(2)
+    seen = []
+
+    def connect():
+        seen.append(limiter.stats())
+        return NoIdleIMAP()
+
+    listener = IdleListener(connect, on_change=lambda: None, limiter=limiter, host="imap.example")
+    listener.start()
+    listener.join(5)
+    assert not listener.is_alive()
+    assert seen == [{"imap.example": 1}]
+    assert limiter.stats() == {"imap.example": 0}
+
+
+class ScriptedIMAP:
+    """Just enough of imaplib.IMAP4 for IdleListener._idle, over one end of a socketpair."""
+
+    abort = imaplib.IMAP4.abort
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.file = sock.makefile("rb")
+
+    def _new_tag(self):
+        return b"A1"
+
+    def send(self, data):
+        self.sock.sendall(data)
+
+    def readline(self):
+        return self.file.readline()
+
+
+def test_idle_sees_a_change_that_arrived_with_the_continuation():
+    client, server = socket.socketpair()
+    client.settimeout(5)
+    # both lines land in one read, so "* 5 EXISTS" sits in imaplib's buffer and never wakes select()
+    server.sendall(b"+ idling\r\n* 5 EXISTS\r\n")
+    listener = IdleListener(None, on_change=lambda: None, renew=3)
+    done = threading.Thread(target=lambda: (server.recv(64), server.sendall(b"A1 OK IDLE done\r\n")))
+    done.start()
+    start = time.monotonic()
+    assert listener._idle(ScriptedIMAP(client))
+    assert time.monotonic() - start < 1.0
+    done.join(5)
+    client.close()
+    server.close()
+
+
+def test_broker_drops_events_for_a_stalled_subscriber():
+    broker = EventBroker(maxsize=2)
+    slow, fast = broker.subscribe(), broker.subscribe()
+    for n in range(3):
+        broker.publish({"n": n})
+        fast.get_nowait()
+    assert [slow.get_nowait()["n"] for _ in range(slow.qsize())] == [0, 1]
+    broker.unsubscribe(slow)
+    assert len(broker) == 1
@@ -0,0 +1,115 @@
+import imaplib
+import sqlite3
+from email.message import EmailMessage
+import pytest
+from bench.fakes import IMAPServer, Mailbox
+from mail_store import MailStore, StaleCursor
+
+
+def _item(uid, subject, message_id, in_reply_to):
+    return {"uid": str(uid), "message_id": message_id, "in_reply_to": in_reply_to, "references": in_reply_to,
+            "from": "s@sup.example", "subject": subject, "date": f"Sat, 17 Oct 2026 0{uid}:00:00 +0000",
+            "snippet": "", "body": "", "seen": False}
+
+# uid 3 ties the tagged thread of uid 1 to the untagged one of uid 2, all in one batch
+BATCH = [_item(1, "Re: RFQ [RFQ:t]", "<a@x>", "<s1>"),
+         _item(2, "Re: RFQ", "<b@x>", "<s2>"),
+         _item(3, "Re: RFQ [RFQ:t]", "<c@x>", "<s2>")]
+
+
+def test_merge_inside_one_batch(tmp_path):
+    store = MailStore(str(tmp_path / "m.db"))
+    store._insert(store._db(), BATCH)
+    assert [m["uid"] for m in store.thread(token="t")["messages"]] == ["1", "2", "3"]
+    assert sorted(m["uid"] for m in store.query(thread_token="t")[0]) == ["1", "2", "3"]
+
+
+def test_backfill_merges_inside_one_pass(tmp_path):
+    path = str(tmp_path / "m.db")
+    store = MailStore(path)
+    store._insert(store._db(), BATCH)
+    db = sqlite3.connect(path)
+    with db:
+        db.execute("UPDATE messages SET thread_id = NULL")
+        db.execute("DELETE FROM thread_keys")
+    assert [m["uid"] for m in MailStore(path).thread(token="t")["messages"]] == ["1", "2", "3"]
+
+
+@pytest.fixture
+def imap():
+    box = Mailbox()
+    server = IMAPServer(box).start()
+    yield box, server.server_address
+    server.shutdown()
+
+
+def _connect(address):
+    def connect():
+        M = imaplib.IMAP4(*address)
+        M.login("buyer", "x")
+        return M
+    return connect
+
+
+def _append(box, n):
+    for i in range(n):
+        msg = EmailMessage()
+        msg["From"], msg["Subject"], msg["Message-ID"] = "s@sup.example", f"Re: RFQ {i}", f"<{box.uidnext}@sup>"
+        msg.set_content("hi")
+        box.append(msg.as_bytes())
+
+
+def test_cursor_pages_through_the_mailbox(tmp_path, imap):
+    box, address = imap
+    _append(box, 5)
+    store = MailStore(str(tmp_path / "m.db"), connect=_connect(address))
+    store.sync()
+    pages, cursor = [], None
+    while True:
+        items, cursor = store.query(limit=2, cursor=cursor)
+        pages.append([m["uid"] for m in items])
+        if not cursor:
+            break
+    assert pages == [["5", "4"], ["3", "2"], ["1"]]
+
+
+def test_cursor_goes_stale_when_uidvalidity_changes(tmp_path, imap):
+    box, address = imap
+    _append(box, 3)
+    store = MailStore(str(tmp_path / "m.db"), connect=_connect(address))
+    store.sync()
+    _, cursor = store.query(limit=1)
+    box.uidvalidity += 1
+    store.sync()
+    with pytest.raises(StaleCursor):
+        store.query(limit=1, cursor=cursor)
+
+
+def test_changes_since_returns_only_the_delta(tmp_path, imap):
+    box, address = imap
+    _append(box, 3)
+    store = MailStore(str(tmp_path / "m.db"), connect=_connect(address))
+    store.sync()
+    since = store.modseq()
+    assert store.changes(since)["messages"] == []
+
+    _append(box, 1)
+    with box.lock:
+        box.modseq += 1
+        box.by_uid[1]["flags"].add("\\Seen")
+        box.by_uid[1]["modseq"] = box.modseq
+    store.sync()
+    delta = store.changes(since)
+    assert sorted(m["uid"] for m in delta["messages"]) == ["1", "4"]
+    assert not delta["reset"] and delta["modseq"] > since
+
+
+def test_sync_fetches_only_new_mail(tmp_path, imap):
+    box, address = imap
+    _append(box, 3)
+    store = MailStore(str(tmp_path / "m.db"), connect=_connect(address))
+    assert [m["uid"] for m in store.sync()] == ["1", "2", "3"]
+    assert store.sync() == []
+    _append(box, 2)
+    assert [m["uid"] for m in store.sync()] == ["4", "5"]
+    assert [m["uid"] for m in store.query(limit=10)[0]] == ["5", "4", "3", "2", "1"]
@@ -0,0 +1,43 @@
+import time
+import threading
+from mailboxes import HostLimiter, SyncScheduler
+
+
+class FakeStore:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = 0
+        self.synced = threading.Event()
+
+    def sync(self):
+        self.calls += 1
+        self.synced.set()
+        if self.fail:
+            raise OSError("imap down")
+        return [{"uid": str(self.calls)}]
+
+
+def _run(stores, on_new=None):
+    sched = SyncScheduler(stores, {sid: "imap.example" for sid in stores}, HostLimiter(2), workers=2,
+                          interval=60.0, max_backoff=600.0, on_new=on_new)
+    sched.start()
+    for store in stores.values():
+        assert store.synced.wait(5)
+    time.sleep(0.1)  # let the worker finish its bookkeeping
+    return sched
+
+
+def test_failed_sync_backs_off():
+    sched = _run({"a": FakeStore(fail=True)})
+    assert sched._failures == {"a": 1}
+    assert sched._due["a"] - time.monotonic() > 60.0
+
+
+def test_failing_callback_does_not_back_off_the_store():
+    def on_new(sid, items):
+        raise RuntimeError("broker down")
+
+    sched = _run({"a": FakeStore()}, on_new=on_new)
+    assert sched._failures == {}
+    assert 0 < sched._due["a"] - time.monotonic() <= 60.0
+    assert sched.limiter.stats() == {"imap.example": 0}
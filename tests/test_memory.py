@@ -0,0 +1,43 @@
+from search.memory import ConversationMemory, extract_facts
+
+
+class FakeAgent:
+    model_id = "anthropic.claude-3-7-sonnet-20250219-v1:0"
+
+    def __init__(self):
+        self.summaries = 0
+
+    def generate_response(self, prompt, **kw):
+        self.summaries += 1
+        return {"response": f"summary {self.summaries}"}
+
+    def chat(self, messages, system_prompt=None, **kw):
+        return {"response": "ok " * 50}
+
+
+def test_extract_facts():
+    assert extract_facts("Our price is $18.10/case, MOQ 500 cases, lead time 3 weeks") == {
+        "price": "$18.10/case", "moq": "500 cases", "lead_time": "3 weeks"}
+
+
+def test_history_is_folded_to_stay_within_budget():
+    agent = FakeAgent()
+    memory = ConversationMemory(agent, system_prompt="You negotiate.", token_budget=300, keep_recent=2)
+    memory.chat("We can offer a price of $2.10/kg with MOQ 1000 kg. " + "details " * 40)
+    for _ in range(5):
+        memory.chat("Can you do better? " + "context " * 40)
+    assert agent.summaries > 0 and memory.summarized_messages > 0
+    assert memory.messages[0]["role"] == "user"
+    assert memory.facts["price"] == "$2.10/kg"
+    system, _ = memory.build()
+    # the stable prefix is cacheable; the pinned facts come after it
+    assert [b.get("cache_control") is not None for b in system] == [True, True, False]
+    assert "$2.10/kg" in system[-1]["text"]
+
+
+def test_manual_pins_win_over_auto_pins():
+    memory = ConversationMemory(FakeAgent(), prompt_caching=False)
+    memory.pin("price", "$1.95/kg")
+    memory.add("user", "The price is $2.40/kg")
+    assert memory.facts["price"] == "$1.95/kg"
+    assert isinstance(memory.build()[0], str)
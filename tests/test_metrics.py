@@ -0,0 +1,47 @@
+import pytest
+from metrics import Registry, phase, MAIL_ERRORS, MAIL_PHASE
+
+
+def _workers():
+    reg = Registry()
+    sent = reg.counter("sent_total", "sent", ("protocol",))
+    idle = reg.gauge("idle_sessions", "idle")
+    age = reg.gauge("sync_age_seconds", "age", aggregate="max")
+    latency = reg.histogram("latency_seconds", "latency", buckets=(0.1, 1.0))
+    return reg, sent, idle, age, latency
+
+
+def test_render_merged_adds_counters_and_follows_gauge_aggregate():
+    a, sent, idle, age, latency = _workers()
+    sent.inc(2, protocol="smtp")
+    idle.set(3)
+    age.set(10)
+    latency.observe(0.05)
+    first = a.snapshot()
+    sent.inc(protocol="smtp")
+    idle.set(1)
+    age.set(40)
+    latency.observe(0.5)
+    # a's registry now stands in for a second worker; merging is over plain snapshots
+    out = a.render_merged([first, a.snapshot()]).splitlines()
+    assert 'sent_total{protocol="smtp"} 5' in out
+    assert "idle_sessions 4" in out
+    assert "sync_age_seconds 40" in out
+    assert 'latency_seconds_bucket{le="0.1"} 2' in out
+    assert 'latency_seconds_bucket{le="1"} 3' in out
+    assert "latency_seconds_count 3" in out
+
+
+def test_labels_must_match_the_declared_names():
+    _, sent, *_ = _workers()
+    with pytest.raises(ValueError):
+        sent.inc(proto="smtp")
+
+
+def test_phase_counts_errors_and_still_times_them():
+    key = MAIL_PHASE._key({"protocol": "imap", "phase": "test"})
+    with pytest.raises(OSError):
+        with phase("imap", "test"):
+            raise OSError("reset")
+    assert MAIL_ERRORS._values[key] == 1
+    assert sum(MAIL_PHASE._values[key][0]) == 1
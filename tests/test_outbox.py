@@ -0,0 +1,69 @@
+import smtplib
+from email.message import EmailMessage
+from outbox import Outbox, OutboxSender
+
+
+def _message(message_id="<1@store>", to="s@sup.example"):
+    msg = EmailMessage()
+    msg["From"], msg["To"], msg["Subject"], msg["Message-ID"] = "buyer@store.example", to, "RFQ", message_id
+    msg.set_content("hi")
+    return msg
+
+
+class FakePool:
+    def __init__(self, error=None, refused=None):
+        self.error = error
+        self.refused = refused or {}
+        self.sent = []
+
+    def sendmail(self, sender, recipients, raw):
+        if self.error:
+            raise self.error
+        self.sent.append(recipients)
+        return self.refused
+
+
+def test_enqueue_dedupes_by_message_id(tmp_path):
+    outbox = Outbox(str(tmp_path / "o.db"))
+    job, created = outbox.enqueue(_message())
+    again, created_again = outbox.enqueue(_message())
+    assert created and not created_again
+    assert again["job_id"] == job["job_id"]
+    assert outbox.counts() == {"queued": 1}
+
+
+def test_expired_lease_is_claimed_again(tmp_path):
+    outbox = Outbox(str(tmp_path / "o.db"), lease=0.0)
+    job, _ = outbox.enqueue(_message())
+    assert [j[0] for j in outbox.claim(10)] == [job["job_id"]]
+    # the sender died mid-send; with the lease gone the job is due again
+    assert [j[0] for j in outbox.claim(10)] == [job["job_id"]]
+
+
+def test_live_lease_is_not_claimed_twice(tmp_path):
+    outbox = Outbox(str(tmp_path / "o.db"), lease=300.0)
+    outbox.enqueue(_message())
+    assert len(outbox.claim(10)) == 1
+    assert outbox.claim(10) == []
+
+
+def test_transient_error_retries_and_permanent_error_fails(tmp_path):
+    outbox = Outbox(str(tmp_path / "o.db"))
+    transient, _ = outbox.enqueue(_message("<1@store>"))
+    permanent, _ = outbox.enqueue(_message("<2@store>"))
+    jobs = {j[0]: j for j in outbox.claim(10)}
+    OutboxSender(outbox, FakePool(smtplib.SMTPServerDisconnected("gone")))._send(jobs[transient["job_id"]])
+    OutboxSender(outbox, FakePool(smtplib.SMTPResponseException(550, b"no")))._send(jobs[permanent["job_id"]])
+    assert outbox.get(transient["job_id"])["status"] == "queued"
+    assert outbox.get(transient["job_id"])["attempts"] == 1
+    assert outbox.get(permanent["job_id"])["status"] == "failed"
+
+
+def test_refused_recipients_are_kept_on_the_job(tmp_path):
+    outbox = Outbox(str(tmp_path / "o.db"))
+    job, _ = outbox.enqueue(_message(to="a@sup.example, b@sup.example"))
+    [claimed] = outbox.claim(10)
+    OutboxSender(outbox, FakePool(refused={"b@sup.example": (550, b"no such user")}))._send(claimed)
+    job = outbox.get(job["job_id"])
+    assert job["status"] == "partial"
+    assert job["refused"] == {"b@sup.example": [550, "no such user"]}
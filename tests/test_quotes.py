@@ -0,0 +1,30 @@
+import json
+from quotes import QuoteExtractor
+
+AMBIGUOUS = "We can do $10.50/case, or $12/case for smaller orders"
+
+
+class FakeAgent:
+    def __init__(self, items):
+        self.items = items
+
+    def generate_many(self, prompts, **kw):
+        return {"results": [{"response": json.dumps(self.items)}]}
+
+
+def _extract(tmp_path, items):
+    messages = [{"message_id": f"<{n}@sup>", "subject": "Re: RFQ", "body": AMBIGUOUS} for n in range(2)]
+    extractor = QuoteExtractor(str(tmp_path / "q.db"), agent_factory=lambda: FakeAgent(items))
+    return extractor.extract(messages)
+
+
+def test_llm_ids_map_to_their_own_message(tmp_path):
+    quotes = _extract(tmp_path, [{"id": "1", "price_per_unit": 12}, {"id": 0, "price_per_unit": 10.5}])
+    assert quotes["<0@sup>"]["price_per_unit"] == 10.5
+    assert quotes["<1@sup>"]["price_per_unit"] == 12
+
+
+def test_out_of_range_llm_ids_are_dropped(tmp_path):
+    quotes = _extract(tmp_path, [{"id": -1, "price_per_unit": 1}, {"id": 0.5, "price_per_unit": 2},
+                                 {"id": True, "price_per_unit": 3}, {"id": 2, "price_per_unit": 4}])
+    assert {q["source"] for q in quotes.values()} == {"unresolved"}
@@ -0,0 +1,111 @@
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from search.search import (DatasetIndex, DatasetWriter, SearchCache, SerperSearchDataset, expand_queries,
+                           iter_dataset)
+
+
+class SlowSearch(SerperSearchDataset):
+    calls = 0
+    release = threading.Event()
+
+    def _fetch(self, query, num_results):
+        SlowSearch.calls += 1
+        self.release.wait(5)
+        return {"organic": [{"title": query}]}
+
+
+def test_concurrent_searches_share_one_request_across_instances():
+    searchers = [SlowSearch(api_key="k", cache=False, warm_dir=None) for _ in range(4)]
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(s.search, "Olive Oil  ") for s in searchers]
+        threading.Timer(0.2, SlowSearch.release.set).start()
+        results = [f.result() for f in futures]
+    assert SlowSearch.calls == 1
+    assert results == [{"organic": [{"title": "Olive Oil  "}]}] * 4
+    assert sum(s.stats["coalesced"] for s in searchers) == 3
+
+
+def test_cache_serves_repeats_and_expires(tmp_path):
+    cache = SearchCache(str(tmp_path / "c.db"), ttl=60)
+    cache.put("Olive  Oil", 10, {"organic": [1]})
+    assert cache.get("olive oil", 10) == {"organic": [1]}
+    assert cache.get("olive oil", 20) is None
+    cache.put("old", 10, {"organic": []}, created_at=time.time() - 120)
+    assert cache.get("old", 10) is None
+
+
+def test_warming_loads_saved_datasets_once_and_keeps_fresher_entries(tmp_path):
+    datasets = tmp_path / "datasets"
+    datasets.mkdir()
+    (datasets / "rice.json").write_text(json.dumps({"searchParameters": {"q": "rice", "num": 10}, "organic": ["old"]}))
+    (datasets / "junk.json").write_text("not json")
+    cache = SearchCache(str(tmp_path / "c.db"))
+    cache.put("rice", 10, {"organic": ["fresh"]}, created_at=time.time() + 1)
+    assert cache.warm_once(str(datasets)) == 1
+    assert cache.warm_once(str(datasets)) == 0
+    assert cache.get("rice", 10) == {"organic": ["fresh"]}
+
+
+class CannedSearch(SerperSearchDataset):
+    RESULTS = {
+        "rice egypt": [{"link": "https://www.a.example/rice/", "position": 3},
+                       {"link": "https://b.example", "position": 1}],
+        "rice india": [{"link": "https://A.example/rice", "position": 1}],
+    }
+
+    def _fetch(self, query, num_results):
+        if query not in self.RESULTS:
+            raise RuntimeError("serper down")
+        return {"organic": self.RESULTS[query]}
+
+
+def test_search_many_merges_links_across_queries(tmp_path):
+    searcher = CannedSearch(api_key="k", cache=False, warm_dir=None)
+    out = searcher.search_many(["rice egypt", "rice india", "rice egypt", "rice peru"], rate=100,
+                               output_path=str(tmp_path / "hits.jsonl"))
+    assert out["queries"] == 3
+    assert out["failed"] == [{"query": "rice peru", "error": "serper down"}]
+    top = out["results"][0]
+    assert sorted(top["queries"]) == ["rice egypt", "rice india"] and top["position"] == 1
+    assert len(out["results"]) == 2
+    assert len(list(iter_dataset(out["saved_to"]))) == 3
+
+
+def test_expand_queries():
+    assert expand_queries(["rice"], ["Egypt", "India"]) == ["rice wholesale supplier Egypt",
+                                                            "rice wholesale supplier India"]
+    assert expand_queries(["rice"]) == ["rice wholesale supplier"]
+
+
+def test_dataset_index_reads_any_line_and_survives_reopening(tmp_path):
+    path = str(tmp_path / "d.jsonl")
+    with DatasetWriter(path) as out:
+        out.write_many({"n": n} for n in range(5))
+    with DatasetWriter(path) as out:
+        out.write({"n": 5})
+    index = DatasetIndex(path)
+    assert len(index) == 6
+    assert index[4] == {"n": 4}
+    assert [r["n"] for r in index.read(2, 4)] == [2, 3]
+
+
+def test_a_torn_last_line_is_skipped_then_truncated(tmp_path):
+    path = str(tmp_path / "d.jsonl")
+    with DatasetWriter(path) as out:
+        out.write({"n": 0})
+    with open(path, "ab") as f:
+        f.write(b'{"n": 1')  # the process died mid-write
+    assert [r["n"] for r in iter_dataset(path)] == [0]
+    with DatasetWriter(path) as out:
+        out.write({"n": 2})
+    assert [r["n"] for r in iter_dataset(path)] == [0, 2]
+
+
+def test_gzip_datasets_append_across_sessions(tmp_path):
+    path = str(tmp_path / "d.jsonl.gz")
+    for n in range(2):
+        with DatasetWriter(path) as out:
+            out.write({"n": n})
+    assert [r["n"] for r in iter_dataset(path)] == [0, 1]
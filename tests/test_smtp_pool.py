@@ -0,0 +1,63 @@
+import asyncio
+import socket
+from email.message import EmailMessage
+import pytest
+from bench.fakes import SMTPSink
+from metrics import MAIL_BYTES
+from smtp_pool import SMTPPool
+from aiomail import AsyncSMTPPool
+
+
+def _sent():
+    return MAIL_BYTES._values.get(MAIL_BYTES._key({"protocol": "smtp", "direction": "out"}), 0)
+
+
+@pytest.fixture(scope="module")
+def sink():
+    sink = SMTPSink()
+    sink.start()
+    yield sink
+    sink.shutdown()
+
+
+def _message():
+    msg = EmailMessage()
+    msg["From"], msg["To"], msg["Subject"] = "buyer@store.example", "s@sup.example", "RFQ"
+    msg.set_content("x" * 1000)
+    return msg
+
+
+def test_sessions_are_reused(sink):
+    pool = SMTPPool(*sink.server_address, starttls=False, size=2)
+    before = sink.connections
+    for _ in range(5):
+        pool.send_message(_message())
+    assert sink.connections - before == 1
+    assert pool.stats() == {"size": 2, "in_use": 0, "idle": 1}
+
+
+def test_a_dropped_session_is_replaced(sink):
+    pool = SMTPPool(*sink.server_address, starttls=False)
+    pool.send_message(_message())
+    [(s, _)] = pool._idle
+    s.sock.shutdown(socket.SHUT_RDWR)  # the connection died while the session sat idle
+    pool.send_message(_message())
+    assert pool.stats()["idle"] == 1 and pool._idle[0][0] is not s
+
+
+def test_send_message_counts_bytes(sink):
+    pool = SMTPPool(*sink.server_address, starttls=False)
+    before = _sent()
+    pool.send_message(_message())
+    pool.sendmail("buyer@store.example", ["s@sup.example"], b"Subject: RFQ\r\n\r\nhi\r\n")
+    assert _sent() - before > 1000 + 20
+
+
+def test_async_send_message_counts_bytes(sink):
+    async def send():
+        pool = AsyncSMTPPool(*sink.server_address, starttls=False)
+        await pool.send_message(_message())
+
+    before = _sent()
+    asyncio.run(send())
+    assert _sent() - before > 1000